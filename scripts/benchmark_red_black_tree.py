@@ -0,0 +1,154 @@
+'''
+Measure <insert>, <search> and <delete> of <<RedBlackTree>> with the step
+recorder closed and opened, e.g. to check that the plain methods pay nothing
+for the recording. The baseline is a tree checking <enable_step_recorder> on
+each step of the walks, like the methods before the traced ones were bound
+apart. Run it on the built package:
+
+    $ make build_source_codes
+    $ PYTHONPATH=build/sdist python scripts/benchmark_red_black_tree.py
+
+The best time of several rounds is printed for each operation, in seconds.
+'''
+from argparse import ArgumentParser
+from imgrass_horizon.lib.algorithms.red_black_tree import (
+    LEFT, RIGHT, Direction, RBNode, RBTreeException, RedBlackTree,
+    StatsRecorder
+)
+from random import Random
+from timeit import repeat
+from typing import Optional, Type
+
+
+class CheckingRedBlackTree(RedBlackTree):
+    '''
+    The walks of <insert> and <search> checking <enable_step_recorder> on each
+    step, the recorder is never opened here so the steps are not recorded.
+    '''
+
+    def _insert_below(self, new_node: RBNode, myself: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        multiset = self.multiset
+        unique = multiset or not self.allow_dup_keys
+        key = new_node.sort_key
+        while True:
+            if key <= myself.sort_key:
+
+                if unique and key == myself.sort_key:
+                    if not multiset:
+                        raise RBTreeException.insert_duplicated_key(
+                            new_node.key)
+                    self._add_count(myself, 1)
+                    return myself
+
+                if myself.left is nil:
+                    myself.left = new_node
+                    new_node.from_direction = LEFT
+                    break
+
+                if self.enable_step_recorder:
+                    self.step_recorder.search_node(myself.key, Direction.LEFT)
+
+                myself = myself.left
+
+            else:
+                if myself.right is nil:
+                    myself.right = new_node
+                    new_node.from_direction = RIGHT
+                    break
+
+                if self.enable_step_recorder:
+                    self.step_recorder.search_node(myself.key,
+                                                   Direction.RIGHT)
+
+                myself = myself.right
+
+        if self.enable_step_recorder:
+            self.step_recorder.search_node(
+                myself.key, Direction(new_node.from_direction), finished=True)
+
+        self._link_leaf(new_node, myself)
+        return new_node
+
+    def search(self, key) -> Optional[RBNode]:
+        if self.hash_index is not None or self.finger:
+            return super().search(key)
+
+        nil = self.ND_NULL
+        nd_current = self.ND_ROOT
+        while nd_current is not nil:
+            if key < nd_current.sort_key:
+                if self.enable_step_recorder:
+                    self.step_recorder.search_node(nd_current.key,
+                                                   Direction.LEFT)
+                nd_current = nd_current.left
+            elif key > nd_current.sort_key:
+                if self.enable_step_recorder:
+                    self.step_recorder.search_node(nd_current.key,
+                                                   Direction.RIGHT)
+                nd_current = nd_current.right
+            else:
+                if self.enable_step_recorder:
+                    self.step_recorder.match_node(nd_current.key)
+                return nd_current
+
+        if self.enable_step_recorder:
+            self.step_recorder.unmatch_node()
+        return None
+
+
+def benchmark(size: int, rounds: int, traced: bool,
+              tree_cls: Type[RedBlackTree]=RedBlackTree, **kwargs) -> dict:
+    keys = Random(0).sample(range(size * 5), size)
+
+    def _new_tree() -> RedBlackTree:
+        tree = tree_cls(step_recorder=StatsRecorder(), **kwargs)
+        if traced:
+            tree.open_step_recorder()
+        return tree
+
+    def _insert():
+        tree = _new_tree()
+        for key in keys:
+            tree.insert(key, None)
+        return tree
+
+    def _search():
+        for key in keys:
+            tree.search(key)
+
+    def _delete():
+        tree = trees.pop()
+        for key in keys:
+            tree.delete(key)
+
+    tree = _insert()
+    trees = [_insert() for _ in range(rounds)]
+    return {
+        'insert': min(repeat(_insert, number=1, repeat=rounds)),
+        'search': min(repeat(_search, number=1, repeat=rounds)),
+        'delete': min(repeat(_delete, number=1, repeat=rounds))
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--finger', action='store_true')
+    parser.add_argument('--hash-index', action='store_true')
+    args = parser.parse_args()
+
+    for name, tree_cls, traced in [
+            ('baseline', CheckingRedBlackTree, False),
+            ('recorder closed', RedBlackTree, False),
+            ('recorder opened', RedBlackTree, True)]:
+        results = benchmark(args.size, args.rounds, traced, tree_cls,
+                            finger=args.finger, hash_index=args.hash_index)
+        print('%-16s' % name,
+              '  '.join(f'{operation} {seconds:.3f}'
+                        for operation, seconds in results.items()))
+
+
+if __name__ == '__main__':
+    main()
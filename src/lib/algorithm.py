@@ -1,6 +1,6 @@
 from .exception import ExceptionBase, ExceptionInfo, register_exception
 from enum import Enum
-from typing import Optional, Type
+from typing import Dict, Optional, Type
 
 
 class FollowerSyntaxError(ExceptionBase):
@@ -31,9 +31,23 @@ class StepRecorderBase(object):
 
 
 class AlgorithmBase(object):
+    '''
+    Recording the steps slows down the hot loops of an algorithm, even if it
+    is only a check of whether the recorder is opened. So an algorithm could
+    provide a recording version of its methods and list them in
+    <TRACED_METHODS>, for example:
+
+        >>> TRACED_METHODS = {'search': '_search_traced'}
+
+    Opening the step recorder binds the recording versions to the instance,
+    and closing it removes them, then the plain versions defined by the class
+    are used again, which pay nothing for the step recorder.
+    '''
 
     step_recorder: Optional[StepRecorderBase] = None
-    enable_step_recorder: bool = False
+    TRACED_METHODS: Dict[str, str] = {}
+
+    _enable_step_recorder: bool = False
 
     def __init__(self, step_recorder=None):
         assert step_recorder is None \
@@ -42,6 +56,10 @@ class AlgorithmBase(object):
         if step_recorder:
             self.step_recorder = step_recorder
 
+    @property
+    def enable_step_recorder(self) -> bool:
+        return self._enable_step_recorder
+
     def open_step_recorder(self):
         if self.step_recorder is None:
             raise SyntaxError(
@@ -50,10 +68,15 @@ class AlgorithmBase(object):
                 'function can not be enabled for this algorithm class. Please '
                 'check whether the step recoreder is set when the class is '
                 'initialized.')
-        self.enable_step_recorder = True
+
+        for name, traced_name in self.TRACED_METHODS.items():
+            setattr(self, name, getattr(self, traced_name))
+        self._enable_step_recorder = True
 
     def close_step_recorder(self):
-        self.enable_step_recorder = False
+        for name in self.TRACED_METHODS:
+            self.__dict__.pop(name, None)
+        self._enable_step_recorder = False
 
 
 class FollowerEntrypoint(object):
@@ -0,0 +1,395 @@
+from ..algorithm import AlgorithmBase
+from .red_black_tree import BLACK, RED, RBTreeException
+from array import array
+from typing import Optional
+
+
+class ArrayRBNode(object):
+    '''
+    The view of one slot of <<ArrayRedBlackTree>>, it is returned by <insert>
+    and <search> so that the callers can read <key> and <value> as they do with
+    <<RBNode>>. A slot keeps its key until the key is deleted, even if other
+    keys are deleted meanwhile, so the view is valid until then. After that,
+    the slot is reused by the following insertions.
+    '''
+
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree: 'ArrayRedBlackTree', index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def key(self):
+        return self.tree._keys[self.index]
+
+    @property
+    def value(self):
+        return self.tree._values[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.tree._values[self.index] = value
+
+    @property
+    def color(self):
+        return self.tree._colors[self.index]
+
+
+class ArrayRedBlackTree(AlgorithmBase):
+    r'''
+    A red-black tree engine for numeric keys. It has the same <insert>,
+    <search> and <delete> methods as <<RedBlackTree>>, but instead of creating
+    one python object per node, the links, colors and keys of all the nodes are
+    stored in parallel typed arrays, and a node is just an index of them:
+
+        index      0     1     2     3     4
+                +-----+-----+-----+-----+-----+
+        keys    |  -  | 500 | 250 | 750 |  -  |
+                +-----+-----+-----+-----+-----+
+        lefts   |  0  |  2  |  0  |  0  |  0  |
+        rights  |  0  |  3  |  0  |  0  |  0  | <-- also links the free slots
+        parents |  0  |  0  |  1  |  1  |  0  |
+        colors  |  B  |  B  |  R  |  R  |  -  |
+                +-----+-----+-----+-----+-----+
+                  nil  root                free
+
+    The slot 0 is the null node. The slots of the deleted nodes are chained
+    into a free-list by <rights> and reused by the following insertions.
+
+    A node costs about 21 bytes (8 bytes key, 3 * 4 bytes links and 1 byte
+    color) plus 8 bytes for the reference of its value if <with_values> is
+    true, instead of more than one hundred bytes of an <<RBNode>> and its key
+    object.
+    '''
+
+    NIL = 0
+
+    def __init__(self, key_typecode: str='q', allow_dup_keys=True,
+                 with_values=True):
+        # The float32 typecode 'f' is refused, since the keys would be rounded
+        # when they are stored, and <search(0.1)> would miss the key 0.1.
+        assert key_typecode in ('b', 'B', 'h', 'H', 'i', 'I', 'l', 'L', 'q',
+                                'Q', 'd')
+        assert isinstance(allow_dup_keys, bool)
+        assert isinstance(with_values, bool)
+        super().__init__()
+
+        self.allow_dup_keys = allow_dup_keys
+        self.with_values = with_values
+
+        self._keys = array(key_typecode, [0])
+        self._lefts = array('I', [0])
+        self._rights = array('I', [0])
+        self._parents = array('I', [0])
+        self._colors = array('B', [BLACK])
+        self._values = [None] if with_values else None
+
+        self._root = self.NIL
+        self._free = self.NIL
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def _new_slot(self, key, value) -> int:
+        index = self._free
+        if index != self.NIL:
+            # Store the key first, a key out of the range of the typecode
+            # raises before the slot is taken off the free list
+            self._keys[index] = key
+            self._free = self._rights[index]
+            self._lefts[index] = self._rights[index] = self.NIL
+            self._colors[index] = RED
+            if self.with_values:
+                self._values[index] = value
+        else:
+            index = len(self._keys)
+            self._keys.append(key)
+            self._lefts.append(self.NIL)
+            self._rights.append(self.NIL)
+            self._parents.append(self.NIL)
+            self._colors.append(RED)
+            if self.with_values:
+                self._values.append(value)
+
+        return index
+
+    def _free_slot(self, index: int):
+        self._lefts[index] = self._parents[index] = self.NIL
+        self._rights[index] = self._free
+        if self.with_values:
+            self._values[index] = None
+        self._free = index
+
+    def _rotate_left(self, node: int):
+        lefts, rights, parents = self._lefts, self._rights, self._parents
+
+        pivot = rights[node]
+        parent = parents[node]
+
+        rights[node] = lefts[pivot]
+        if lefts[pivot] != self.NIL:
+            parents[lefts[pivot]] = node
+
+        parents[pivot] = parent
+        if parent == self.NIL:
+            self._root = pivot
+        elif lefts[parent] == node:
+            lefts[parent] = pivot
+        else:
+            rights[parent] = pivot
+
+        lefts[pivot] = node
+        parents[node] = pivot
+
+    def _rotate_right(self, node: int):
+        lefts, rights, parents = self._lefts, self._rights, self._parents
+
+        pivot = lefts[node]
+        parent = parents[node]
+
+        lefts[node] = rights[pivot]
+        if rights[pivot] != self.NIL:
+            parents[rights[pivot]] = node
+
+        parents[pivot] = parent
+        if parent == self.NIL:
+            self._root = pivot
+        elif lefts[parent] == node:
+            lefts[parent] = pivot
+        else:
+            rights[parent] = pivot
+
+        rights[pivot] = node
+        parents[node] = pivot
+
+    def insert(self, key, value=None) -> ArrayRBNode:
+        keys, lefts, rights = self._keys, self._lefts, self._rights
+        parents, colors = self._parents, self._colors
+        nil = self.NIL
+
+        # Find the insert point before allocating the slot, so that a
+        # duplicated key leaves no garbage behind.
+        parent = nil
+        myself = self._root
+        to_left = False
+        while myself != nil:
+            parent = myself
+            if key <= keys[myself]:
+                if not self.allow_dup_keys and key == keys[myself]:
+                    raise RBTreeException.insert_duplicated_key(key)
+                myself = lefts[myself]
+                to_left = True
+            else:
+                myself = rights[myself]
+                to_left = False
+
+        new_node = myself = self._new_slot(key, value)
+        parents[myself] = parent
+        self._length += 1
+
+        if parent == nil:
+            self._root = myself
+            colors[myself] = BLACK
+            return ArrayRBNode(self, myself)
+
+        if to_left:
+            lefts[parent] = myself
+        else:
+            rights[parent] = myself
+
+        # Fixup the structure of red-black tree, see <<RedBlackTree>> for the
+        # details of each case.
+        while True:
+            parent = parents[myself]
+            if colors[parent] == BLACK:
+                break
+
+            grandparent = parents[parent]
+            parent_at_left = lefts[grandparent] == parent
+            uncle = rights[grandparent] if parent_at_left \
+                else lefts[grandparent]
+
+            if colors[uncle] == BLACK:
+                if parent_at_left:
+                    if rights[parent] == myself:
+                        self._rotate_left(parent)
+                        parent = myself
+                    colors[parent] = BLACK
+                    colors[grandparent] = RED
+                    self._rotate_right(grandparent)
+                else:
+                    if lefts[parent] == myself:
+                        self._rotate_right(parent)
+                        parent = myself
+                    colors[parent] = BLACK
+                    colors[grandparent] = RED
+                    self._rotate_left(grandparent)
+                break
+
+            colors[parent] = colors[uncle] = BLACK
+            if grandparent == self._root:
+                break
+            colors[grandparent] = RED
+            myself = grandparent
+
+        return ArrayRBNode(self, new_node)
+
+    def _search_index(self, key) -> int:
+        keys, lefts, rights = self._keys, self._lefts, self._rights
+        nil = self.NIL
+
+        nd_current = self._root
+        while nd_current != nil:
+            nd_key = keys[nd_current]
+            if key < nd_key:
+                nd_current = lefts[nd_current]
+            elif key > nd_key:
+                nd_current = rights[nd_current]
+            else:
+                break
+
+        return nd_current
+
+    def search(self, key) -> Optional[ArrayRBNode]:
+        index = self._search_index(key)
+        if index == self.NIL:
+            return None
+        return ArrayRBNode(self, index)
+
+    def _replace_child(self, parent: int, at_left: bool, node: int):
+        if parent == self.NIL:
+            self._root = node
+        elif at_left:
+            self._lefts[parent] = node
+        else:
+            self._rights[parent] = node
+
+        if node != self.NIL:
+            self._parents[node] = parent
+
+    def delete(self, key) -> bool:
+        lefts, rights = self._lefts, self._rights
+        parents, colors = self._parents, self._colors
+        nil = self.NIL
+
+        nd_matched = self._search_index(key)
+        if nd_matched == nil:
+            return False
+
+        # ==> Find a replacement node
+        if lefts[nd_matched] != nil and rights[nd_matched] != nil:
+            myself = lefts[nd_matched]
+            while rights[myself] != nil:
+                myself = rights[myself]
+        else:
+            myself = nd_matched
+
+        # ==> Delete node, see <<RedBlackTree>> for the details of each case
+        child = lefts[myself] if lefts[myself] != nil else rights[myself]
+        parent = parents[myself]
+        at_left = parent != nil and lefts[parent] == myself
+        color = colors[myself]
+        self._replace_child(parent, at_left, child)
+
+        # Like <<RedBlackTree>>, splice the slot of the replacement into the
+        # place of the matched one instead of moving its key and value, so
+        # that the views of the other keys still point to their own slots.
+        if myself != nd_matched:
+            if parent == nd_matched:
+                parent = myself
+            lefts[myself] = lefts[nd_matched]
+            rights[myself] = rights[nd_matched]
+            colors[myself] = colors[nd_matched]
+            parents[rights[myself]] = myself
+            if lefts[myself] != nil:
+                parents[lefts[myself]] = myself
+            matched_parent = parents[nd_matched]
+            self._replace_child(
+                matched_parent,
+                matched_parent != nil and lefts[matched_parent] == nd_matched,
+                myself)
+
+        self._free_slot(nd_matched)
+        self._length -= 1
+
+        if color == RED:
+            return True
+
+        if colors[child] == RED:
+            colors[child] = BLACK
+            return True
+
+        while parent != nil:
+            if at_left:
+                sibling = rights[parent]
+                if colors[sibling] == RED:
+                    colors[sibling] = BLACK
+                    colors[parent] = RED
+                    self._rotate_left(parent)
+                    sibling = rights[parent]
+
+                nephew_left = lefts[sibling]
+                nephew_right = rights[sibling]
+                if colors[nephew_left] == colors[nephew_right] == BLACK:
+                    colors[sibling] = RED
+                    if colors[parent] == RED:
+                        colors[parent] = BLACK
+                        break
+
+                    grandparent = parents[parent]
+                    at_left = grandparent != nil and \
+                        lefts[grandparent] == parent
+                    parent = grandparent
+                    continue
+
+                if colors[nephew_right] == BLACK:
+                    colors[nephew_left] = BLACK
+                    colors[sibling] = RED
+                    self._rotate_right(sibling)
+                    nephew_right = sibling
+                    sibling = nephew_left
+
+                colors[sibling] = colors[parent]
+                colors[parent] = BLACK
+                colors[nephew_right] = BLACK
+                self._rotate_left(parent)
+
+            else:
+                sibling = lefts[parent]
+                if colors[sibling] == RED:
+                    colors[sibling] = BLACK
+                    colors[parent] = RED
+                    self._rotate_right(parent)
+                    sibling = lefts[parent]
+
+                nephew_left = lefts[sibling]
+                nephew_right = rights[sibling]
+                if colors[nephew_left] == colors[nephew_right] == BLACK:
+                    colors[sibling] = RED
+                    if colors[parent] == RED:
+                        colors[parent] = BLACK
+                        break
+
+                    grandparent = parents[parent]
+                    at_left = grandparent != nil and \
+                        lefts[grandparent] == parent
+                    parent = grandparent
+                    continue
+
+                if colors[nephew_left] == BLACK:
+                    colors[nephew_right] = BLACK
+                    colors[sibling] = RED
+                    self._rotate_left(sibling)
+                    nephew_left = sibling
+                    sibling = nephew_right
+
+                colors[sibling] = colors[parent]
+                colors[parent] = BLACK
+                colors[nephew_left] = BLACK
+                self._rotate_right(parent)
+
+            break
+
+        return True
@@ -0,0 +1,174 @@
+from .ordered_map import BinaryTreeMapBase, OrderedMapException
+from typing import List, Tuple
+
+
+LEFT = BinaryTreeMapBase.LEFT
+RIGHT = BinaryTreeMapBase.RIGHT
+
+
+class AVLNode(object):
+
+    __slots__ = ('key', 'value', 'left', 'right', 'height')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.left: 'AVLNode' = None
+        self.right: 'AVLNode' = None
+        self.height = 1
+
+    @classmethod
+    def null_node(cls):
+        '''
+        The null node of height 0, which is shared by all the trees and never
+        modified.
+        '''
+        nd_null = cls.__dict__.get('_ND_NULL')
+        if nd_null is None:
+            nd_null = cls(None, None)
+            nd_null.height = 0
+            setattr(cls, '_ND_NULL', nd_null)
+        return nd_null
+
+
+class AVLTree(BinaryTreeMapBase):
+    r'''
+    The heights of the two subtrees of any node differ by one at most, which
+    makes the tree lower than a red-black tree (1.44 log n against 2 log n in
+    the worst case), so the searches are a little cheaper while the
+    modifications need more rotations. It suits the read-heavy workloads.
+
+    The nodes have no parent link, a modification keeps the path from the
+    root in a list instead, and walks it back to update the heights and
+    rebalance:
+
+               |                                 |
+              [z] h+3                           [y] h+2
+             /   \                             /   \
+        h+2 [y]   d h        ==>         h+1 [x]   [z] h+1
+           /   \                            / \    / \
+      h+1 [x]   c h                        a   b  c   d
+         / \
+        a   b
+    '''
+
+    def __init__(self, allow_dup_keys=True):
+        assert isinstance(allow_dup_keys, bool)
+        super().__init__()
+
+        self.allow_dup_keys = allow_dup_keys
+        self.ND_ROOT = self.ND_NULL = AVLNode.null_node()
+        self.length = 0
+
+    def _rotate_left(self, node: AVLNode) -> AVLNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+
+        node.height = max(node.left.height, node.right.height) + 1
+        pivot.height = max(node.height, pivot.right.height) + 1
+        return pivot
+
+    def _rotate_right(self, node: AVLNode) -> AVLNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+
+        node.height = max(node.left.height, node.right.height) + 1
+        pivot.height = max(pivot.left.height, node.height) + 1
+        return pivot
+
+    def _balance(self, node: AVLNode) -> AVLNode:
+        # Return the root of the subtree after rebalancing
+        height_left = node.left.height
+        height_right = node.right.height
+
+        if height_left > height_right + 1:
+            left = node.left
+            if left.left.height < left.right.height:
+                node.left = self._rotate_left(left)
+            return self._rotate_right(node)
+
+        if height_right > height_left + 1:
+            right = node.right
+            if right.right.height < right.left.height:
+                node.right = self._rotate_right(right)
+            return self._rotate_left(node)
+
+        node.height = max(height_left, height_right) + 1
+        return node
+
+    def _rebalance(self, path: List[Tuple[AVLNode, int]]):
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth][0]
+            height = node.height
+            subtree = self._balance(node)
+            if subtree is not node:
+                self._link(path, depth, subtree)
+            # The ancestors are not affected if the height is not changed
+            if subtree.height == height:
+                break
+
+    def insert(self, key, value=None) -> AVLNode:
+        nil = self.ND_NULL
+        path = []
+        node = self.ND_ROOT
+        while node is not nil:
+            if key <= node.key:
+                if key == node.key and not self.allow_dup_keys:
+                    raise OrderedMapException.insert_duplicated_key(key)
+                path.append((node, LEFT))
+                node = node.left
+            else:
+                path.append((node, RIGHT))
+                node = node.right
+
+        new_node = AVLNode(key, value)
+        new_node.left = new_node.right = nil
+        self.length += 1
+
+        self._link(path, len(path), new_node)
+        self._rebalance(path)
+        return new_node
+
+    def delete(self, key) -> bool:
+        nil = self.ND_NULL
+        path = []
+        node = self.ND_ROOT
+        while True:
+            if node is nil:
+                return False
+
+            if key < node.key:
+                path.append((node, LEFT))
+                node = node.left
+            elif key > node.key:
+                path.append((node, RIGHT))
+                node = node.right
+            else:
+                break
+
+        if node.left is nil or node.right is nil:
+            self._link(path, len(path), node.left if node.left is not nil
+                       else node.right)
+        else:
+            # The predecessor takes the place of the deleted node, so that
+            # the nodes held by the callers keep their keys.
+            depth = len(path)
+            path.append((node, LEFT))
+            predecessor = node.left
+            while predecessor.right is not nil:
+                path.append((predecessor, RIGHT))
+                predecessor = predecessor.right
+
+            self._link(path, len(path), predecessor.left)
+            predecessor.left = node.left
+            predecessor.right = node.right
+            predecessor.height = node.height
+            path[depth] = (predecessor, LEFT)
+            self._link(path, depth, predecessor)
+
+        node.left = node.right = nil
+        self.length -= 1
+        self._rebalance(path)
+        return True
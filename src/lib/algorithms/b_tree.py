@@ -0,0 +1,274 @@
+from .ordered_map import OrderedMapBase, OrderedMapException
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+
+class BTreeEntry(object):
+
+    __slots__ = ('key', 'value')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+
+class BTreeNode(object):
+
+    __slots__ = ('keys', 'entries', 'children')
+
+    def __init__(self):
+        # <keys> is the same as the keys of <entries>, it is kept for bisect
+        self.keys: list = []
+        self.entries: List[BTreeEntry] = []
+        # A leaf has no child, an internal node has len(keys) + 1 children
+        self.children: List['BTreeNode'] = []
+
+
+class BTree(OrderedMapBase):
+    r'''
+    Each node holds between t - 1 and 2t - 1 sorted entries (except the root),
+    where t is <min_degree>, and an internal node has one more children than
+    its entries. All the leaves are on the same level:
+
+                            [  20  |  40  ]
+                           /       |       \
+            [ 5 | 10 | 15 ]  [ 25 | 30 ]  [ 45 | 50 | 55 ]
+
+    The tree is as low as log_t(n), and a node is searched by bisect on a
+    plain list, so it takes fewer steps of the interpreter than the binary
+    trees and the entries of a node are close to each other in memory. It
+    suits the read-heavy workloads and the large range scans.
+
+    A full node is split on the way down when a key is inserted, so the
+    insertion never goes back up. A deletion takes the predecessor from a
+    leaf if the key is in an internal node, then fixes the nodes with too few
+    entries on the way back up by borrowing from or merging with a sibling.
+    '''
+
+    def __init__(self, allow_dup_keys=True, min_degree: int=16):
+        assert isinstance(allow_dup_keys, bool)
+        assert min_degree >= 2
+        super().__init__()
+
+        self.allow_dup_keys = allow_dup_keys
+        self.min_degree = min_degree
+        self.ND_ROOT = BTreeNode()
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _split_child(self, parent: BTreeNode, index: int):
+        t = self.min_degree
+        child = parent.children[index]
+        sibling = BTreeNode()
+        sibling.keys = child.keys[t:]
+        sibling.entries = child.entries[t:]
+        if child.children:
+            sibling.children = child.children[t:]
+            del child.children[t:]
+
+        parent.keys.insert(index, child.keys[t - 1])
+        parent.entries.insert(index, child.entries[t - 1])
+        parent.children.insert(index + 1, sibling)
+        del child.keys[t - 1:]
+        del child.entries[t - 1:]
+
+    def insert(self, key, value=None) -> BTreeEntry:
+        full = 2 * self.min_degree - 1
+        allow_dup_keys = self.allow_dup_keys
+
+        node = self.ND_ROOT
+        if len(node.keys) == full:
+            root = BTreeNode()
+            root.children.append(node)
+            self._split_child(root, 0)
+            self.ND_ROOT = node = root
+
+        while True:
+            keys = node.keys
+            index = bisect_right(keys, key)
+            if not allow_dup_keys and index > 0 and keys[index - 1] == key:
+                raise OrderedMapException.insert_duplicated_key(key)
+            if not node.children:
+                break
+
+            if len(node.children[index].keys) == full:
+                self._split_child(node, index)
+                if not keys[index] > key:
+                    if not allow_dup_keys and keys[index] == key:
+                        raise OrderedMapException.insert_duplicated_key(key)
+                    index += 1
+            node = node.children[index]
+
+        entry = BTreeEntry(key, value)
+        node.keys.insert(index, key)
+        node.entries.insert(index, entry)
+        self.length += 1
+        return entry
+
+    def search(self, key) -> Optional[BTreeEntry]:
+        node = self.ND_ROOT
+        while True:
+            keys = node.keys
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                return node.entries[index]
+            if not node.children:
+                return None
+            node = node.children[index]
+
+    def delete(self, key) -> bool:
+        path: List[Tuple[BTreeNode, int]] = []
+        node = self.ND_ROOT
+        while True:
+            keys = node.keys
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                break
+            if not node.children:
+                return False
+            path.append((node, index))
+            node = node.children[index]
+
+        if node.children:
+            # Replace it with the predecessor, which is the last entry of the
+            # rightmost leaf of the left subtree.
+            path.append((node, index))
+            leaf = node.children[index]
+            while leaf.children:
+                path.append((leaf, len(leaf.children) - 1))
+                leaf = leaf.children[-1]
+            node.keys[index] = leaf.keys.pop()
+            node.entries[index] = leaf.entries.pop()
+            node = leaf
+        else:
+            del node.keys[index]
+            del node.entries[index]
+
+        self.length -= 1
+        self._fix_underflow(node, path)
+        return True
+
+    def _fix_underflow(self, node: BTreeNode,
+                       path: List[Tuple[BTreeNode, int]]):
+        t = self.min_degree
+        while path and len(node.keys) < t - 1:
+            parent, index = path.pop()
+            siblings = parent.children
+
+            if index > 0 and len(siblings[index - 1].keys) >= t:
+                # Rotate the last entry of the left sibling through parent
+                left = siblings[index - 1]
+                node.keys.insert(0, parent.keys[index - 1])
+                node.entries.insert(0, parent.entries[index - 1])
+                parent.keys[index - 1] = left.keys.pop()
+                parent.entries[index - 1] = left.entries.pop()
+                if left.children:
+                    node.children.insert(0, left.children.pop())
+                break
+
+            if index < len(siblings) - 1 and \
+                    len(siblings[index + 1].keys) >= t:
+                # Rotate the first entry of the right sibling through parent
+                right = siblings[index + 1]
+                node.keys.append(parent.keys[index])
+                node.entries.append(parent.entries[index])
+                parent.keys[index] = right.keys.pop(0)
+                parent.entries[index] = right.entries.pop(0)
+                if right.children:
+                    node.children.append(right.children.pop(0))
+                break
+
+            # Both siblings have t - 1 entries, merge with one of them and the
+            # separator in parent, then parent may be too small.
+            if index > 0:
+                index -= 1
+            left = siblings[index]
+            right = siblings.pop(index + 1)
+            left.keys.append(parent.keys.pop(index))
+            left.entries.append(parent.entries.pop(index))
+            left.keys.extend(right.keys)
+            left.entries.extend(right.entries)
+            left.children.extend(right.children)
+            node = parent
+
+        root = self.ND_ROOT
+        if not root.keys and root.children:
+            self.ND_ROOT = root.children[0]
+
+    def min(self) -> Optional[BTreeEntry]:
+        node = self.ND_ROOT
+        while node.children:
+            node = node.children[0]
+        return node.entries[0] if node.entries else None
+
+    def max(self) -> Optional[BTreeEntry]:
+        node = self.ND_ROOT
+        while node.children:
+            node = node.children[-1]
+        return node.entries[-1] if node.entries else None
+
+    def range(self, lo=None, hi=None,
+              reverse=False) -> Iterator[BTreeEntry]:
+        # The stack holds [node, index] of the nodes on the way down, where
+        # <index> is the next entry of the node to yield.
+        stack = []
+        node = self.ND_ROOT
+        if not reverse:
+            while True:
+                index = 0 if lo is None else bisect_left(node.keys, lo)
+                stack.append([node, index])
+                if not node.children:
+                    break
+                node = node.children[index]
+
+            while stack:
+                frame = stack[-1]
+                node, index = frame
+                if index == len(node.keys):
+                    stack.pop()
+                    continue
+
+                entry = node.entries[index]
+                if hi is not None and not entry.key < hi:
+                    return
+                yield entry
+
+                frame[1] = index + 1
+                if node.children:
+                    node = node.children[index + 1]
+                    stack.append([node, 0])
+                    while node.children:
+                        node = node.children[0]
+                        stack.append([node, 0])
+
+        else:
+            # <index> is one past the next entry to yield in reverse order
+            while True:
+                index = len(node.keys) if hi is None else \
+                    bisect_left(node.keys, hi)
+                stack.append([node, index])
+                if not node.children:
+                    break
+                node = node.children[index]
+
+            while stack:
+                frame = stack[-1]
+                node, index = frame
+                if index == 0:
+                    stack.pop()
+                    continue
+
+                entry = node.entries[index - 1]
+                if lo is not None and entry.key < lo:
+                    return
+                yield entry
+
+                frame[1] = index - 1
+                if node.children:
+                    node = node.children[index - 1]
+                    stack.append([node, len(node.keys)])
+                    while node.children:
+                        node = node.children[-1]
+                        stack.append([node, len(node.keys)])
@@ -0,0 +1,480 @@
+from ..exception import ExceptionInfo, register_exception
+from .ordered_map import OrderedMapBase, OrderedMapException
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from mmap import mmap
+from os import path as os_path
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from struct import Struct
+from typing import Iterator, List, Optional, Tuple
+
+
+class DiskBPlusTreeException(OrderedMapException):
+
+    @register_exception
+    def insert_duplicated_key(info: ExceptionInfo, dup_key):
+        info.tell_me('This B+tree do not allow duplicated key '
+                     f'{dup_key} to be inserted.')
+        info.dup_key = dup_key
+
+    @register_exception
+    def bad_file(info: ExceptionInfo, path):
+        info.tell_me(f'The file {path} is not a B+tree file.')
+        info.path = path
+
+    @register_exception
+    def entry_too_large(info: ExceptionInfo, key, size, limit):
+        info.tell_me(f'The entry of key {key} takes {size} bytes, which '
+                     f'exceeds the limit {limit} of the page size, please use '
+                     'larger pages.')
+        info.key = key
+        info.size = size
+
+
+# The page 0 is the header of the file:
+#   magic, page size, root page, page count, head of free pages, length,
+#   allow_dup_keys
+HEADER = Struct('<8sIQQQQ?')
+MAGIC = b'IHBPTREE'
+
+# The other pages start with the kind and the length of the payload, which is
+# the pickled (keys, items) of a node, or the next free page of a free page.
+PAGE_HEADER = Struct('<BI')
+FREE_NEXT = Struct('<Q')
+LEAF, INTERNAL, FREE = 0, 1, 2
+NO_PAGE = 0
+
+
+class DiskEntry(object):
+    '''
+    An entry returned by <<DiskBPlusTree>>, it is a copy of what is stored in
+    the page, so modifying it does not change the file.
+    '''
+
+    __slots__ = ('key', 'value')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+
+class DiskNode(object):
+
+    __slots__ = ('page_no', 'leaf', 'keys', 'items', 'size', 'dirty')
+
+    def __init__(self, page_no: int, leaf: bool, keys: list, items: list):
+        self.page_no = page_no
+        self.leaf = leaf
+        self.keys = keys
+        # The values of a leaf, or the len(keys) + 1 child pages of an
+        # internal node
+        self.items = items
+        # The estimated bytes of the payload, None means unknown
+        self.size: Optional[int] = 0
+        self.dirty = False
+
+
+class DiskBPlusTree(OrderedMapBase):
+    r'''
+    A B+tree stored in the fixed-size pages of a memory-mapped file. Only the
+    header is read when the file is opened, the other pages are loaded when
+    they are visited, so a huge index is opened at once and the operating
+    system faults in the pages on demand.
+
+                    page 1 (internal)      keys: [30, 60]
+                   /        |        \
+        page 2 (leaf)  page 4 (leaf)  page 3 (leaf)
+        [10, 20]       [30, 40, 50]   [60, 70]
+
+    The values are only stored in the leaves, and the child i of an internal
+    node holds the keys between its keys i - 1 and i. A page is split when its
+    payload grows beyond the page, so the number of entries of a page depends
+    on the sizes of the pickled keys and values, and an entry may not exceed a
+    quarter of the page. An empty page is released to the free list to be
+    reused, but the sparse pages are not merged.
+
+    The loaded nodes are kept in a page cache of <cache_pages> nodes, the
+    least recently used ones are evicted and written back to the mapped file
+    if they are modified. Call <flush> or <close> (or use it as a context
+    manager) to write everything back.
+
+    The keys and values are stored with pickle, do not open the files from
+    untrusted sources.
+    '''
+
+    def __init__(self, path: str, allow_dup_keys=True, page_size: int=4096,
+                 cache_pages: int=1024):
+        assert isinstance(allow_dup_keys, bool)
+        assert page_size >= 256 and cache_pages >= 16
+        super().__init__()
+
+        self.path = path
+        self.cache_pages = cache_pages
+        self._cache: OrderedDict = OrderedDict()
+
+        file_size = os_path.getsize(path) if os_path.exists(path) else 0
+        if file_size:
+            # The settings of an existing file are read from its header, and
+            # a file which is not a valid one is never overwritten
+            if file_size < HEADER.size:
+                raise DiskBPlusTreeException.bad_file(path)
+            self._file = open(path, 'r+b')
+            self._mmap = mmap(self._file.fileno(), 0)
+            magic, page_size, self.root_page, self.page_count, \
+                self.free_page, self.length, allow_dup_keys = \
+                HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or page_size < 256 or \
+                    file_size < page_size * self.page_count:
+                self._mmap.close()
+                self._file.close()
+                raise DiskBPlusTreeException.bad_file(path)
+            self.page_size = page_size
+            self.allow_dup_keys = allow_dup_keys
+            self._init_limits()
+        else:
+            self._file = open(path, 'w+b')
+            self._file.truncate(page_size * 2)
+            self._mmap = mmap(self._file.fileno(), 0)
+            self.page_size = page_size
+            self.allow_dup_keys = allow_dup_keys
+            self.page_count = 1
+            self.free_page = NO_PAGE
+            self.length = 0
+            self._init_limits()
+            self.root_page = self._allocate(True).page_no
+            self.flush()
+
+    def _init_limits(self):
+        self._capacity = self.page_size - PAGE_HEADER.size
+        # The sizes of the entries are estimated, leave some room for the
+        # pickle framing of the whole node.
+        self._split_size = self._capacity - self._capacity // 8
+        self._max_entry_size = self._capacity // 4
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self) -> 'DiskBPlusTree':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def flush(self):
+        for node in self._cache.values():
+            if node.dirty:
+                self._write(node)
+        HEADER.pack_into(self._mmap, 0, MAGIC, self.page_size,
+                         self.root_page, self.page_count, self.free_page,
+                         self.length, self.allow_dup_keys)
+        self._mmap.flush()
+
+    def close(self):
+        if self._mmap.closed:
+            return
+        self.flush()
+        self._cache.clear()
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def _entry_size(key, item) -> int:
+        return len(dumps((key, item), HIGHEST_PROTOCOL))
+
+    # Pages
+
+    def _load(self, page_no: int) -> DiskNode:
+        node = self._cache.get(page_no)
+        if node is not None:
+            self._cache.move_to_end(page_no)
+            return node
+
+        offset = page_no * self.page_size
+        kind, length = PAGE_HEADER.unpack_from(self._mmap, offset)
+        start = offset + PAGE_HEADER.size
+        keys, items = loads(self._mmap[start:start + length])
+        node = DiskNode(page_no, kind == LEAF, keys, items)
+        node.size = length
+        self._cache[page_no] = node
+        return node
+
+    def _write(self, node: DiskNode):
+        payload = dumps((node.keys, node.items), HIGHEST_PROTOCOL)
+        assert len(payload) <= self._capacity
+        offset = node.page_no * self.page_size
+        PAGE_HEADER.pack_into(self._mmap, offset,
+                              LEAF if node.leaf else INTERNAL, len(payload))
+        start = offset + PAGE_HEADER.size
+        self._mmap[start:start + len(payload)] = payload
+        node.dirty = False
+
+    def _touch(self, node: DiskNode):
+        # The node may be evicted after it is loaded, put it back to be
+        # written later.
+        node.dirty = True
+        self._cache[node.page_no] = node
+        self._cache.move_to_end(node.page_no)
+
+    def _shrink_cache(self):
+        # It is only called between the operations, so that the nodes held by
+        # an operation are never evicted and reloaded as another object.
+        cache = self._cache
+        while len(cache) > self.cache_pages:
+            node = cache.popitem(last=False)[1]
+            if node.dirty:
+                self._write(node)
+
+    def _allocate(self, leaf: bool) -> DiskNode:
+        if self.free_page != NO_PAGE:
+            page_no = self.free_page
+            self.free_page = FREE_NEXT.unpack_from(
+                self._mmap, page_no * self.page_size + PAGE_HEADER.size)[0]
+        else:
+            page_no = self.page_count
+            self.page_count += 1
+            required = self.page_count * self.page_size
+            size = len(self._mmap)
+            if required > size:
+                # Double the file to amortize remapping it
+                self._mmap.close()
+                self._file.truncate(max(required, 2 * size))
+                self._mmap = mmap(self._file.fileno(), 0)
+
+        node = DiskNode(page_no, leaf, [], [])
+        self._touch(node)
+        return node
+
+    def _release(self, node: DiskNode):
+        self._cache.pop(node.page_no, None)
+        offset = node.page_no * self.page_size
+        PAGE_HEADER.pack_into(self._mmap, offset, FREE, FREE_NEXT.size)
+        FREE_NEXT.pack_into(self._mmap, offset + PAGE_HEADER.size,
+                            self.free_page)
+        self.free_page = node.page_no
+
+    def _grow(self, node: DiskNode, delta: int):
+        if node.size is None:
+            node.size = len(dumps((node.keys, node.items), HIGHEST_PROTOCOL))
+        else:
+            node.size += delta
+        self._touch(node)
+
+    # Paths
+
+    def _descend(self, key, reverse: bool) -> List[list]:
+        '''
+        Return the path of [node, index] from the root to the leaf where the
+        entries not less than <key> start, <index> of the leaf is the first
+        of them. <None> means the first entry, or the end if <reverse>.
+        '''
+        path = []
+        node = self._load(self.root_page)
+        while True:
+            if key is not None:
+                index = bisect_left(node.keys, key)
+            elif reverse:
+                index = len(node.items) - (0 if node.leaf else 1)
+            else:
+                index = 0
+            path.append([node, index])
+            if node.leaf:
+                return path
+            node = self._load(node.items[index])
+
+    def _step_leaf(self, path: List[list], reverse: bool) -> bool:
+        '''
+        Move the path to the first entry of the next leaf, or to the end of
+        the previous leaf if <reverse>, return False if there is none.
+        '''
+        depth = len(path) - 2
+        while depth >= 0:
+            node, index = path[depth]
+            if (index > 0) if reverse else (index + 1 < len(node.items)):
+                break
+            depth -= 1
+        else:
+            return False
+
+        index = path[depth][1] + (-1 if reverse else 1)
+        path[depth][1] = index
+        node = self._load(path[depth][0].items[index])
+        del path[depth + 1:]
+        while True:
+            if node.leaf:
+                path.append([node, len(node.keys) if reverse else 0])
+                return True
+            index = len(node.items) - 1 if reverse else 0
+            path.append([node, index])
+            node = self._load(node.items[index])
+
+    # Operations
+
+    def insert(self, key, value=None) -> DiskEntry:
+        size = self._entry_size(key, value)
+        if size > self._max_entry_size:
+            raise DiskBPlusTreeException.entry_too_large(
+                key, size, self._max_entry_size)
+
+        # The equal keys are inserted after the existing ones, so that a key
+        # equal to a separator always goes to its right.
+        path: List[Tuple[DiskNode, int]] = []
+        node = self._load(self.root_page)
+        while not node.leaf:
+            index = bisect_right(node.keys, key)
+            path.append((node, index))
+            node = self._load(node.items[index])
+
+        keys = node.keys
+        index = bisect_right(keys, key)
+        if not self.allow_dup_keys and index > 0 and keys[index - 1] == key:
+            raise DiskBPlusTreeException.insert_duplicated_key(key)
+
+        keys.insert(index, key)
+        node.items.insert(index, value)
+        self._grow(node, size)
+        self.length += 1
+
+        while node.size > self._split_size:
+            sibling, separator = self._split(node)
+            if path:
+                parent, index = path.pop()
+            else:
+                parent = self._allocate(False)
+                parent.items.append(node.page_no)
+                self.root_page = parent.page_no
+                index = 0
+            parent.keys.insert(index, separator)
+            parent.items.insert(index + 1, sibling.page_no)
+            self._grow(parent, self._entry_size(separator, sibling.page_no))
+            node = parent
+
+        self._shrink_cache()
+        return DiskEntry(key, value)
+
+    def _split(self, node: DiskNode) -> Tuple[DiskNode, object]:
+        # Split the node into two halves of about the same bytes, and return
+        # the new right one and the key separating them.
+        keys = node.keys
+        items = node.items
+        sizes = [self._entry_size(key, item) for key, item in zip(keys, items)]
+        half = sum(sizes) // 2
+        total = 0
+        for middle, size in enumerate(sizes):
+            total += size
+            if total >= half:
+                break
+
+        sibling = self._allocate(node.leaf)
+        if node.leaf:
+            middle = min(max(middle + 1, 1), len(keys) - 1)
+            separator = keys[middle]
+            sibling.keys = keys[middle:]
+            sibling.items = items[middle:]
+            del keys[middle:]
+            del items[middle:]
+        else:
+            middle = min(max(middle, 1), len(keys) - 2)
+            separator = keys[middle]
+            sibling.keys = keys[middle + 1:]
+            sibling.items = items[middle + 1:]
+            del keys[middle:]
+            del items[middle + 1:]
+
+        node.size = sum(sizes[:middle])
+        sibling.size = sum(sizes[middle:])
+        self._touch(node)
+        return sibling, separator
+
+    def search(self, key) -> Optional[DiskEntry]:
+        path = self._descend(key, False)
+        leaf, index = path[-1]
+        if index == len(leaf.keys):
+            # All the keys of the leaf are less than <key>, the next leaf
+            # may start with it.
+            if not self._step_leaf(path, False):
+                return None
+            leaf, index = path[-1]
+
+        self._shrink_cache()
+        if leaf.keys and leaf.keys[index] == key:
+            return DiskEntry(key, leaf.items[index])
+        return None
+
+    def delete(self, key) -> bool:
+        path = self._descend(key, False)
+        node, index = path[-1]
+        if index == len(node.keys):
+            if not self._step_leaf(path, False):
+                return False
+            node, index = path[-1]
+        if not node.keys or node.keys[index] != key:
+            return False
+
+        del node.keys[index]
+        del node.items[index]
+        node.size = None
+        self._touch(node)
+        self.length -= 1
+
+        # Release the empty pages upward, a child and a separator next to it
+        # are removed from the parent together.
+        path.pop()
+        while path and not node.items:
+            self._release(node)
+            node, index = path.pop()
+            del node.items[index]
+            if node.keys:
+                del node.keys[index - 1 if index > 0 else 0]
+            node.size = None
+            self._touch(node)
+
+        root = self._load(self.root_page)
+        if not root.leaf and not root.items:
+            root.leaf = True
+            self._touch(root)
+        while not root.leaf and len(root.items) == 1:
+            self._release(root)
+            root = self._load(root.items[0])
+            self.root_page = root.page_no
+
+        self._shrink_cache()
+        return True
+
+    def min(self) -> Optional[DiskEntry]:
+        return next(self.range(), None)
+
+    def max(self) -> Optional[DiskEntry]:
+        return next(self.range(reverse=True), None)
+
+    def range(self, lo=None, hi=None, reverse=False) -> Iterator[DiskEntry]:
+        if not reverse:
+            path = self._descend(lo, False)
+            while True:
+                leaf, index = path[-1]
+                keys = leaf.keys
+                items = leaf.items
+                while index < len(keys):
+                    if hi is not None and not keys[index] < hi:
+                        return
+                    yield DiskEntry(keys[index], items[index])
+                    index += 1
+
+                self._shrink_cache()
+                if not self._step_leaf(path, False):
+                    return
+
+        else:
+            path = self._descend(hi, True)
+            while True:
+                leaf, index = path[-1]
+                keys = leaf.keys
+                items = leaf.items
+                while index > 0:
+                    index -= 1
+                    if lo is not None and keys[index] < lo:
+                        return
+                    yield DiskEntry(keys[index], items[index])
+
+                self._shrink_cache()
+                if not self._step_leaf(path, True):
+                    return
@@ -0,0 +1,164 @@
+from ..algorithm import AlgorithmBase
+from ..exception import ExceptionBase, ExceptionInfo, register_exception
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, List, Optional, Tuple
+
+
+class OrderedMapException(ExceptionBase):
+
+    @register_exception
+    def insert_duplicated_key(info: ExceptionInfo, dup_key):
+        info.tell_me('This ordered map do not allow duplicated key '
+                     f'{dup_key} to be inserted.')
+        info.dup_key = dup_key
+
+
+class OrderedMapBase(AlgorithmBase, ABC):
+    '''
+    The interface shared by the ordered maps, such as <<RedBlackTree>>,
+    <<AVLTree>>, <<Treap>>, <<SkipList>> and <<BTree>>, so that they can
+    replace each other for different workloads (see <<select_ordered_map>>).
+
+    An entry of the map is an object with <key> and <value> attributes (the
+    node of the trees for example), which is returned by <insert>, <search>
+    and the iterations. The entries with equal keys are kept side by side if
+    <allow_dup_keys> is true, otherwise inserting an existing key raises
+    <<OrderedMapException>>.insert_duplicated_key.
+    '''
+
+    allow_dup_keys: bool
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def insert(self, key, value=None) -> Any:
+        ...
+
+    @abstractmethod
+    def search(self, key) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def delete(self, key) -> bool:
+        ...
+
+    @abstractmethod
+    def min(self) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def max(self) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def range(self, lo=None, hi=None, reverse=False) -> Iterator[Any]:
+        '''
+        Yield the entries whose key is in [lo, hi) in order, <None> means no
+        limit.
+        '''
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.range()
+
+    def __reversed__(self) -> Iterator[Any]:
+        return self.range(reverse=True)
+
+
+class BinaryTreeMapBase(OrderedMapBase):
+    '''
+    The common part of the binary search trees whose nodes have no parent
+    link, e.g. <<AVLTree>> and <<Treap>>. The nodes have <key>, <value>,
+    <left> and <right> attributes, and the empty subtrees are the null node
+    <ND_NULL>. The modifications keep the path from the root in a list of
+    (node, direction) pairs to find the parents.
+    '''
+
+    LEFT = 0
+    RIGHT = 1
+
+    ND_NULL: Any
+    ND_ROOT: Any
+    length: int
+
+    def __len__(self):
+        return self.length
+
+    def _link(self, path: List[Tuple[Any, int]], depth: int, node):
+        # Link <node> to the parent at <depth - 1> of <path>
+        if depth == 0:
+            self.ND_ROOT = node
+            return
+
+        parent, direction = path[depth - 1]
+        if direction == self.LEFT:
+            parent.left = node
+        else:
+            parent.right = node
+
+    def search(self, key) -> Optional[Any]:
+        nil = self.ND_NULL
+        node = self.ND_ROOT
+        while node is not nil:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node
+        return None
+
+    def min(self) -> Optional[Any]:
+        nil = self.ND_NULL
+        node = self.ND_ROOT
+        if node is nil:
+            return None
+        while node.left is not nil:
+            node = node.left
+        return node
+
+    def max(self) -> Optional[Any]:
+        nil = self.ND_NULL
+        node = self.ND_ROOT
+        if node is nil:
+            return None
+        while node.right is not nil:
+            node = node.right
+        return node
+
+    def range(self, lo=None, hi=None, reverse=False) -> Iterator[Any]:
+        # The pending nodes are kept in a stack since there is no parent link
+        nil = self.ND_NULL
+        stack = []
+        node = self.ND_ROOT
+        if not reverse:
+            while stack or node is not nil:
+                if node is not nil:
+                    if lo is not None and node.key < lo:
+                        node = node.right
+                    else:
+                        stack.append(node)
+                        node = node.left
+                    continue
+
+                node = stack.pop()
+                if hi is not None and not node.key < hi:
+                    return
+                yield node
+                node = node.right
+        else:
+            while stack or node is not nil:
+                if node is not nil:
+                    if hi is not None and not node.key < hi:
+                        node = node.left
+                    else:
+                        stack.append(node)
+                        node = node.right
+                    continue
+
+                node = stack.pop()
+                if lo is not None and node.key < lo:
+                    return
+                yield node
+                node = node.left
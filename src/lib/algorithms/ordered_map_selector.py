@@ -0,0 +1,104 @@
+from .avl_tree import AVLTree
+from .b_tree import BTree
+from .ordered_map import OrderedMapBase
+from .red_black_tree import RedBlackTree
+from .skip_list import SkipList
+from .treap import Treap
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+
+DEFAULT_CANDIDATES = (RedBlackTree, AVLTree, Treap, SkipList, BTree)
+
+
+class OperationTrace(object):
+    '''
+    Wrap an ordered map to record the operations on it, which can be replayed
+    against the other ordered maps by <select_ordered_map>. The other
+    attributes are passed to the wrapped map directly and not recorded.
+
+        trace = OperationTrace(RedBlackTree())
+        ... run the workload with <trace> as the map ...
+        best_cls, timings = select_ordered_map(trace.operations)
+    '''
+
+    def __init__(self, ordered_map: OrderedMapBase):
+        self.ordered_map = ordered_map
+        self.operations: list = []
+
+    def __getattr__(self, name):
+        return getattr(self.ordered_map, name)
+
+    def __len__(self):
+        return len(self.ordered_map)
+
+    def __iter__(self):
+        return self.range()
+
+    def __reversed__(self):
+        return self.range(reverse=True)
+
+    def insert(self, key, value=None):
+        self.operations.append(('insert', key, value))
+        return self.ordered_map.insert(key, value)
+
+    def search(self, key):
+        self.operations.append(('search', key))
+        return self.ordered_map.search(key)
+
+    def delete(self, key) -> bool:
+        self.operations.append(('delete', key))
+        return self.ordered_map.delete(key)
+
+    def range(self, lo=None, hi=None, reverse=False):
+        self.operations.append(('range', lo, hi, reverse))
+        return self.ordered_map.range(lo, hi, reverse)
+
+
+def replay(ordered_map: OrderedMapBase, operations: Iterable[tuple]):
+    '''
+    Apply the recorded operations to <ordered_map>, the ranges are iterated
+    to the end.
+    '''
+    insert = ordered_map.insert
+    search = ordered_map.search
+    delete = ordered_map.delete
+    for operation in operations:
+        name = operation[0]
+        if name == 'search':
+            search(operation[1])
+        elif name == 'insert':
+            insert(operation[1], operation[2])
+        elif name == 'delete':
+            delete(operation[1])
+        else:
+            for _ in ordered_map.range(*operation[1:]):
+                pass
+
+
+def select_ordered_map(
+        operations: Sequence[tuple],
+        candidates: Iterable[Callable[[], OrderedMapBase]]=DEFAULT_CANDIDATES,
+        repeat: int=3) -> Tuple[Callable[[], OrderedMapBase],
+                                Dict[Callable[[], OrderedMapBase], float]]:
+    '''
+    Replay <operations> recorded by <<OperationTrace>> against an empty map
+    made by each of <candidates> (the classes, or any factory such as
+    functools.partial(BTree, min_degree=64)), and return the fastest one
+    together with the best time in seconds of each candidate out of <repeat>
+    runs.
+    '''
+    assert repeat > 0
+    timings = {}
+    for candidate in candidates:
+        best = None
+        for _ in range(repeat):
+            ordered_map = candidate()
+            start = perf_counter()
+            replay(ordered_map, operations)
+            elapsed = perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        timings[candidate] = best
+
+    return min(timings, key=timings.__getitem__), timings
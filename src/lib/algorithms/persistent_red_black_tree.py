@@ -0,0 +1,380 @@
+from ..algorithm import AlgorithmBase
+from .red_black_tree import BLACK, RED, RBTreeException
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+
+class PersistentRBNode(object):
+    '''
+    The node of <<PersistentRedBlackTree>>. It has no parent link, so that a
+    subtree can be shared by many versions of the tree, and it is never
+    modified once it is linked into a tree. The callers must not modify the
+    nodes returned by the tree either.
+    '''
+
+    __slots__ = ('key', 'value', 'color', 'left', 'right')
+
+    def __init__(self, key, value, color: int=RED,
+                 left: Optional['PersistentRBNode']=None,
+                 right: Optional['PersistentRBNode']=None):
+        self.key = key
+        self.value = value
+        self.color = color
+        self.left = left
+        self.right = right
+
+
+class RBTreeSnapshot(object):
+    '''
+    One version of <<PersistentRedBlackTree>>. A snapshot never changes, so it
+    could be read by any number of greenlets or threads without locking, even
+    while the tree is being modified, and the nodes which are only used by the
+    released snapshots are garbage-collected as usual.
+    '''
+
+    __slots__ = ('ND_ROOT', 'length')
+
+    def __init__(self, root: Optional[PersistentRBNode]=None, length: int=0):
+        self.ND_ROOT = root
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def search(self, key) -> Optional[PersistentRBNode]:
+        nd_current = self.ND_ROOT
+        while nd_current is not None:
+            if key < nd_current.key:
+                nd_current = nd_current.left
+            elif key > nd_current.key:
+                nd_current = nd_current.right
+            else:
+                return nd_current
+        return None
+
+    def min(self) -> Optional[PersistentRBNode]:
+        node = self.ND_ROOT
+        while node is not None and node.left is not None:
+            node = node.left
+        return node
+
+    def max(self) -> Optional[PersistentRBNode]:
+        node = self.ND_ROOT
+        while node is not None and node.right is not None:
+            node = node.right
+        return node
+
+    def range(self, lo=None, hi=None,
+              reverse=False) -> Iterator[PersistentRBNode]:
+        '''
+        Yield the nodes whose key is in [lo, hi) in order, <None> means no
+        limit. There is no parent link to walk back, so a stack of the nodes
+        on the path is kept, which holds O(log n) nodes at most.
+        '''
+        stack = []
+        node = self.ND_ROOT
+        if not reverse:
+            while stack or node is not None:
+                if node is not None:
+                    if lo is not None and node.key < lo:
+                        node = node.right
+                    else:
+                        stack.append(node)
+                        node = node.left
+                    continue
+
+                node = stack.pop()
+                if hi is not None and node.key >= hi:
+                    return
+                yield node
+                node = node.right
+        else:
+            while stack or node is not None:
+                if node is not None:
+                    if hi is not None and node.key >= hi:
+                        node = node.left
+                    else:
+                        stack.append(node)
+                        node = node.right
+                    continue
+
+                node = stack.pop()
+                if lo is not None and node.key < lo:
+                    return
+                yield node
+                node = node.left
+
+    def __iter__(self) -> Iterator[PersistentRBNode]:
+        return self.range()
+
+    def __reversed__(self) -> Iterator[PersistentRBNode]:
+        return self.range(reverse=True)
+
+
+class PersistentRedBlackTree(AlgorithmBase):
+    r'''
+    A red-black tree whose modifications never touch the existing nodes. The
+    nodes on the path from the root to the changed node are copied instead,
+    and the copies are linked to the untouched subtrees, so each modification
+    creates O(log n) nodes and a new root:
+
+             version 1                      version 2 (7 inserted)
+
+               [ 5 ]                              [ 5']
+              /     \                            /     \
+          [ 2 ]     [ 8 ]       [ 2 ] of version 1     [ 8']
+          /   \     /   \                              /   \
+        [1]   [3] [ 6 ] [ 9 ]                      [ 6'] [ 9 ] of version 1
+                                                       \
+                                                       ( 7 )
+
+    Each version is published as a <<RBTreeSnapshot>> by a single attribute
+    assignment, so the readers call <snapshot> and read it without any lock
+    while a writer is modifying the tree. The writers still have to be
+    serialized by the callers.
+
+    The keys are unique, inserting an existing key replaces its value. The
+    rebalancing follows the functional red-black tree of Okasaki and the
+    deletion of Kahrs, see <_balance> and <_delete>.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self._snapshot = RBTreeSnapshot()
+
+    @classmethod
+    def from_sorted(cls, items: Iterable[Tuple[Any, Any]]
+                    ) -> 'PersistentRedBlackTree':
+        '''
+        Build a tree from the (key, value) pairs sorted by key in linear time,
+        see <<RedBlackTree>>.from_sorted.
+        '''
+        nodes = []
+        for key, value in items:
+            if nodes:
+                previous_key = nodes[-1].key
+                if key < previous_key:
+                    raise RBTreeException.unsorted_keys(previous_key, key)
+                if key == previous_key:
+                    raise RBTreeException.insert_duplicated_key(key)
+            nodes.append(PersistentRBNode(key, value, BLACK))
+
+        length = len(nodes)
+        red_level = -1 if length & (length + 1) == 0 \
+            else length.bit_length() - 1
+
+        def _build(start, end, level):
+            if start > end:
+                return None
+
+            middle = (start + end) // 2
+            node = nodes[middle]
+            if level == red_level:
+                node.color = RED
+            node.left = _build(start, middle - 1, level + 1)
+            node.right = _build(middle + 1, end, level + 1)
+            return node
+
+        tree = cls()
+        tree._snapshot = RBTreeSnapshot(_build(0, length - 1, 0), length)
+        return tree
+
+    def snapshot(self) -> RBTreeSnapshot:
+        return self._snapshot
+
+    def __len__(self):
+        return self._snapshot.length
+
+    def search(self, key) -> Optional[PersistentRBNode]:
+        return self._snapshot.search(key)
+
+    def min(self) -> Optional[PersistentRBNode]:
+        return self._snapshot.min()
+
+    def max(self) -> Optional[PersistentRBNode]:
+        return self._snapshot.max()
+
+    def range(self, lo=None, hi=None,
+              reverse=False) -> Iterator[PersistentRBNode]:
+        return self._snapshot.range(lo, hi, reverse)
+
+    def __iter__(self) -> Iterator[PersistentRBNode]:
+        return self._snapshot.range()
+
+    def __reversed__(self) -> Iterator[PersistentRBNode]:
+        return self._snapshot.range(reverse=True)
+
+    def insert(self, key, value=None) -> PersistentRBNode:
+        snapshot = self._snapshot
+        length = snapshot.length
+        if snapshot.search(key) is None:
+            length += 1
+
+        root = _blacken(_insert(snapshot.ND_ROOT, key, value))
+        self._snapshot = RBTreeSnapshot(root, length)
+        return self._snapshot.search(key)
+
+    def delete(self, key) -> bool:
+        snapshot = self._snapshot
+
+        # The rebalancing of <_delete> expects the key to be found, because it
+        # assumes the black height of the subtree has been decreased.
+        if snapshot.search(key) is None:
+            return False
+
+        root = _blacken(_delete(snapshot.ND_ROOT, key))
+        self._snapshot = RBTreeSnapshot(root, snapshot.length - 1)
+        return True
+
+
+# The following functions never modify the nodes passed in. <node> is the
+# node whose key and value are copied into the new node, and the empty tree
+# is None.
+
+def _copy(node: PersistentRBNode, color: int,
+          left: Optional[PersistentRBNode],
+          right: Optional[PersistentRBNode]) -> PersistentRBNode:
+    return PersistentRBNode(node.key, node.value, color, left, right)
+
+
+def _is_red(node: Optional[PersistentRBNode]) -> bool:
+    return node is not None and node.color == RED
+
+
+def _blacken(node: Optional[PersistentRBNode]) -> Optional[PersistentRBNode]:
+    if node is None or node.color == BLACK:
+        return node
+    return _copy(node, BLACK, node.left, node.right)
+
+
+def _redden(node: PersistentRBNode) -> PersistentRBNode:
+    return _copy(node, RED, node.left, node.right)
+
+
+def _balance(left, node, right) -> PersistentRBNode:
+    #  Build a black node from <left>, <node> and <right>, a red child with a
+    #  red child of its own is fixed by the rotation below (the other three
+    #  cases are symmetric), and two red children are painted black.
+    #
+    #              [z]                   (y)
+    #             /   \                 /   \
+    #           (y)    d     ==>      [x]   [z]
+    #          /   \                  / \   / \
+    #        (x)    c                a   b c   d
+    #        / \
+    #       a   b
+    if _is_red(left):
+        if _is_red(right):
+            return _copy(node, RED, _blacken(left), _blacken(right))
+
+        if _is_red(left.left):
+            return _copy(left, RED, _blacken(left.left),
+                         _copy(node, BLACK, left.right, right))
+
+        if _is_red(left.right):
+            pivot = left.right
+            return _copy(pivot, RED,
+                         _copy(left, BLACK, left.left, pivot.left),
+                         _copy(node, BLACK, pivot.right, right))
+
+    elif _is_red(right):
+        if _is_red(right.right):
+            return _copy(right, RED, _copy(node, BLACK, left, right.left),
+                         _blacken(right.right))
+
+        if _is_red(right.left):
+            pivot = right.left
+            return _copy(pivot, RED,
+                         _copy(node, BLACK, left, pivot.left),
+                         _copy(right, BLACK, pivot.right, right.right))
+
+    return _copy(node, BLACK, left, right)
+
+
+def _balance_left(left, node, right) -> PersistentRBNode:
+    # The black height of <left> is one less than <right>
+    if _is_red(left):
+        return _copy(node, RED, _blacken(left), right)
+
+    if not _is_red(right):
+        return _balance(left, node, _redden(right))
+
+    pivot = right.left
+    return _copy(pivot, RED, _copy(node, BLACK, left, pivot.left),
+                 _balance(pivot.right, right, _redden(right.right)))
+
+
+def _balance_right(left, node, right) -> PersistentRBNode:
+    # The black height of <right> is one less than <left>
+    if _is_red(right):
+        return _copy(node, RED, left, _blacken(right))
+
+    if not _is_red(left):
+        return _balance(_redden(left), node, right)
+
+    pivot = left.right
+    return _copy(pivot, RED, _balance(_redden(left.left), left, pivot.left),
+                 _copy(node, BLACK, pivot.right, right))
+
+
+def _append(left, right) -> Optional[PersistentRBNode]:
+    # Join two subtrees of the same black height, all the keys of <left> are
+    # less than the keys of <right>
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    if _is_red(left):
+        if _is_red(right):
+            middle = _append(left.right, right.left)
+            if _is_red(middle):
+                return _copy(middle, RED,
+                             _copy(left, RED, left.left, middle.left),
+                             _copy(right, RED, middle.right, right.right))
+            return _copy(left, RED, left.left,
+                         _copy(right, RED, middle, right.right))
+
+        return _copy(left, RED, left.left, _append(left.right, right))
+
+    if _is_red(right):
+        return _copy(right, RED, _append(left, right.left), right.right)
+
+    middle = _append(left.right, right.left)
+    if _is_red(middle):
+        return _copy(middle, RED,
+                     _copy(left, BLACK, left.left, middle.left),
+                     _copy(right, BLACK, middle.right, right.right))
+    return _balance_left(left.left, left,
+                         _copy(right, BLACK, middle, right.right))
+
+
+def _insert(node, key, value) -> PersistentRBNode:
+    if node is None:
+        return PersistentRBNode(key, value)
+
+    if key < node.key:
+        if node.color == BLACK:
+            return _balance(_insert(node.left, key, value), node, node.right)
+        return _copy(node, RED, _insert(node.left, key, value), node.right)
+
+    if key > node.key:
+        if node.color == BLACK:
+            return _balance(node.left, node, _insert(node.right, key, value))
+        return _copy(node, RED, node.left, _insert(node.right, key, value))
+
+    return PersistentRBNode(key, value, node.color, node.left, node.right)
+
+
+def _delete(node, key) -> Optional[PersistentRBNode]:
+    # <key> must be in the tree of <node>
+    if key < node.key:
+        if node.left.color == BLACK:
+            return _balance_left(_delete(node.left, key), node, node.right)
+        return _copy(node, RED, _delete(node.left, key), node.right)
+
+    if key > node.key:
+        if node.right.color == BLACK:
+            return _balance_right(node.left, node, _delete(node.right, key))
+        return _copy(node, RED, node.left, _delete(node.right, key))
+
+    return _append(node.left, node.right)
@@ -1,10 +1,22 @@
-from ..algorithm import AlgorithmBase, StepRecorderBase
-from ..exception import ExceptionBase, ExceptionInfo, register_exception
-from enum import Enum
-from typing import Callable, Optional, Type
-
-
-class RBTreeException(ExceptionBase):
+from ..algorithm import StepRecorderBase
+from ..exception import ExceptionInfo, register_exception
+from .ordered_map import OrderedMapBase, OrderedMapException
+from array import array
+from collections import Counter, defaultdict
+from enum import IntEnum
+from io import BytesIO
+from mmap import ACCESS_READ, mmap
+from multiprocessing import Pool
+from operator import itemgetter
+from pickle import Unpickler, dumps, loads
+from struct import Struct
+from sys import byteorder
+from typing import (
+    Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple, Type
+)
+
+
+class RBTreeException(OrderedMapException):
 
     @register_exception
     def insert_duplicated_key(info: ExceptionInfo, dup_key):
@@ -17,16 +29,44 @@ class RBTreeException(ExceptionBase):
         info.tell_me(f'Can not find key {key} in Reb-Black tree')
         info.key = key
 
+    @register_exception
+    def augmentation_disabled(info: ExceptionInfo, feature, rb_node_cls):
+        info.tell_me(f'The feature <{feature}> requires the nodes to be '
+                     f'augmented by <{rb_node_cls.__name__}>, please enable '
+                     'it when the tree is initialized.')
+        info.feature = feature
+
+    @register_exception
+    def index_out_of_range(info: ExceptionInfo, index, length):
+        info.tell_me(f'The index {index} is out of the range of the tree '
+                     f'with {length} nodes.')
+        info.index = index
+
+    @register_exception
+    def unsorted_keys(info: ExceptionInfo, previous_key, key):
+        info.tell_me(f'The key {key} is less than its previous key '
+                     f'{previous_key}, the keys are not sorted.')
+        info.previous_key = previous_key
+        info.key = key
+
+    @register_exception
+    def bad_dump(info: ExceptionInfo, reason):
+        info.tell_me(f'Can not load the dumped Red-Black tree: {reason}')
+        info.reason = reason
+
 
 class StepRecorder(StepRecorderBase):
 
     def init_tree(self):
         ...
 
-    def search_node(self, current_node, insert_node):
+    def search_node(self, key, direction, finished=False):
         ...
 
-    def match_node(self, node):
+    def climb_node(self, key):
+        ...
+
+    def match_node(self, key):
         ...
 
     def unmatch_node(self):
@@ -38,132 +78,1115 @@ class StepRecorder(StepRecorderBase):
     def fixup_tree(self, myself, parent, grandparent, uncle):
         ...
 
+    def blacken_root_node(self):
+        ...
+
+    def fixup_case(self, operation: str, case: str, rotations: int,
+                   recolors: int):
+        ...
+
+    def finish_operation(self, operation: str, depth: int, comparisons: int):
+        ...
 
-class Color(Enum):
+
+class StatsRecorder(StepRecorder):
+    '''
+    Count what the traced operations cost instead of recording each step,
+    to find out why a workload is slow:
+
+        >>> stats = StatsRecorder()
+        >>> tree = RedBlackTree(step_recorder=stats)
+        >>> tree.open_step_recorder()
+        >>> ...
+        >>> stats.rotations[('delete', 'red-sibling')]
+
+    Like the other step recorders, it costs nothing when the recorder is
+    closed. The operations are <insert>, <search> and <delete>, and the fixup
+    cases are the ones described in <_fixup_after_insert> and
+    <_delete_node>:
+
+        insert    red-uncle, black-uncle-outer, black-uncle-inner
+        delete    red-child, red-sibling, black-nephews, red-nephew-outer,
+                  red-nephew-inner
+
+    With the finger, the walk goes down from the node the finger climbs to,
+    and the comparisons of the climb are counted too. With the hash index,
+    <search> and <delete> compare no node, so their depth is 0.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.operations: Counter = Counter()
+        self.comparisons: Counter = Counter()
+        # (operation, case) -> count
+        self.fixups: Counter = Counter()
+        self.rotations: Counter = Counter()
+        self.recolors: Counter = Counter()
+        # operation -> {depth: count}, the depth is the number of nodes
+        # compared on the way down, not counting the climb of the finger
+        self.depths: Dict[str, Counter] = defaultdict(Counter)
+
+    def fixup_case(self, operation: str, case: str, rotations: int,
+                   recolors: int):
+        self.fixups[(operation, case)] += 1
+        self.rotations[(operation, case)] += rotations
+        self.recolors[(operation, case)] += recolors
+
+    def finish_operation(self, operation: str, depth: int, comparisons: int):
+        self.operations[operation] += 1
+        self.comparisons[operation] += comparisons
+        self.depths[operation][depth] += 1
+
+    def summary(self) -> dict:
+        '''
+        Summarize the counters by operation, e.g.
+
+            {'insert': {'count': 1000, 'comparisons': 19342,
+                        'mean_depth': 10.2, 'max_depth': 15,
+                        'rotations': 583, 'recolors': 1687}, ...}
+        '''
+        summary = {}
+        for operation, count in self.operations.items():
+            depths = self.depths[operation]
+            summary[operation] = {
+                'count': count,
+                'comparisons': self.comparisons[operation],
+                'mean_depth': sum(depth * times for depth, times
+                                  in depths.items()) / count,
+                'max_depth': max(depths),
+                'rotations': sum(rotations for (name, _), rotations
+                                 in self.rotations.items()
+                                 if name == operation),
+                'recolors': sum(recolors for (name, _), recolors
+                                in self.recolors.items()
+                                if name == operation),
+            }
+        return summary
+
+
+class Color(IntEnum):
     RED = 0
     BLACK = 1
 
 
-class Direction(Enum):
+class Direction(IntEnum):
     LEFT = 0
     RIGHT = 1
 
 
+# The nodes store the plain integers rather than the enum members, comparing
+# two small integers is much cheaper than comparing two enum members, and the
+# enum classes are still equal to (and hashed as) these integers.
+RED = int(Color.RED)
+BLACK = int(Color.BLACK)
+LEFT = int(Direction.LEFT)
+RIGHT = int(Direction.RIGHT)
+
+
+# The format of <<RedBlackTree>>.dump, all the integers are little-endian:
+#
+#   header    magic, flags (DUMP_MULTISET | DUMP_INTERVAL), number of nodes n,
+#             length of the tree
+#   colors    n bits, the color of the nodes in pre-order
+#   shapes    2n bits, whether each node has the left and the right child
+#   rights    n uint32, the pre-order index of the right child, which is only
+#             read by <<MappedRedBlackTree>> to skip the left subtree
+#   offsets   n + 1 uint64, the offset of each node in <data>, followed by
+#             its size
+#   data      for each node, the pickled key followed by the pickled (value,
+#             [count], [end]) tuple
+#
+# The left child of a node is always the next one in pre-order.
+#
+# <load> reads the whole file, but the layout is made for the search of
+# <<MappedRedBlackTree>>, which only touches the nodes on its path. So the
+# right index and the offset of each node are kept, and each key is pickled
+# alone, since unpickling one block of all the keys would cost as much as
+# loading the tree. The value is pickled after the key rather than with it,
+# <loads> ignores the bytes following the key, so the values on the path are
+# never unpickled. Pickle protocol 3 is used as it has no frame, which costs
+# 9 bytes for each pickle of protocol 4 and above.
+DUMP_HEADER = Struct('<8sBQQ')
+DUMP_MAGIC = b'IHRBDUMP'
+DUMP_MULTISET = 1
+DUMP_INTERVAL = 2
+DUMP_RIGHT = Struct('<I')
+DUMP_OFFSET = Struct('<Q')
+DUMP_PROTOCOL = 3
+
+
+def _packed_array(typecode: str, values) -> bytes:
+    packed = array(typecode, values)
+    if byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpacked_array(typecode: str, data: bytes) -> array:
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if byteorder == 'big':
+        unpacked.byteswap()
+    return unpacked
+
+
+def _dump_sections(n: int) -> Tuple[int, int, int, int, int]:
+    # The offsets of the sections following the header
+    colors = DUMP_HEADER.size
+    shapes = colors + (n + 7) // 8
+    rights = shapes + (2 * n + 7) // 8
+    offsets = rights + DUMP_RIGHT.size * n
+    data = offsets + DUMP_OFFSET.size * (n + 1)
+    return colors, shapes, rights, offsets, data
+
+
+# The type tags of <pack_key>, ordered as the types are ordered
+PACK_END = b'\x00'
+PACK_BYTES = b'\x01'
+PACK_STR = b'\x02'
+PACK_INT = b'\x03'
+PACK_FLOAT = b'\x04'
+PACK_TUPLE = b'\x05'
+PACK_FLOAT_STRUCT = Struct('>d')
+PACK_INT_BIAS = 1 << 63
+
+
+def _pack_key(key, parts: list):
+    # The bool is an int
+    if isinstance(key, int):
+        parts.append(PACK_INT)
+        parts.append((key + PACK_INT_BIAS).to_bytes(8, 'big'))
+    elif isinstance(key, (str, bytes)):
+        parts.append(PACK_STR if isinstance(key, str) else PACK_BYTES)
+        if isinstance(key, str):
+            key = key.encode()
+        parts.append(key.replace(b'\x00', b'\x00\xff'))
+        parts.append(PACK_END)
+    elif isinstance(key, float):
+        packed = PACK_FLOAT_STRUCT.pack(key)
+        if packed[0] & 0x80:
+            packed = bytes(byte ^ 0xff for byte in packed)
+        else:
+            packed = bytes([packed[0] | 0x80]) + packed[1:]
+        parts.append(PACK_FLOAT)
+        parts.append(packed)
+    elif isinstance(key, tuple):
+        parts.append(PACK_TUPLE)
+        for item in key:
+            _pack_key(item, parts)
+        parts.append(PACK_END)
+    else:
+        raise TypeError(f'Can not pack the key of {type(key).__name__}')
+
+
+def pack_key(key) -> bytes:
+    r'''
+    Pack <key> into bytes, whose order is the order of the keys, so it can be
+    the key function of <<RedBlackTree>>:
+
+        >>> tree = RedBlackTree(key=pack_key)
+        >>> tree.insert(('tenant-1', 'user-9', 3), record)
+
+    A key is a str, bytes, int, float or a tuple of them, and the keys are
+    ordered the same as Python does when the items at the same position are
+    of the same type:
+
+        ('ab', 7)   ->  05 | 02 61 62 00 | 03 80 .. 07 | 00
+                        tuple  str 'ab'    int 7 + 2^63  end
+
+    The str and bytes end with 0x00, and the 0x00 in them is escaped to
+    0x00 0xff, so a prefix is ordered first. The int is biased to unsigned
+    and must fit into 64 bits, otherwise OverflowError is raised.
+    '''
+    parts = []
+    _pack_key(key, parts)
+    return b''.join(parts)
+
+
 class RBNode(object):
+    '''
+    The node of red-black tree. A tree may hold millions of nodes, so the node
+    does not own a <__dict__> but fixed slots, and its <color> and
+    <from_direction> are small integers (see <Color> and <Direction>).
+
+    A subclass passed by <rb_node_cls> still works if it does not declare
+    <__slots__>, it just gets a <__dict__> back. Declare the extra attributes
+    in <__slots__> to keep it compact:
+
+        >>> class MyNode(RBNode):
+        >>>     __slots__ = ('extra', )
+
+    The tree compares the nodes by <sort_key>, which is the <key> slot itself
+    unless the tree has a key function, see <_keyed_node_cls>.
+    '''
+
+    __slots__ = ('key', 'value', 'left', 'right', 'color', 'parent',
+                 'from_direction')
+
+    # An augmented node keeps some data summarized from its subtree, the tree
+    # calls <refresh> to recompute it whenever its children are changed.
+    AUGMENTED = False
+
+    # A node holds one copy of its key, unless it is a counted node of the
+    # multiset mode (see <RBCountNode>), which has a <count> slot instead.
+    COUNTED = False
+    count = 1
+
+    # The node of a tree with a key function has a <sort_key> slot besides
+    # its original <key>, see <_keyed_node_cls>.
+    KEYED = False
 
     def __init__(self, key, value):
         self.key = key
         self.value = value
         self.left: 'RBNode' = None
         self.right: 'RBNode' = None
-        self.color = Color.RED
+        self.color = RED
 
         # root node do not need <from_direction> and parent
         self.parent: Optional['RBNode'] = None
-        self.from_direction: Optional[Direction ]= None
+        self.from_direction: Optional[int] = None
 
     @classmethod
     def new_null_node(cls):
         nd_null = cls(None, None)
-        nd_null.color = Color.BLACK
+        nd_null.color = BLACK
+        return nd_null
+
+    @classmethod
+    def null_node(cls):
+        '''
+        The null node is never modified by the tree, so all the trees built
+        with the same node class share one.
+        '''
+        nd_null = cls.__dict__.get('_ND_NULL')
+        if nd_null is None:
+            nd_null = cls.new_null_node()
+            setattr(cls, '_ND_NULL', nd_null)
+        return nd_null
+
+    def refresh(self):
+        ...
+
+
+# Like <count>, the plain nodes share the attribute of their class, which
+# reads the <key> slot as fast as <key> itself.
+RBNode.sort_key = RBNode.key
+
+
+class RBSizeNode(RBNode):
+    '''
+    The node augmented by the number of nodes of its subtree, which makes the
+    order statistics (rank, select) of the tree available in O(log n).
+    '''
+
+    __slots__ = ('size', )
+
+    AUGMENTED = True
+
+    def __init__(self, key, value):
+        super().__init__(key, value)
+        self.size = 1
+
+    @classmethod
+    def new_null_node(cls):
+        nd_null = super().new_null_node()
+        nd_null.size = 0
         return nd_null
 
+    def refresh(self):
+        self.size = self.left.size + self.right.size + self.count
+
+
+class RBIntervalNode(RBNode):
+    r'''
+    The node of the interval [key, end], augmented by the maximum <end> of its
+    subtree, so that the subtrees which can not overlap a given interval are
+    skipped by <<RedBlackTree>>.overlapping:
+
+                     [5, 9] max 12
+                    /             \
+          [2, 12] max 12       [8, 10] max 10
+                              /
+                    [6, 7] max 7
+
+    The interval is inserted by <insert(start, value, end)>, and it is a point
+    if <end> is omitted. A reversed interval would break the pruning by
+    <max_end>, so ValueError is raised if <end> is less than the key.
+    '''
+
+    __slots__ = ('end', 'max_end')
+
+    AUGMENTED = True
+
+    def __init__(self, key, value, end=None):
+        if end is None:
+            end = key
+        elif end < key:
+            raise ValueError(f'The end {end} of the interval is less than '
+                             f'its start {key}')
+        super().__init__(key, value)
+        self.end = end
+        self.max_end = end
+
+    @classmethod
+    def new_null_node(cls):
+        nd_null = super().new_null_node()
+        nd_null.max_end = None
+        return nd_null
+
+    def refresh(self):
+        max_end = self.end
+        left_max_end = self.left.max_end
+        if left_max_end is not None and left_max_end > max_end:
+            max_end = left_max_end
+        right_max_end = self.right.max_end
+        if right_max_end is not None and right_max_end > max_end:
+            max_end = right_max_end
+        self.max_end = max_end
+
+
+class RBCountNode(RBNode):
+    '''
+    The node of the multiset mode, all the copies of a key share one node and
+    <count> tells how many copies there are.
+    '''
+
+    __slots__ = ('count', )
+
+    COUNTED = True
+
+    def __init__(self, key, value):
+        super().__init__(key, value)
+        self.count = 1
+
+
+class RBCountSizeNode(RBSizeNode):
+    '''
+    The counted node with the order statistics, its <size> counts the copies
+    of the keys, so <rank> and <select> work as if the copies were different
+    nodes.
+    '''
+
+    __slots__ = ('count', )
+
+    COUNTED = True
+
+    def __init__(self, key, value):
+        super().__init__(key, value)
+        self.count = 1
+
+
+_KEYED_NODE_CLSES: Dict[Type[RBNode], Type[RBNode]] = {}
+
+
+def _keyed_node_cls(rb_node_cls: Type[RBNode]) -> Type[RBNode]:
+    '''
+    Return the subclass of <rb_node_cls> with a <sort_key> slot, which holds
+    the key normalized by the key function of the tree, so that <key> keeps
+    the original key. The subclasses are shared by all the trees, so the nodes
+    of their split and joined trees have the same class and null node.
+    '''
+    if rb_node_cls.KEYED:
+        return rb_node_cls
+
+    keyed_node_cls = _KEYED_NODE_CLSES.get(rb_node_cls)
+    if keyed_node_cls is None:
+        keyed_node_cls = type(f'Keyed{rb_node_cls.__name__}', (rb_node_cls, ),
+                              {'__slots__': ('sort_key', ), 'KEYED': True,
+                               '__module__': rb_node_cls.__module__})
+        keyed_node_cls.null_node().sort_key = None
+        _KEYED_NODE_CLSES[rb_node_cls] = keyed_node_cls
+    return keyed_node_cls
 
-class RedBlackTree(AlgorithmBase):
+
+class RedBlackTree(OrderedMapBase):
 
     RB_NODE_CLS: Type[RBNode]
     ND_NULL: RBNode
     ND_ROOT: RBNode
+    ND_FINGER: Optional[RBNode] = None
+    ND_MIN: Optional[RBNode] = None
+    ND_MAX: Optional[RBNode] = None
+
+    TRACED_METHODS = {
+        'insert': '_insert_traced',
+        'search': '_search_traced',
+        'delete': '_delete_traced'
+    }
 
     def __init__(self, rb_node_cls: Type[RBNode]=RBNode, allow_dup_keys=True,
-                 step_recorder: Optional[StepRecorder]=None):
+                 step_recorder: Optional[StepRecorder]=None,
+                 order_statistic=False, finger=False, multiset=False,
+                 interval=False, hash_index=False,
+                 key: Optional[Callable[[Any], Any]]=None):
 
         assert issubclass(rb_node_cls, RBNode)
         assert isinstance(allow_dup_keys, bool)
         assert step_recorder is None or isinstance(step_recorder, StepRecorder)
+        assert isinstance(order_statistic, bool)
+        assert isinstance(finger, bool)
+        assert isinstance(multiset, bool)
+        assert isinstance(interval, bool)
+        assert isinstance(hash_index, bool)
+        assert key is None or callable(key)
         super().__init__(step_recorder=step_recorder)
 
+        if key is not None and step_recorder is not None:
+            raise TypeError('The key function can not be used with the step '
+                            'recorder, which binds its own <insert>, '
+                            '<search> and <delete>')
+        if key is not None and (interval or
+                                issubclass(rb_node_cls, RBIntervalNode)):
+            raise TypeError('The key function can not be used by the '
+                            'interval tree, whose ends are compared with the '
+                            'keys')
+
+        if interval and not issubclass(rb_node_cls, RBIntervalNode):
+            if rb_node_cls is not RBNode:
+                raise TypeError(f'The node class {rb_node_cls.__name__} must '
+                                'be a subclass of RBIntervalNode to enable '
+                                'the interval tree')
+            rb_node_cls = RBIntervalNode
+
+        # The order statistics need the size of each subtree, which costs a
+        # walk from the changed node to the root on every insertion and
+        # deletion, so it is disabled by default.
+        if order_statistic and not issubclass(rb_node_cls, RBSizeNode):
+            if rb_node_cls is not RBNode:
+                raise TypeError(f'The node class {rb_node_cls.__name__} must '
+                                'be a subclass of RBSizeNode to enable the '
+                                'order statistics')
+            rb_node_cls = RBSizeNode
+
+        # In the multiset mode, inserting an existing key increases the count
+        # of its node rather than creating another node, so a hot key does not
+        # make the tree deeper. The value of the first insertion is kept.
+        if multiset and not rb_node_cls.COUNTED:
+            if rb_node_cls is RBNode:
+                rb_node_cls = RBCountNode
+            elif rb_node_cls is RBSizeNode:
+                rb_node_cls = RBCountSizeNode
+            else:
+                raise TypeError(f'The node class {rb_node_cls.__name__} must '
+                                'have the <count> slot to enable the multiset '
+                                'mode, see RBCountNode')
+
+        if key is not None:
+            rb_node_cls = _keyed_node_cls(rb_node_cls)
+
         self.allow_dup_keys = allow_dup_keys
+        self.order_statistic = issubclass(rb_node_cls, RBSizeNode)
+        self.interval = issubclass(rb_node_cls, RBIntervalNode)
+        self.multiset = rb_node_cls.COUNTED
+        assert allow_dup_keys or not self.multiset
 
         self.RB_NODE_CLS = rb_node_cls
-        self.ND_ROOT = self.ND_NULL = RBNode.new_null_node()
+        self.ND_ROOT = self.ND_NULL = rb_node_cls.null_node()
+        self.augmented = rb_node_cls.AUGMENTED
+
+        # The length counts the copies of the keys in the multiset mode. It
+        # may be unknown (None) after the tree is split or joined, then it is
+        # counted on demand.
+        self.length: Optional[int] = 0
+
+        # If <finger> is true, <search>, <insert> and <delete> start from the
+        # last accessed node <ND_FINGER> instead of the root, see <_climb>.
+        self.finger = finger
+
+        # The leftmost and rightmost nodes <ND_MIN> and <ND_MAX> are kept by
+        # <_link_leaf> and <_delete_node>, so that <min>, <max> and the
+        # priority queue methods need no walk, see <_reset_extremes> for the
+        # methods replacing the whole tree.
+
+        # The hash index maps each key to one of its nodes, so that <search>
+        # and the search of <delete> are a dict lookup rather than a walk of
+        # O(log n) comparisons, while the ordered queries still use the tree.
+        # It is kept with the extremes, and the keys must be hashable.
+        #
+        # For 1M shuffled int keys, it takes about 42 MB besides the 88 MB of
+        # the nodes. An exact search drops from about 2.5 us to 0.4 us, an
+        # insertion costs about 0.8 us more, and a deletion about the same.
+        self.hash_index: Optional[dict] = {} if hash_index else None
+
+        # If <key> is given, the keys passed in are normalized by it once, and
+        # the nodes are compared by their normalized <sort_key>, e.g.
+        # <pack_key> turns a tuple of strings into bytes, so that each
+        # comparison on the way down is a cheap one of two bytes rather than
+        # two tuples. The nodes still return their original <key>, and the
+        # hash index maps the normalized keys. See <_bind_key_function>.
+        self.key_function = key
+        if key is not None:
+            self._bind_key_function()
+
+    def __len__(self):
+        if self.length is None:
+            if self.order_statistic:
+                self.length = self.ND_ROOT.size
+            else:
+                self.length = sum(node.count for node in self.range())
+        return self.length
+
+    # The methods whose first argument is a key to search
+    KEYED_METHODS = ('search', 'delete', 'count', 'remove_one', 'remove_all',
+                     'floor', 'ceiling', 'rank', 'split')
+
+    def _bind_key_function(self):
+        # Like the traced methods of the step recorder, the methods
+        # normalizing their keys are bound to the instance, so the tree
+        # without a key function pays nothing for it. The methods call each
+        # other through the class, so a key is normalized only once.
+        cls = type(self)
+        key_function = self.key_function
+        rb_node_cls = self.RB_NODE_CLS
+
+        def _normalize(key):
+            return None if key is None else key_function(key)
+
+        def _bind(name):
+            method = getattr(cls, name)
+            setattr(self, name, lambda key, *args, **kwargs: method(
+                self, key_function(key), *args, **kwargs))
+
+        for name in self.KEYED_METHODS:
+            _bind(name)
+
+        def _insert(key, *args, **kwargs):
+            new_node = rb_node_cls(key, *args, **kwargs)
+            new_node.sort_key = key_function(key)
+            return cls._insert_node(self, new_node)
+
+        self.insert = _insert
+        self.range = lambda lo=None, hi=None, reverse=False: cls.range(
+            self, _normalize(lo), _normalize(hi), reverse)
+        self.count_range = lambda lo=None, hi=None: cls.count_range(
+            self, _normalize(lo), _normalize(hi))
+        self.search_many = lambda keys: cls.search_many(
+            self, [key_function(key) for key in self._tolist(keys)])
+
+    @classmethod
+    def from_sorted(cls, items: Iterable[Tuple[Any, Any]],
+                    **kwargs) -> 'RedBlackTree':
+        r'''
+        Build a tree from the (key, value) pairs sorted by key in linear time,
+        the other arguments are passed to the constructor.
+
+        The middle item of each range becomes the root of the subtree, so all
+        the levels are full except the deepest one. Then painting the deepest
+        level red and the others black makes it a valid red-black tree with no
+        rotation at all:
+
+                      4 [B]                      [B]: level 0 ~ d-1
+                     /     \
+                2 [B]       6 [B]
+                /   \       /   \
+            1 [B] 3 [B] 5 [B] 7 [B]
+             /
+          0 (R)                                  (R): level d
+        '''
+        tree = cls(**kwargs)
+        rb_node_cls = tree.RB_NODE_CLS
+        allow_dup_keys = tree.allow_dup_keys
+        multiset = tree.multiset
+        key_function = tree.key_function
+
+        nodes = []
+        previous_key = None
+        for key, value in items:
+            sort_key = key if key_function is None else key_function(key)
+            if nodes:
+                if sort_key < previous_key:
+                    raise RBTreeException.unsorted_keys(nodes[-1].key, key)
+                if sort_key == previous_key:
+                    if multiset:
+                        nodes[-1].count += 1
+                        continue
+                    if not allow_dup_keys:
+                        raise RBTreeException.insert_duplicated_key(key)
+            node = rb_node_cls(key, value)
+            if key_function is not None:
+                node.sort_key = sort_key
+            nodes.append(node)
+            previous_key = sort_key
+
+        length = len(nodes)
+        if length == 0:
+            return tree
+
+        tree.ND_ROOT = tree._link_sorted(nodes)
+        tree.ND_MIN, tree.ND_MAX = nodes[0], nodes[-1]
+        if tree.hash_index is not None:
+            for node in nodes:
+                tree.hash_index.setdefault(node.sort_key, node)
+        tree.length = sum(node.count for node in nodes) if multiset else length
+        return tree
+
+    def _link_sorted(self, nodes: list) -> RBNode:
+        # Link the sorted nodes into a detached subtree, see <from_sorted>
+        nil = self.ND_NULL
+        augmented = self.augmented
+        length = len(nodes)
+
+        # No red level is required when the tree is perfect
+        red_level = -1 if length & (length + 1) == 0 \
+            else length.bit_length() - 1
+
+        def _build(start, end, level, parent, direction):
+            if start > end:
+                return nil
+
+            middle = (start + end) // 2
+            node = nodes[middle]
+            node.parent = parent
+            node.from_direction = direction
+            node.color = RED if level == red_level else BLACK
+            node.left = _build(start, middle - 1, level + 1, node, LEFT)
+            node.right = _build(middle + 1, end, level + 1, node, RIGHT)
+            if augmented:
+                node.refresh()
+            return node
+
+        return _build(0, length - 1, 0, None, None)
+
+    @classmethod
+    def from_unsorted(cls, items: Iterable[Tuple[Any, Any]],
+                      **kwargs) -> 'RedBlackTree':
+        key_function = kwargs.get('key')
+        if key_function is None:
+            return cls.from_sorted(sorted(items, key=itemgetter(0)), **kwargs)
+        return cls.from_sorted(
+            sorted(items, key=lambda item: key_function(item[0])), **kwargs)
+
+    def _dump_flags(self) -> int:
+        return (DUMP_MULTISET if self.multiset else 0) | \
+               (DUMP_INTERVAL if self.interval else 0)
+
+    def dump(self, file: BinaryIO):
+        '''
+        Write the tree to the binary <file> in pre-order, see <DUMP_HEADER>
+        for the format. The colors and the shapes of the nodes are packed into
+        bits, and the keys and values are pickled.
+
+        Restore it by <load>, or search it without loading by
+        <<MappedRedBlackTree>>. Both unpickle the file, do not open the files
+        from untrusted sources.
+        '''
+        nil = self.ND_NULL
+        multiset = self.multiset
+        interval = self.interval
+
+        colors = bytearray()
+        shapes = bytearray()
+        rights = []
+        offsets = [0]
+        chunks = []
+        offset = 0
+
+        # The stack holds the nodes to visit and the index of the parent
+        # whose right child is the node, or -1 for a left child.
+        stack = [] if self.ND_ROOT is nil else [(self.ND_ROOT, -1)]
+        index = 0
+        while stack:
+            node, parent_index = stack.pop()
+            if parent_index >= 0:
+                rights[parent_index] = index
+
+            if index & 7 == 0:
+                colors.append(0)
+            colors[-1] |= node.color << (index & 7)
+            if index & 3 == 0:
+                shapes.append(0)
+            shapes[-1] |= ((node.left is not nil) |
+                           (node.right is not nil) << 1) << (2 * (index & 3))
+            rights.append(0)
+
+            extra = (node.value, )
+            if multiset:
+                extra += (node.count, )
+            if interval:
+                extra += (node.end, )
+            for chunk in (dumps(node.key, DUMP_PROTOCOL),
+                          dumps(extra, DUMP_PROTOCOL)):
+                chunks.append(chunk)
+                offset += len(chunk)
+            offsets.append(offset)
+
+            if node.right is not nil:
+                stack.append((node.right, index))
+            if node.left is not nil:
+                stack.append((node.left, -1))
+            index += 1
+
+        file.write(DUMP_HEADER.pack(DUMP_MAGIC, self._dump_flags(), index,
+                                    len(self)))
+        file.write(colors)
+        file.write(shapes)
+        file.write(_packed_array('I', rights))
+        file.write(_packed_array('Q', offsets))
+        for chunk in chunks:
+            file.write(chunk)
+
+    @classmethod
+    def load(cls, file: BinaryIO, **kwargs) -> 'RedBlackTree':
+        '''
+        Rebuild the tree written by <dump> from the binary <file> in linear
+        time, the nodes keep their colors so no rebalancing is needed. The
+        other arguments are passed to the constructor, and they must enable
+        the same multiset and interval modes as the dumped tree.
+
+        The keys and values are unpickled, which may run any code, do not
+        load the files from untrusted sources.
+        '''
+        tree = cls(**kwargs)
+        header = file.read(DUMP_HEADER.size)
+        if len(header) != DUMP_HEADER.size:
+            raise RBTreeException.bad_dump('the header is truncated')
+        magic, flags, n, length = DUMP_HEADER.unpack(header)
+        if magic != DUMP_MAGIC:
+            raise RBTreeException.bad_dump('it is not a dumped tree')
+        if flags != tree._dump_flags():
+            raise RBTreeException.bad_dump(
+                'the multiset or interval mode does not match')
+
+        sections = _dump_sections(n)
+        body = file.read(sections[4] - DUMP_HEADER.size)
+        if len(body) != sections[4] - DUMP_HEADER.size:
+            raise RBTreeException.bad_dump('the data is truncated')
+        offsets = _unpacked_array('Q', body[sections[3] - DUMP_HEADER.size:])
+        data = file.read(offsets[-1])
+        if len(data) != offsets[-1]:
+            raise RBTreeException.bad_dump('the data is truncated')
+        unpickler = Unpickler(BytesIO(data))
+
+        colors = body[:sections[1] - DUMP_HEADER.size]
+        shapes = body[sections[1] - DUMP_HEADER.size:
+                      sections[2] - DUMP_HEADER.size]
+        rb_node_cls = tree.RB_NODE_CLS
+        key_function = tree.key_function
+        multiset = tree.multiset
+        interval = tree.interval
+        nil = tree.ND_NULL
+
+        # The stack holds the empty child slots in pre-order, (parent,
+        # direction), the left one on the top.
+        nodes = []
+        stack = []
+        for index in range(n):
+            key = unpickler.load()
+            extra = unpickler.load()
+            node = rb_node_cls(key, extra[0])
+            if key_function is not None:
+                node.sort_key = key_function(key)
+            if multiset:
+                node.count = extra[1]
+            if interval:
+                node.end = node.max_end = extra[-1]
+            node.color = (colors[index >> 3] >> (index & 7)) & 1
+            node.left = node.right = nil
+
+            if stack:
+                parent, direction = stack.pop()
+                node.parent = parent
+                node.from_direction = direction
+                if direction == LEFT:
+                    parent.left = node
+                else:
+                    parent.right = node
+            nodes.append(node)
+
+            shape = shapes[index >> 2] >> (2 * (index & 3))
+            if shape & 2:
+                stack.append((node, RIGHT))
+            if shape & 1:
+                stack.append((node, LEFT))
+
+        if stack:
+            raise RBTreeException.bad_dump('the shapes are broken')
+
+        if tree.augmented:
+            # The descendants of a node follow it in pre-order
+            for node in reversed(nodes):
+                node.refresh()
+
+        if nodes:
+            tree.ND_ROOT = nodes[0]
+        tree.length = length
+        tree._reset_extremes()
+        return tree
+
+    def _rotate_left(self, node: RBNode):
+        #        |                       |
+        #      node                    pivot
+        #      /   \         ==>       /   \
+        #     a   pivot             node    c
+        #         /   \             /  \
+        #        b     c           a    b
+        nil = self.ND_NULL
+        pivot = node.right
+        parent = node.parent
+
+        node.right = pivot.left
+        if pivot.left is not nil:
+            pivot.left.parent = node
+            pivot.left.from_direction = RIGHT
+
+        pivot.parent = parent
+        pivot.from_direction = node.from_direction
+        if parent is None:
+            self.ND_ROOT = pivot
+        elif node.from_direction == LEFT:
+            parent.left = pivot
+        else:
+            parent.right = pivot
+
+        pivot.left = node
+        node.parent = pivot
+        node.from_direction = LEFT
+
+        if self.augmented:
+            node.refresh()
+            pivot.refresh()
+
+    def _rotate_right(self, node: RBNode):
+        #          |                   |
+        #        node                pivot
+        #        /   \     ==>       /   \
+        #     pivot   c             a    node
+        #     /   \                      /  \
+        #    a     b                    b    c
+        nil = self.ND_NULL
+        pivot = node.left
+        parent = node.parent
+
+        node.left = pivot.right
+        if pivot.right is not nil:
+            pivot.right.parent = node
+            pivot.right.from_direction = LEFT
+
+        pivot.parent = parent
+        pivot.from_direction = node.from_direction
+        if parent is None:
+            self.ND_ROOT = pivot
+        elif node.from_direction == LEFT:
+            parent.left = pivot
+        else:
+            parent.right = pivot
+
+        pivot.right = node
+        node.parent = pivot
+        node.from_direction = RIGHT
+
+        if self.augmented:
+            node.refresh()
+            pivot.refresh()
+
+    def _refresh_upward(self, node: Optional[RBNode]):
+        while node is not None:
+            node.refresh()
+            node = node.parent
+
+    def _replace_child(self, parent: Optional[RBNode], direction: int,
+                       node: RBNode):
+        if parent is None:
+            self.ND_ROOT = node
+        elif direction == LEFT:
+            parent.left = node
+        else:
+            parent.right = node
+
+        if node is not self.ND_NULL:
+            node.parent = parent
+            node.from_direction = direction
 
     def insert(self, *args, **kwargs) -> RBNode:
-        new_node = self.RB_NODE_CLS(*args, **kwargs)
+        return self._insert_node(self.RB_NODE_CLS(*args, **kwargs))
 
+    def _insert_node(self, new_node: RBNode,
+                     step_recorder: Optional[StepRecorder]=None) -> RBNode:
+        # The plain and the traced insertions share everything except the
+        # walk down, which is recorded step by step by <_insert_traced>.
         nil: RBNode = self.ND_NULL
-
-        grandparent: RBNode
-        parent: RBNode
-        uncle: RBNode
         myself: RBNode = self.ND_ROOT
 
-        # Insert a empty tree
-        if self.ND_ROOT is nil:
-            self.ND_ROOT = new_node
-            self.ND_ROOT.color = Color.BLACK
-            self.ND_ROOT.left = self.ND_NULL
-            self.ND_ROOT.right = self.ND_NULL
-
-            if self.enable_step_recorder:
-                self.step_recorder.init_tree()
+        new_node.left = new_node.right = nil
 
+        # Insert a empty tree
+        if myself is nil:
+            self.ND_ROOT = self.ND_MIN = self.ND_MAX = new_node
+            new_node.color = BLACK
+            if self.length is not None:
+                self.length += 1
+            if self.hash_index is not None:
+                self.hash_index[new_node.sort_key] = new_node
+            if self.finger:
+                self.ND_FINGER = new_node
+
+            if step_recorder is not None:
+                step_recorder.init_tree()
+                step_recorder.finish_operation('insert', 0, 0)
             return new_node
 
-        # Find the insert point
+        if step_recorder is None:
+            if self.finger and self.ND_FINGER is not None:
+                myself = self._climb(self.ND_FINGER, new_node.sort_key)
+            new_node = self._insert_below(new_node, myself)
+        else:
+            comparisons = 0
+            if self.finger and self.ND_FINGER is not None:
+                myself, comparisons = self._climb_traced(
+                    self.ND_FINGER, new_node.sort_key, step_recorder)
+            new_node = self._insert_below_traced(new_node, myself,
+                                                 step_recorder, comparisons)
+
+        if self.finger:
+            self.ND_FINGER = new_node
+        return new_node
+
+    def _insert_below(self, new_node: RBNode, myself: RBNode) -> RBNode:
+        # Find the insert point in the subtree of <myself>, which must be able
+        # to hold the key of <new_node>. Return the node holding the key, it
+        # is not <new_node> if the key is counted by an existing node.
+        nil = self.ND_NULL
+        multiset = self.multiset
+        unique = multiset or not self.allow_dup_keys
+        key = new_node.sort_key
         while True:
-            if new_node.key <= myself.key:
+            if key <= myself.sort_key:
 
-                if not self.allow_dup_keys and new_node.key == myself.key:
-                    raise RBTreeException.insert_duplicated_key(new_node.key)
+                if unique and key == myself.sort_key:
+                    if not multiset:
+                        raise RBTreeException.insert_duplicated_key(
+                            new_node.key)
+                    self._add_count(myself, 1)
+                    return myself
 
-                if myself.left is self.ND_NULL:
+                if myself.left is nil:
                     myself.left = new_node
-                    new_node.from_direction = Direction.LEFT
+                    new_node.from_direction = LEFT
                     break
                 myself = myself.left
 
-                if self.enable_step_recorder:
-                    self.step_recorder.search_node(myself.parent.key,
-                                                   Direction.LEFT)
+            else:
+                if myself.right is nil:
+                    myself.right = new_node
+                    new_node.from_direction = RIGHT
+                    break
+                myself = myself.right
+
+        self._link_leaf(new_node, myself)
+        return new_node
+
+    def _insert_traced(self, *args, **kwargs) -> RBNode:
+        return self._insert_node(self.RB_NODE_CLS(*args, **kwargs),
+                                 self.step_recorder)
+
+    def _insert_below_traced(self, new_node: RBNode, myself: RBNode,
+                             step_recorder: StepRecorder,
+                             comparisons: int=0) -> RBNode:
+        nil: RBNode = self.ND_NULL
+
+        # Find the insert point in the subtree of <myself>, see <_insert_below>,
+        # <comparisons> are the ones already made to reach <myself>
+        key = new_node.sort_key
+        depth = 0
+        while True:
+            depth += 1
+            comparisons += 1
+            if key <= myself.sort_key:
+
+                comparisons += 1
+                if key == myself.sort_key:
+                    if self.multiset:
+                        step_recorder.match_node(myself.key)
+                        step_recorder.finish_operation('insert', depth,
+                                                       comparisons)
+                        self._add_count(myself, 1)
+                        return myself
+                    if not self.allow_dup_keys:
+                        raise RBTreeException.insert_duplicated_key(
+                            new_node.key)
+
+                if myself.left is nil:
+                    myself.left = new_node
+                    new_node.from_direction = LEFT
+                    break
+
+                step_recorder.search_node(myself.key, Direction.LEFT)
+                myself = myself.left
 
             else:
-                if myself.right is self.ND_NULL:
+                if myself.right is nil:
                     myself.right = new_node
-                    new_node.from_direction = Direction.RIGHT
+                    new_node.from_direction = RIGHT
                     break
+
+                step_recorder.search_node(myself.key, Direction.RIGHT)
                 myself = myself.right
 
-                if self.enable_step_recorder:
-                    self.step_recorder.search_node(myself.parent.key,
-                                                   Direction.RIGHT)
+        step_recorder.search_node(
+            myself.key, Direction(new_node.from_direction), finished=True)
+        step_recorder.finish_operation('insert', depth, comparisons)
 
+        self._link_leaf(new_node, myself, step_recorder)
+        return new_node
 
-        if self.enable_step_recorder:
-            self.step_recorder.search_node(myself.key, new_node.from_direction,
-                                           finished=True)
+    def _link_leaf(self, new_node: RBNode, parent: RBNode,
+                   step_recorder: Optional[StepRecorder]=None):
+        # The <new_node> has been hung under <parent> as a leaf
+        new_node.parent = parent
+        new_node.color = RED
+        if self.length is not None:
+            self.length += 1
+
+        if new_node.from_direction == LEFT:
+            if parent is self.ND_MIN:
+                self.ND_MIN = new_node
+        elif parent is self.ND_MAX:
+            self.ND_MAX = new_node
+
+        if self.hash_index is not None:
+            self.hash_index.setdefault(new_node.sort_key, new_node)
+
+        # The augmented data must be correct before any rotation, and then the
+        # rotations keep it correct by themselves.
+        if self.augmented:
+            self._refresh_upward(parent)
+
+        self._fixup_after_insert(new_node, step_recorder)
+
+    def _add_count(self, node: RBNode, delta: int):
+        node.count += delta
+        if self.length is not None:
+            self.length += delta
+        if self.augmented:
+            self._refresh_upward(node)
+
+    def _fixup_after_insert(
+            self, myself: RBNode,
+            step_recorder: Optional[StepRecorder]=None) -> bool:
+        # Return True if the black height of the tree grows, which happens
+        # only when the red uncle case reaches the root.
 
-        parent = myself
-        myself = new_node
-        myself.color = Color.RED
-        myself.parent = parent
-        myself.left = myself.right = self.ND_NULL
+        grandparent: RBNode
+        parent: RBNode
+        uncle: RBNode
 
         # Fixup the structure of red-black tree
         while True:
             parent = myself.parent
-            if parent.color == Color.BLACK:
+            if parent.color == BLACK:
                 break
 
             grandparent = parent.parent
-            if parent.from_direction == Direction.LEFT:
+            if parent.from_direction == LEFT:
                 uncle = grandparent.right
             else:
                 uncle = grandparent.left
 
-            if self.enable_step_recorder:
-                self.step_recorder.fixup_tree(myself, parent, grandparent,
-                                              uncle)
+            if step_recorder is not None:
+                step_recorder.fixup_tree(myself, parent, grandparent, uncle)
 
             # ==> Uncle is black
             #
@@ -198,87 +1221,26 @@ class RedBlackTree(AlgorithmBase):
             #
             #             (LR)                   (LL)
             #
-            if uncle.color == Color.BLACK:
-                if myself.from_direction == parent.from_direction:
-                    parent.color = Color.BLACK
-                    grandparent.color = Color.RED
-
-                    if grandparent != self.ND_ROOT:
-                        parent.parent = grandparent.parent
-                        if grandparent.from_direction == Direction.LEFT:
-                            grandparent.parent.left = parent
-                            parent.from_direction = Direction.LEFT
-                        else:
-                            grandparent.parent.right = parent
-                            parent.from_direction = Direction.RIGHT
-                    else:
-                        self.ND_ROOT = parent
-                        parent.parent = None
-                        parent.from_direction = None
-                    grandparent.parent = parent
-
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = parent.right
-                        grandparent.left.parent = grandparent
-                        grandparent.left.from_direction = Direction.LEFT
-                        parent.right = grandparent
-                        grandparent.from_direction = Direction.RIGHT
+            if uncle.color == BLACK:
+                if myself.from_direction != parent.from_direction:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('insert', 'black-uncle-inner',
+                                                 2, 2)
+                    if myself.from_direction == RIGHT:
+                        self._rotate_left(parent)
                     else:
-                        grandparent.right = parent.left
-                        grandparent.right.parent = grandparent
-                        grandparent.right.from_direction = Direction.RIGHT
-                        parent.left = grandparent
-                        grandparent.from_direction = Direction.LEFT
-
+                        self._rotate_right(parent)
+                    parent = myself
+                elif step_recorder is not None:
+                    step_recorder.fixup_case('insert', 'black-uncle-outer',
+                                             1, 2)
+
+                parent.color = BLACK
+                grandparent.color = RED
+                if parent.from_direction == LEFT:
+                    self._rotate_right(grandparent)
                 else:
-                    myself.color = Color.BLACK
-                    grandparent.color = Color.RED
-
-                    if grandparent != self.ND_ROOT:
-                        myself.parent = grandparent.parent
-                        if grandparent.from_direction == Direction.LEFT:
-                            grandparent.parent.left = myself
-                            myself.from_direction = Direction.LEFT
-                        else:
-                            grandparent.parent.right = myself
-                            myself.from_direction = Direction.RIGHT
-                    else:
-                        self.ND_ROOT = myself
-                        myself.parent = None
-                        myself.from_direction = None
-                    grandparent.parent = myself
-
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = myself.right
-                        grandparent.left.parent = grandparent
-                        grandparent.left.from_direction = Direction.LEFT
-
-                        myself.right = grandparent
-                        grandparent.from_direction = Direction.RIGHT
-
-                        parent.right = myself.left
-                        parent.right.parent = parent
-                        parent.right.from_direction = Direction.RIGHT
-
-                        myself.left = parent
-                        parent.parent = myself
-                        parent.from_direction = Direction.LEFT
-
-                    else:
-                        grandparent.right = myself.left
-                        grandparent.right.parent = grandparent
-                        grandparent.right.from_direction = Direction.RIGHT
-
-                        myself.left = grandparent
-                        grandparent.from_direction = Direction.LEFT
-
-                        parent.left = myself.right
-                        parent.left.parent = parent
-                        parent.left.from_direction = Direction.LEFT
-
-                        myself.right = parent
-                        parent.parent = myself
-                        parent.from_direction = Direction.RIGHT
+                    self._rotate_left(grandparent)
 
                 break
 
@@ -301,88 +1263,271 @@ class RedBlackTree(AlgorithmBase):
             # 1<M<2<P<3<G<4<U<5           1<M<2<P<3<G<4<U<5
             #
             else:
-                parent.color = Color.BLACK
-                uncle.color = Color.BLACK
-
-                if grandparent == self.ND_ROOT:
-                    if self.enable_step_recorder:
-                        self.step_recorder.blacken_root_node()
-                    break
-
-                grandparent.color = Color.RED
+                parent.color = BLACK
+                uncle.color = BLACK
+
+                if grandparent is self.ND_ROOT:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('insert', 'red-uncle', 0, 2)
+                        step_recorder.blacken_root_node()
+                    return True
+
+                if step_recorder is not None:
+                    step_recorder.fixup_case('insert', 'red-uncle', 0, 3)
+                grandparent.color = RED
                 myself = grandparent
 
-        return new_node
+        return False
 
     def search(self, key) -> Optional[RBNode]:
+        if self.hash_index is not None:
+            return self.hash_index.get(key)
+        if self.finger:
+            return self._search_finger(key)
 
+        nil = self.ND_NULL
         nd_current = self.ND_ROOT
-        while True:
-            if nd_current == self.ND_NULL:
-
-                if self.enable_step_recorder:
-                    self.step_recorder.unmatch_node()
+        while nd_current is not nil:
+            if key < nd_current.sort_key:
+                nd_current = nd_current.left
+            elif key > nd_current.sort_key:
+                nd_current = nd_current.right
+            else:
+                return nd_current
 
-                return None
+        return None
 
-            if key < nd_current.key:
+    def _search_finger(self, key) -> Optional[RBNode]:
+        nil = self.ND_NULL
+        nd_current = self.ND_FINGER
+        if nd_current is None:
+            nd_current = self.ND_ROOT
+        elif key == nd_current.sort_key:
+            return nd_current
+        else:
+            nd_current = self._climb(nd_current, key)
+
+        # Keep the finger on the last node visited even if the key is not
+        # found, the next key is likely to be around it.
+        nd_last = None
+        while nd_current is not nil:
+            nd_last = nd_current
+            if key < nd_current.sort_key:
+                nd_current = nd_current.left
+            elif key > nd_current.sort_key:
+                nd_current = nd_current.right
+            else:
+                break
 
-                if self.enable_step_recorder:
-                    self.step_recorder.search_node(nd_current.key,
-                                                   Direction.LEFT)
+        if nd_last is not None:
+            self.ND_FINGER = nd_last
+        return None if nd_current is nil else nd_current
+
+    def _walk_traced(self, operation: str, key) -> Optional[RBNode]:
+        # The walk of <search> and <delete> recorded step by step, it looks up
+        # the hash index, or goes down from the root or from the node the
+        # finger climbs to, and moves the finger like <_search_finger>.
+        nil = self.ND_NULL
+        step_recorder = self.step_recorder
+        if self.hash_index is not None:
+            nd_matched = self.hash_index.get(key)
+            if nd_matched is None:
+                step_recorder.unmatch_node()
+            else:
+                step_recorder.match_node(nd_matched.key)
+            step_recorder.finish_operation(operation, 0, 0)
+            return nd_matched
 
-                nd_current = nd_current.left
-            elif key > nd_current.key:
+        nd_current = self.ND_ROOT
+        depth = comparisons = 0
+        if self.finger and self.ND_FINGER is not None:
+            nd_current = self.ND_FINGER
+            if key == nd_current.sort_key:
+                step_recorder.match_node(nd_current.key)
+                step_recorder.finish_operation(operation, 1, 1)
+                return nd_current
+            nd_current, comparisons = self._climb_traced(
+                nd_current, key, step_recorder)
+            comparisons += 1
 
-                if self.enable_step_recorder:
-                    self.step_recorder.search_node(nd_current.key,
-                                                   Direction.RIGHT)
+        nd_last = None
+        while True:
+            if nd_current is nil:
+                step_recorder.unmatch_node()
+                step_recorder.finish_operation(operation, depth, comparisons)
+                break
 
+            depth += 1
+            nd_last = nd_current
+            if key < nd_current.sort_key:
+                comparisons += 1
+                step_recorder.search_node(nd_current.key, Direction.LEFT)
+                nd_current = nd_current.left
+            elif key > nd_current.sort_key:
+                comparisons += 2
+                step_recorder.search_node(nd_current.key, Direction.RIGHT)
                 nd_current = nd_current.right
             else:
+                comparisons += 2
+                step_recorder.match_node(nd_current.key)
+                step_recorder.finish_operation(operation, depth, comparisons)
+                break
 
-                if self.enable_step_recorder:
-                    self.step_recorder.match_node(nd_current.key)
+        if self.finger and nd_last is not None:
+            self.ND_FINGER = nd_last
+        return None if nd_current is nil else nd_current
 
-                return nd_current
+    def _search_traced(self, key) -> Optional[RBNode]:
+        return self._walk_traced('search', key)
 
     def delete(self, key) -> bool:
+        if self.hash_index is not None or self.finger:
+            nd_matched = type(self).search(self, key)
+            if nd_matched is None:
+                return False
 
-        nil: RBNode = self.ND_NULL
+            self._delete_node(nd_matched)
+            return True
 
-        grandparent: RBNode
-        parent: RBNode
-        sibling: RBNode
-        nephew_left: RBNode
-        nephew_right: RBNode
+        nil: RBNode = self.ND_NULL
         myself: RBNode = self.ND_ROOT
 
-        nd_matched: RBNode
-
         # ==> Navigate to the node to be deleted
         while True:
-            if myself == nil:
+            if myself is nil:
                 return False
 
-            if key < myself.key:
+            if key < myself.sort_key:
                 myself = myself.left
-            elif key > myself.key:
+            elif key > myself.sort_key:
                 myself = myself.right
             else:
                 break
 
-        nd_matched = myself
+        self._delete_node(myself)
+        return True
+
+    def _delete_traced(self, key) -> bool:
+        nd_matched = self._walk_traced('delete', key)
+        if nd_matched is None:
+            return False
+
+        self._delete_node(nd_matched, self.step_recorder)
+        return True
+
+    # In the multiset mode, <delete> removes the node of a key with all its
+    # copies, and the following methods handle the copies one by one. They
+    # also work on the other trees, where each node holds a single copy.
+
+    def count(self, key) -> int:
+        '''
+        Return the number of copies of <key> in the tree.
+        '''
+        count = 0
+        node = type(self).ceiling(self, key)
+        while node is not None and node.sort_key == key:
+            count += node.count
+            node = self.successor(node)
+        return count
+
+    def remove_one(self, key) -> bool:
+        '''
+        Remove one copy of <key>, return False if the key is not found.
+        '''
+        return self._pop(type(self).search(self, key)) is not None
+
+    def remove_all(self, key) -> int:
+        '''
+        Remove all the copies of <key>, return the number of removed copies.
+        '''
+        removed = 0
+        while True:
+            node = type(self).search(self, key)
+            if node is None:
+                return removed
+
+            removed += node.count
+            self._delete_node(node)
+
+    def delete_node(self, node: RBNode):
+        '''
+        Delete a node got from this tree with all its copies, it skips the
+        search of <delete>.
+        '''
+        assert node.parent is not None or node is self.ND_ROOT
+        self._delete_node(node)
+
+    # The priority queue interface, the extremes are cached so that peeking
+    # is O(1), and popping only pays for the rebalancing.
+
+    def peek_min(self) -> Optional[RBNode]:
+        return self.ND_MIN
+
+    def peek_max(self) -> Optional[RBNode]:
+        return self.ND_MAX
+
+    def _pop(self, node: Optional[RBNode]) -> Optional[RBNode]:
+        # Pop one copy of the key of <node>
+        if node is None:
+            return None
+
+        if node.count > 1:
+            self._add_count(node, -1)
+        else:
+            self._delete_node(node)
+        return node
+
+    def pop_min(self) -> Optional[RBNode]:
+        '''
+        Remove one copy of the smallest key and return its node, or None if
+        the tree is empty.
+        '''
+        return self._pop(self.ND_MIN)
+
+    def pop_max(self) -> Optional[RBNode]:
+        '''
+        Remove one copy of the largest key and return its node, or None if the
+        tree is empty.
+        '''
+        return self._pop(self.ND_MAX)
+
+    def _delete_node(self, nd_matched: RBNode,
+                     step_recorder: Optional[StepRecorder]=None):
+
+        nil: RBNode = self.ND_NULL
+
+        parent: Optional[RBNode]
+        sibling: RBNode
+        nephew_left: RBNode
+        nephew_right: RBNode
+        myself: RBNode
+
+        # The extremes must be moved before the links are changed
+        if nd_matched is self.ND_MIN:
+            self.ND_MIN = self.successor(nd_matched)
+        if nd_matched is self.ND_MAX:
+            self.ND_MAX = self.predecessor(nd_matched)
+
+        # So is the hash index, the nodes of a duplicated key are adjacent
+        hash_index = self.hash_index
+        if hash_index is not None and \
+                hash_index.get(nd_matched.sort_key) is nd_matched:
+            for nd_other in (self.predecessor(nd_matched),
+                             self.successor(nd_matched)):
+                if nd_other is not None and \
+                        nd_other.sort_key == nd_matched.sort_key:
+                    hash_index[nd_matched.sort_key] = nd_other
+                    break
+            else:
+                del hash_index[nd_matched.sort_key]
 
         # ==> Find a replacement node
-        if nd_matched.left != nil:
+        if nd_matched.left is not nil and nd_matched.right is not nil:
             myself = nd_matched.left
-            while True:
-                if myself.right == nil:
-                    break
+            while myself.right is not nil:
                 myself = myself.right
-
-            nd_matched.key = myself.key
-            nd_matched.value = myself.value
+        else:
+            myself = nd_matched
 
         # ==> Delete node
         # After the previous replacement operation, the target node may have
@@ -396,7 +1541,7 @@ class RedBlackTree(AlgorithmBase):
         #          o---o                             o---o
         #
         #
-        #   3. Black node with a right red leaf node
+        #   3. Black node with a red leaf child
         #
         #            |
         #          +---+
@@ -472,213 +1617,1115 @@ class RedBlackTree(AlgorithmBase):
         #                    c   d                         c   d
         #
         #          a<el<b<S<c<es<d                  a<el<b<S<c<es<d
-        if myself.color == Color.RED:
-            if myself.from_direction == Direction.LEFT:
-                myself.parent.left = nil
+        child = myself.left if myself.left is not nil else myself.right
+        parent = myself.parent
+        direction = myself.from_direction
+        color = myself.color
+        self._replace_child(parent, direction, child)
+
+        # The replacement node takes the place of the matched node instead of
+        # copying its key and value, so that the nodes held by the callers are
+        # always bound to the same key.
+        if myself is not nd_matched:
+            if parent is nd_matched:
+                parent = myself
+
+            myself.color = nd_matched.color
+            myself.left = nd_matched.left
+            myself.right = nd_matched.right
+            if myself.left is not nil:
+                myself.left.parent = myself
+            if myself.right is not nil:
+                myself.right.parent = myself
+            self._replace_child(nd_matched.parent, nd_matched.from_direction,
+                                myself)
+
+        nd_matched.parent = nd_matched.from_direction = None
+        nd_matched.left = nd_matched.right = nil
+        if self.length is not None:
+            self.length -= nd_matched.count
+
+        # Move the finger to a neighbor of the deleted node
+        if self.finger:
+            if myself is not nd_matched:
+                self.ND_FINGER = myself
+            elif parent is not None:
+                self.ND_FINGER = parent
             else:
-                myself.parent.right = nil
-            return True
+                self.ND_FINGER = None if child is nil else child
 
-        nd_right = myself.right
-        if nd_right.color == Color.RED:
-            myself.key = nd_right.key
-            myself.value = nd_right.value
-            myself.right = nil
-            return True
+        if self.augmented:
+            self._refresh_upward(parent)
 
-        if myself == self.ND_ROOT:
-            self.ND_ROOT = self.ND_NULL
+        if color == RED:
+            return
 
-        nd_delete = myself
-        while True:
-            parent = myself.parent
-            grandparent = parent.parent
-            if myself.from_direction == Direction.LEFT:
+        if child.color == RED:
+            if step_recorder is not None:
+                step_recorder.fixup_case('delete', 'red-child', 0, 1)
+            child.color = BLACK
+            return
+
+        while parent is not None:
+            if direction == LEFT:
                 sibling = parent.right
+                if sibling.color == RED:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('delete', 'red-sibling', 1, 2)
+                    sibling.color = BLACK
+                    parent.color = RED
+                    self._rotate_left(parent)
+                    sibling = parent.right
+
+                nephew_left = sibling.left
+                nephew_right = sibling.right
+                if nephew_left.color == BLACK and nephew_right.color == BLACK:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case(
+                            'delete', 'black-nephews', 0,
+                            2 if parent.color == RED else 1)
+                    sibling.color = RED
+                    if parent.color == RED:
+                        parent.color = BLACK
+                        break
+
+                    direction = parent.from_direction
+                    parent = parent.parent
+                    continue
+
+                if nephew_right.color == BLACK:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('delete', 'red-nephew-inner',
+                                                 1, 2)
+                    nephew_left.color = BLACK
+                    sibling.color = RED
+                    self._rotate_right(sibling)
+                    nephew_right = sibling
+                    sibling = nephew_left
+
+                if step_recorder is not None:
+                    step_recorder.fixup_case('delete', 'red-nephew-outer', 1, 3)
+                sibling.color = parent.color
+                parent.color = BLACK
+                nephew_right.color = BLACK
+                self._rotate_left(parent)
+
             else:
                 sibling = parent.left
-            nephew_left = sibling.left
-            nephew_right = sibling.right
+                if sibling.color == RED:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('delete', 'red-sibling', 1, 2)
+                    sibling.color = BLACK
+                    parent.color = RED
+                    self._rotate_right(parent)
+                    sibling = parent.left
+
+                nephew_left = sibling.left
+                nephew_right = sibling.right
+                if nephew_left.color == BLACK and nephew_right.color == BLACK:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case(
+                            'delete', 'black-nephews', 0,
+                            2 if parent.color == RED else 1)
+                    sibling.color = RED
+                    if parent.color == RED:
+                        parent.color = BLACK
+                        break
+
+                    direction = parent.from_direction
+                    parent = parent.parent
+                    continue
+
+                if nephew_left.color == BLACK:
+                    if step_recorder is not None:
+                        step_recorder.fixup_case('delete', 'red-nephew-inner',
+                                                 1, 2)
+                    nephew_right.color = BLACK
+                    sibling.color = RED
+                    self._rotate_left(sibling)
+                    nephew_left = sibling
+                    sibling = nephew_right
+
+                if step_recorder is not None:
+                    step_recorder.fixup_case('delete', 'red-nephew-outer', 1, 3)
+                sibling.color = parent.color
+                parent.color = BLACK
+                nephew_left.color = BLACK
+                self._rotate_right(parent)
 
-            if sibling.color == Color.RED:
-                sibling.color = Color.BLACK
-                parent.color = Color.RED
+            break
 
-                sibling.parent = grandparent
-                if parent == self.ND_ROOT:
-                    self.ND_ROOT = sibling
-                else:
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = sibling
-                        sibling.from_direction = Direction.LEFT
-                    else:
-                        grandparent.right = sibling
-                        sibling.from_direction = Direction.RIGHT
+    # ==> Batch operations
+    #
+    # The keys of a batch are sorted first, then each key starts from the node
+    # where the previous key stopped rather than the root. It climbs up until
+    # the subtree must contain the key and then goes down as usual, so the
+    # common part of the paths of two adjacent keys is only walked once.
+    #
+    #                        [ ]  <-- climb up to here
+    #                       /   \
+    #                     [ ]   [ ]
+    #                    /   \     \
+    #      key1 -->    [x]   [ ]  <-- key2 goes down from here
+    #
+    # A node which is the left child of its parent holds the keys less than
+    # its parent's, and a right child holds the same keys as its parent, so it
+    # stops climbing at the first left child whose parent's key is greater
+    # than the key.
+
+    @staticmethod
+    def _tolist(items):
+        # Accept the NumPy arrays without importing NumPy
+        return items.tolist() if hasattr(items, 'tolist') else items
+
+    @staticmethod
+    def _sort_batch(keys) -> list:
+        # Accept the NumPy arrays without importing NumPy, <tolist> converts
+        # the items to python scalars which are compared much faster.
+        if hasattr(keys, 'tolist'):
+            keys = keys.tolist()
+        return sorted(enumerate(keys), key=itemgetter(1))
+
+    def _climb(self, node: RBNode, key) -> RBNode:
+        # Climb up from <node> until its subtree must contain <key>, and then
+        # the caller goes down from there. Only the bound of the subtree facing
+        # <key> needs to be checked, e.g. if <key> is greater than the key of
+        # <node>, the upper bound is the key of the first ancestor which holds
+        # <node> in its left subtree. Climbing through a right child does not
+        # change the upper bound, so the node below such a chain is returned
+        # rather than the top of it, for example the rightmost node itself is
+        # returned for a key greater than all.
+        start = node
+        if key < node.sort_key:
+            while node.parent is not None:
+                if node.from_direction == RIGHT:
+                    if node.parent.sort_key < key:
+                        break
+                    start = node.parent
+                node = node.parent
+        else:
+            while node.parent is not None:
+                if node.from_direction == LEFT:
+                    if key < node.parent.sort_key:
+                        break
+                    start = node.parent
+                node = node.parent
+        return start
+
+    def _climb_traced(self, node: RBNode, key,
+                      step_recorder: StepRecorder) -> Tuple[RBNode, int]:
+        # <_climb> recorded step by step, also return the comparisons made
+        start = node
+        comparisons = 1
+        if key < node.sort_key:
+            while node.parent is not None:
+                if node.from_direction == RIGHT:
+                    comparisons += 1
+                    if node.parent.sort_key < key:
+                        break
+                    start = node.parent
+                node = node.parent
+                step_recorder.climb_node(node.key)
+        else:
+            while node.parent is not None:
+                if node.from_direction == LEFT:
+                    comparisons += 1
+                    if key < node.parent.sort_key:
+                        break
+                    start = node.parent
+                node = node.parent
+                step_recorder.climb_node(node.key)
+        return start, comparisons
+
+    def search_many(self, keys) -> list:
+        '''
+        Search a batch of keys at a time, return the matched nodes (or None)
+        in the same order of <keys>, which could be a sequence or an array.
+        '''
+        nil = self.ND_NULL
+        if self.hash_index is not None:
+            if hasattr(keys, 'tolist'):
+                keys = keys.tolist()
+            return [self.hash_index.get(key) for key in keys]
+
+        results = [None] * len(keys)
+        if self.ND_ROOT is nil:
+            return results
 
-                if myself.from_direction == Direction.LEFT:
-                    parent.right = nephew_left
-                    nephew_left.from_direction = Direction.RIGHT
-                    nephew_left.parent = parent
+        nd_start = self.ND_ROOT
+        previous_key = nd_matched = None
+        for index, key in self._sort_batch(keys):
+            if previous_key is not None and key == previous_key:
+                results[index] = nd_matched
+                continue
 
-                    sibling.left = parent
-                    parent.from_direction = Direction.LEFT
-                    parent.parent = sibling
-                else:
-                    parent.left = nephew_right
-                    nephew_right.from_direction = Direction.LEFT
-                    nephew_right.parent = parent
+            nd_current = self._climb(nd_start, key)
+            while True:
+                if nd_current is nil:
+                    nd_matched = None
+                    break
 
-                    sibling.right = parent
-                    parent.from_direction = Direction.RIGHT
-                    parent.parent = sibling
+                nd_start = nd_current
+                if key < nd_current.sort_key:
+                    nd_current = nd_current.left
+                elif key > nd_current.sort_key:
+                    nd_current = nd_current.right
+                else:
+                    nd_matched = nd_current
+                    break
 
+            results[index] = nd_matched
+            previous_key = key
+
+        return results
+
+    def insert_many(self, items) -> list:
+        '''
+        Insert a batch of (key, value) pairs, return the new nodes in the same
+        order of <items>. The pairs inserted before a duplicated key is found
+        stay in the tree.
+        '''
+        nil = self.ND_NULL
+        rb_node_cls = self.RB_NODE_CLS
+        key_function = self.key_function
+        if hasattr(items, 'tolist'):
+            items = items.tolist()
+
+        sort_keys = [item[0] for item in items]
+        if key_function is not None:
+            sort_keys = [key_function(key) for key in sort_keys]
+
+        nodes = [None] * len(items)
+        nd_last = None
+        for index, sort_key in self._sort_batch(sort_keys):
+            new_node = rb_node_cls(items[index][0], items[index][1])
+            if key_function is not None:
+                new_node.sort_key = sort_key
+            if nd_last is None:
+                nodes[index] = nd_last = self._insert_node(new_node)
                 continue
 
-            if nephew_left.color == nephew_right.color == Color.BLACK:
-                sibling.color = Color.RED
+            new_node.left = new_node.right = nil
+            nodes[index] = nd_last = self._insert_below(
+                new_node, self._climb(nd_last, sort_key))
+
+        return nodes
+
+    # The following methods walk through the tree by the <parent> links
+    # instead of a stack, so they only need constant extra memory. The
+    # generators are lazy, and the tree must not be modified while iterating.
+
+    def _leftmost(self, node: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        while node.left is not nil:
+            node = node.left
+        return node
+
+    def _rightmost(self, node: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        while node.right is not nil:
+            node = node.right
+        return node
+
+    def successor(self, node: RBNode) -> Optional[RBNode]:
+        if node.right is not self.ND_NULL:
+            return self._leftmost(node.right)
+
+        while node.from_direction == RIGHT:
+            node = node.parent
+        return node.parent
+
+    def predecessor(self, node: RBNode) -> Optional[RBNode]:
+        if node.left is not self.ND_NULL:
+            return self._rightmost(node.left)
+
+        while node.from_direction == LEFT:
+            node = node.parent
+        return node.parent
+
+    def _reset_extremes(self):
+        # Find the extremes again and rebuild the hash index after the whole
+        # tree is replaced
+        if self.ND_ROOT is self.ND_NULL:
+            self.ND_MIN = self.ND_MAX = None
+        else:
+            self.ND_MIN = self._leftmost(self.ND_ROOT)
+            self.ND_MAX = self._rightmost(self.ND_ROOT)
+
+        if self.hash_index is not None:
+            self.hash_index = {}
+            for node in self.range():
+                self.hash_index.setdefault(node.sort_key, node)
+
+    def min(self) -> Optional[RBNode]:
+        return self.ND_MIN
+
+    def max(self) -> Optional[RBNode]:
+        return self.ND_MAX
+
+    def floor(self, key) -> Optional[RBNode]:
+        '''
+        Return the last node whose key is less than or equal to <key>.
+        '''
+        nil = self.ND_NULL
+        nd_found = None
+        nd_current = self.ND_ROOT
+        while nd_current is not nil:
+            if nd_current.sort_key <= key:
+                nd_found = nd_current
+                nd_current = nd_current.right
+            else:
+                nd_current = nd_current.left
+        return nd_found
+
+    def ceiling(self, key) -> Optional[RBNode]:
+        '''
+        Return the first node whose key is greater than or equal to <key>.
+        '''
+        nil = self.ND_NULL
+        nd_found = None
+        nd_current = self.ND_ROOT
+        while nd_current is not nil:
+            if nd_current.sort_key >= key:
+                nd_found = nd_current
+                nd_current = nd_current.left
+            else:
+                nd_current = nd_current.right
+        return nd_found
 
-                if parent.color == Color.RED:
-                    parent.color = Color.BLACK
+    def _lower(self, key) -> Optional[RBNode]:
+        # The last node whose key is strictly less than <key>
+        nil = self.ND_NULL
+        nd_found = None
+        nd_current = self.ND_ROOT
+        while nd_current is not nil:
+            if nd_current.sort_key < key:
+                nd_found = nd_current
+                nd_current = nd_current.right
+            else:
+                nd_current = nd_current.left
+        return nd_found
+
+    def range(self, lo=None, hi=None, reverse=False) -> Iterator[RBNode]:
+        '''
+        Yield the nodes whose key is in [lo, hi) in order, <None> means no
+        limit. It costs O(log n) to locate the first node and then O(1)
+        amortized for each of the following nodes.
+        '''
+        if not reverse:
+            if lo is None:
+                node = self.min()
+            else:
+                node = type(self).ceiling(self, lo)
+
+            while node is not None:
+                if hi is not None and not node.sort_key < hi:
                     break
+                yield node
+                node = self.successor(node)
 
-                if parent == self.ND_ROOT:
+        else:
+            if hi is None:
+                node = self.max()
+            else:
+                node = self._lower(hi)
+
+            while node is not None:
+                if lo is not None and node.sort_key < lo:
                     break
+                yield node
+                node = self.predecessor(node)
 
-                myself = parent
-                continue
+    def _check_order_statistic(self, feature: str):
+        if not self.order_statistic:
+            raise RBTreeException.augmentation_disabled(feature, RBSizeNode)
 
-            #         |                |
-            #         *                *
-            #        / \              / \
-            #  x--> B   B            B   B <--x
-            #          / \          / \
-            #         *   R        R   *
-            if (
-                    myself.from_direction == Direction.LEFT and \
-                    nephew_right.color == Color.RED
-               ) or \
-               (
-                    myself.from_direction == Direction.RIGHT and \
-                    nephew_left.color == Color.RED
-               ):
-                sibling.color = parent.color
-                parent.color = Color.BLACK
+    def rank(self, key) -> int:
+        '''
+        Return the number of the keys which are less than <key>.
+        '''
+        self._check_order_statistic('rank')
 
-                sibling.parent = grandparent
-                if parent == self.ND_ROOT:
-                    self.ND_ROOT = sibling
-                else:
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = sibling
-                        sibling.from_direction = Direction.LEFT
-                    else:
-                        grandparent.right = sibling
-                        sibling.from_direction = Direction.RIGHT
+        nil = self.ND_NULL
+        rank = 0
+        nd_current = self.ND_ROOT
+        while nd_current is not nil:
+            if key <= nd_current.sort_key:
+                nd_current = nd_current.left
+            else:
+                rank += nd_current.left.size + nd_current.count
+                nd_current = nd_current.right
+        return rank
 
-                if myself.from_direction == Direction.LEFT:
-                    parent.right = nephew_left
-                    nephew_left.from_direction = Direction.RIGHT
-                    nephew_left.parent = parent
+    def select(self, index: int) -> RBNode:
+        '''
+        Return the node with the <index>-th smallest key (starting from 0),
+        negative index counts from the largest key like a list.
+        '''
+        self._check_order_statistic('select')
 
-                    sibling.left = parent
-                    parent.from_direction = Direction.LEFT
-                    parent.parent = sibling
+        length = self.ND_ROOT.size
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise RBTreeException.index_out_of_range(index, length)
 
-                    nephew_right.color = Color.BLACK
-                else:
-                    parent.left = nephew_right
-                    nephew_right.from_direction = Direction.LEFT
-                    nephew_right.parent = parent
-
-                    sibling.right = parent
-                    parent.from_direction = Direction.RIGHT
-                    parent.parent = sibling
-
-                    nephew_left.color = Color.BLACK
-
-            #         |                |
-            #         *                *
-            #        / \              / \
-            #  x--> B   B            B   B <--x
-            #          / \          / \
-            #         R   B        B   R
-
-            if myself.from_direction == Direction.LEFT:
-                nephew_left.color = parent.color
-                parent.color = Color.BLACK
-
-                nephew_left.parent = grandparent
-                if parent == self.ND_ROOT:
-                    self.ND_ROOT = nephew_left
-                else:
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = nephew_left
-                        nephew_left.from_direction = Direction.LEFT
-                    else:
-                        grandparent.right = nephew_left
-                        nephew_left.from_direction = Direction.RIGHT
+        nd_current = self.ND_ROOT
+        while True:
+            size_left = nd_current.left.size
+            if index < size_left:
+                nd_current = nd_current.left
+            elif index >= size_left + nd_current.count:
+                index -= size_left + nd_current.count
+                nd_current = nd_current.right
+            else:
+                return nd_current
 
-                parent.right = nephew_left.left
-                nephew_left.left.from_direction = Direction.RIGHT
-                nephew_left.left.parent = parent
+    def count_range(self, lo=None, hi=None) -> int:
+        '''
+        Return the number of the keys in [lo, hi), <None> means no limit.
+        '''
+        self._check_order_statistic('count_range')
+
+        count_hi = self.ND_ROOT.size if hi is None \
+            else type(self).rank(self, hi)
+        count_lo = 0 if lo is None else type(self).rank(self, lo)
+        return max(count_hi - count_lo, 0)
+
+    def overlapping(self, a, b) -> Iterator[RBIntervalNode]:
+        '''
+        Yield the nodes whose interval [key, end] overlaps [a, b] in the order
+        of their keys. A subtree is skipped if its <max_end> is less than <a>,
+        and it stops at the first key greater than <b>, so the cost is
+        O(log n) plus O(log n) at most for each yielded node. Unlike <range>,
+        the pending nodes are kept in a stack, which holds O(log n) nodes.
+
+        The generator is lazy, the tree must not be modified while iterating.
+        '''
+        if not self.interval:
+            raise RBTreeException.augmentation_disabled('overlapping',
+                                                        RBIntervalNode)
+
+        nil = self.ND_NULL
+        stack = []
+        node = self.ND_ROOT
+        while True:
+            while node is not nil and node.max_end >= a:
+                stack.append(node)
+                node = node.left
 
-                nephew_left.left = parent
-                parent.from_direction = Direction.LEFT
-                parent.parent = nephew_left
+            if not stack:
+                return
 
-                sibling.left = nephew_left.right
-                nephew_left.right.from_direction = Direction.LEFT
-                nephew_left.right.parent = sibling
+            node = stack.pop()
+            if node.key > b:
+                return
+            if node.end >= a:
+                yield node
+            node = node.right
 
-                nephew_left.right = sibling
-                sibling.from_direction = Direction.RIGHT
-                sibling.parent = nephew_left
+    def in_order_traversal(self, reverse=False) -> Iterator[RBNode]:
+        return self.range(reverse=reverse)
 
-            else:
-                nephew_right.color = parent.color
-                parent.color = Color.BLACK
+    def __iter__(self) -> Iterator[RBNode]:
+        return self.range()
 
-                nephew_right.parent = grandparent
-                if parent == self.ND_ROOT:
-                    self.ND_ROOT = nephew_right
-                else:
-                    if parent.from_direction == Direction.LEFT:
-                        grandparent.left = nephew_right
-                        nephew_right.from_direction = Direction.LEFT
-                    else:
-                        grandparent.right = nephew_right
-                        nephew_right.from_direction = Direction.RIGHT
+    def __reversed__(self) -> Iterator[RBNode]:
+        return self.range(reverse=True)
 
-                parent.left = nephew_right.right
-                nephew_right.right.from_direction = Direction.LEFT
-                nephew_right.right.parent = parent
+    def pre_order_traversal(self) -> Iterator[RBNode]:
+        nil = self.ND_NULL
+        node = self.ND_ROOT
+        if node is nil:
+            return
 
-                nephew_right.right = parent
-                parent.from_direction = Direction.RIGHT
-                parent.parent = nephew_right
+        while True:
+            yield node
 
-                sibling.right = nephew_right.left
-                nephew_right.left.from_direction = Direction.RIGHT
-                nephew_right.left.parent = sibling
+            if node.left is not nil:
+                node = node.left
+                continue
+            if node.right is not nil:
+                node = node.right
+                continue
 
-                nephew_right.left = sibling
-                sibling.from_direction = Direction.LEFT
-                sibling.parent = nephew_right
+            # Go back until a right subtree which has not been visited
+            while True:
+                if node.parent is None:
+                    return
+                if node.from_direction == LEFT and \
+                        node.parent.right is not nil:
+                    node = node.parent.right
+                    break
+                node = node.parent
 
-            break
+    def post_order_traversal(self) -> Iterator[RBNode]:
+        nil = self.ND_NULL
 
-        if nd_delete.from_direction == Direction.LEFT:
-            nd_delete.parent.left = self.ND_NULL
-        else:
-            nd_delete.parent.right = self.ND_NULL
+        def _first_leaf(node):
+            while True:
+                if node.left is not nil:
+                    node = node.left
+                elif node.right is not nil:
+                    node = node.right
+                else:
+                    return node
 
-        return True
+        if self.ND_ROOT is nil:
+            return
 
-    def pre_order_traversal(self):
-        ...
+        node = _first_leaf(self.ND_ROOT)
+        while True:
+            yield node
 
-    def in_order_traversal(self):
-        ...
+            parent = node.parent
+            if parent is None:
+                return
+            if node.from_direction == LEFT and parent.right is not nil:
+                node = _first_leaf(parent.right)
+            else:
+                node = parent
+
+    # ==> Split, join and the set operations
+    #
+    # <_join> links two trees and a node whose key is between them into one
+    # tree in O(log n): it walks down the spine of the higher tree until the
+    # black height is the same as the lower tree, hangs the node and the lower
+    # tree there, and then fixes it up as a new inserted red node.
+    #
+    #              L (bh=3)     k     R (bh=2)
+    #                 [B]
+    #                /   \                           [B]
+    #                    [B] <- bh=2      ==>       /   \
+    #                   /   \                            [B]
+    #                 ...   [x]                         /   \
+    #                                                        (k)
+    #                                                       /   \
+    #                                                     [x]   R
+    #
+    # <_split> and the set operations are built on it. They work on detached
+    # subtrees, whose roots have no parent, and move the nodes rather than
+    # copying them, so the trees passed in are consumed.
+
+    def _init_kwargs(self) -> dict:
+        # The keyed node class is created again from its base by the key
+        # function, and the base can be pickled for the worker processes.
+        rb_node_cls = self.RB_NODE_CLS
+        return {
+            'rb_node_cls': rb_node_cls.__base__ if rb_node_cls.KEYED
+            else rb_node_cls,
+            'allow_dup_keys': self.allow_dup_keys,
+            'finger': self.finger,
+            'hash_index': self.hash_index is not None
+        }
+
+    def _spawn(self, root: RBNode,
+               length: Optional[int]=None) -> 'RedBlackTree':
+        tree = self.__class__(key=self.key_function, **self._init_kwargs())
+        tree.ND_ROOT = root
+        if root.color == RED:
+            root.color = BLACK
+        tree.length = 0 if root is self.ND_NULL else length
+        tree._reset_extremes()
+        return tree
+
+    def _clear(self):
+        self.ND_ROOT = self.ND_NULL
+        self.ND_FINGER = self.ND_MIN = self.ND_MAX = None
+        self.length = 0
+        if self.hash_index is not None:
+            self.hash_index = {}
+
+    def _detach(self, node: RBNode) -> Tuple[RBNode, RBNode]:
+        nil = self.ND_NULL
+        left, right = node.left, node.right
+        if left is not nil:
+            left.parent = left.from_direction = None
+        if right is not nil:
+            right.parent = right.from_direction = None
+
+        node.left = node.right = nil
+        node.parent = node.from_direction = None
+        node.color = RED
+        if self.augmented:
+            node.refresh()
+
+        return left, right
+
+    def _black_height(self, root: RBNode) -> int:
+        nil = self.ND_NULL
+        height = 0
+        while root is not nil:
+            if root.color == BLACK:
+                height += 1
+            root = root.left
+        return height
+
+    def _join(self, left: RBNode, node: RBNode, right: RBNode) -> RBNode:
+        return self._join_heights(left, self._black_height(left), node, right,
+                                  self._black_height(right))[0]
+
+    def _join_heights(self, left: RBNode, height_left: int, node: RBNode,
+                      right: RBNode, height_right: int) -> Tuple[RBNode, int]:
+        # Join with the black heights of <left> and <right> known by the
+        # caller, and return the black height of the joined tree too, so that
+        # <_split> needs no walk down to count them for each join.
+        nil = self.ND_NULL
+
+        # A red root can always be painted black
+        if left.color == RED:
+            left.color = BLACK
+            height_left += 1
+        if right.color == RED:
+            right.color = BLACK
+            height_right += 1
+
+        if height_left == height_right:
+            node.color = BLACK
+            node.parent = node.from_direction = None
+            node.left, node.right = left, right
+            if left is not nil:
+                left.parent, left.from_direction = node, LEFT
+            if right is not nil:
+                right.parent, right.from_direction = node, RIGHT
+            if self.augmented:
+                node.refresh()
+            return node, height_left + 1
+
+        parent = None
+        if height_left > height_right:
+            root = myself = left
+            height = height_left
+            while myself.color == RED or height > height_right:
+                if myself.color == BLACK:
+                    height -= 1
+                parent, myself = myself, myself.right
+
+            direction = RIGHT
+            node.left, node.right = myself, right
+        else:
+            root = myself = right
+            height = height_right
+            while myself.color == RED or height > height_left:
+                if myself.color == BLACK:
+                    height -= 1
+                parent, myself = myself, myself.left
+
+            direction = LEFT
+            node.left, node.right = left, myself
+
+        if node.left is not nil:
+            node.left.parent, node.left.from_direction = node, LEFT
+        if node.right is not nil:
+            node.right.parent, node.right.from_direction = node, RIGHT
+
+        self.ND_ROOT = root
+        node.color = RED
+        self._replace_child(parent, direction, node)
+        if self.augmented:
+            self._refresh_upward(node)
+
+        height = max(height_left, height_right)
+        if self._fixup_after_insert(node):
+            height += 1
+        self.ND_ROOT.color = BLACK
+        return self.ND_ROOT, height
+
+    def _join_without_node(self, left: RBNode, right: RBNode) -> RBNode:
+        if left is self.ND_NULL:
+            return right
+        if right is self.ND_NULL:
+            return left
+
+        left, node = self._split_last(left)
+        return self._join(left, node, right)
+
+    def _split(self, root: RBNode,
+               key) -> Tuple[RBNode, Optional[RBNode], RBNode]:
+        # The keys equal to <key> are not compared any further once a node of
+        # <key> is matched, so with duplicated keys, the other nodes of <key>
+        # may be left in either side, see <split>.
+        left, _, nd_matched, right, _ = self._split_heights(
+            root, self._black_height(root), key)
+        return left, nd_matched, right
+
+    def _split_heights(self, root: RBNode, height: int, key) -> \
+            Tuple[RBNode, int, Optional[RBNode], RBNode, int]:
+        # The black height of the children is derived from the one of their
+        # parent, and <_join_heights> returns the height of the joined tree,
+        # so that splitting costs O(log n) rather than O(log n) walks down
+        # for the black heights of each join.
+        nil = self.ND_NULL
+        if root is nil:
+            return nil, 0, None, nil, 0
+
+        height_child = height - 1 if root.color == BLACK else height
+        left, right = self._detach(root)
+        if key < root.sort_key:
+            left, height_left, nd_matched, left_right, height_left_right = \
+                self._split_heights(left, height_child, key)
+            right, height_right = self._join_heights(
+                left_right, height_left_right, root, right, height_child)
+            return left, height_left, nd_matched, right, height_right
+        if root.sort_key < key:
+            right_left, height_right_left, nd_matched, right, height_right = \
+                self._split_heights(right, height_child, key)
+            left, height_left = self._join_heights(
+                left, height_child, root, right_left, height_right_left)
+            return left, height_left, nd_matched, right, height_right
+        return left, height_child, root, right, height_child
+
+    def _split_last(self, root: RBNode) -> Tuple[RBNode, RBNode]:
+        left, _, nd_last = self._split_last_heights(
+            root, self._black_height(root))
+        return left, nd_last
+
+    def _split_last_heights(self, root: RBNode,
+                            height: int) -> Tuple[RBNode, int, RBNode]:
+        height_child = height - 1 if root.color == BLACK else height
+        left, right = self._detach(root)
+        if right is self.ND_NULL:
+            return left, height_child, root
+
+        right, height_right, nd_last = self._split_last_heights(
+            right, height_child)
+        left, height_left = self._join_heights(left, height_child, root,
+                                               right, height_right)
+        return left, height_left, nd_last
+
+    def _union(self, root1: RBNode, root2: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        if root1 is nil:
+            return root2
+        if root2 is nil:
+            return root1
+
+        left1, right1 = self._detach(root1)
+        left2, _, right2 = self._split(root2, root1.sort_key)
+        return self._join(self._union(left1, left2), root1,
+                          self._union(right1, right2))
+
+    def _intersection(self, root1: RBNode, root2: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        if root1 is nil or root2 is nil:
+            return nil
+
+        left1, right1 = self._detach(root1)
+        left2, nd_matched, right2 = self._split(root2, root1.sort_key)
+        left = self._intersection(left1, left2)
+        right = self._intersection(right1, right2)
+        if nd_matched is None:
+            return self._join_without_node(left, right)
+        return self._join(left, root1, right)
+
+    def _difference(self, root1: RBNode, root2: RBNode) -> RBNode:
+        nil = self.ND_NULL
+        if root1 is nil or root2 is nil:
+            return root1
+
+        left2, right2 = self._detach(root2)
+        left1, _, right1 = self._split(root1, root2.sort_key)
+        return self._join_without_node(self._difference(left1, left2),
+                                       self._difference(right1, right2))
+
+    def split(self, key) -> Tuple['RedBlackTree', Optional[RBNode],
+                                  'RedBlackTree']:
+        '''
+        Split the tree into the tree of the keys less than <key>, the node
+        matched <key> (None if not found) and the tree of the keys greater than
+        <key>. The nodes are moved into the new trees, this tree becomes empty.
+
+        If the keys are duplicated, the other nodes of <key> than the matched
+        one may be left in either tree. The order of the nodes is kept, i.e.
+        the nodes of the left tree, the matched node and the nodes of the right
+        tree are the nodes of this tree in order.
+        '''
+        left, nd_matched, right = self._split(self.ND_ROOT, key)
+        self._clear()
+        return self._spawn(left), nd_matched, self._spawn(right)
 
-    def post_order_traversal(self):
-        ...
+    @classmethod
+    def join(cls, left: 'RedBlackTree', key, right: 'RedBlackTree',
+             value=None) -> 'RedBlackTree':
+        '''
+        Join the trees and a new node of <key>, the keys of <left> must be less
+        than <key> and the keys of <right> must be greater than <key>. The
+        nodes are moved into the new tree, <left> and <right> become empty.
+        '''
+        assert isinstance(left, cls) and isinstance(right, cls)
+        assert left.RB_NODE_CLS is right.RB_NODE_CLS
+        node = left.RB_NODE_CLS(key, value)
+        if left.key_function is not None:
+            node.sort_key = left.key_function(key)
+        sort_key = node.sort_key
+
+        nd_max, nd_min = left.max(), right.min()
+        if nd_max is not None and sort_key < nd_max.sort_key:
+            raise RBTreeException.unsorted_keys(nd_max.key, key)
+        if nd_min is not None and nd_min.sort_key < sort_key:
+            raise RBTreeException.unsorted_keys(key, nd_min.key)
+        if (left.multiset or not left.allow_dup_keys) and \
+                sort_key in [nd.sort_key for nd in (nd_max, nd_min)
+                             if nd is not None]:
+            raise RBTreeException.insert_duplicated_key(key)
+
+        tree = left._spawn(left.ND_NULL)
+        root = tree._join(left.ND_ROOT, node, right.ND_ROOT)
+        tree.ND_ROOT = root
+        tree._reset_extremes()
+        if left.length is not None and right.length is not None:
+            tree.length = left.length + right.length + 1
+        else:
+            tree.length = None
+
+        left._clear()
+        right._clear()
+        return tree
+
+    def _divide(self, operation: str, root1: RBNode, root2: RBNode,
+                depth: int, pool: Pool):
+        nil = self.ND_NULL
+        if root1 is nil or root2 is nil:
+            return getattr(self, f'_{operation}')(root1, root2)
+
+        if depth == 0:
+            items1 = _payloads(self._spawn(root1))
+            items2 = _payloads(self._spawn(root2))
+            return pool.apply_async(
+                _set_operation_worker,
+                (self.__class__, self._init_kwargs(), operation, items1,
+                 items2))
+
+        if operation == 'difference':
+            left2, right2 = self._detach(root2)
+            left1, _, right1 = self._split(root1, root2.sort_key)
+            nd_middle = None
+        else:
+            left1, right1 = self._detach(root1)
+            left2, nd_matched, right2 = self._split(root2, root1.sort_key)
+            nd_middle = root1 \
+                if operation == 'union' or nd_matched is not None else None
+
+        return (self._divide(operation, left1, left2, depth - 1, pool),
+                nd_middle,
+                self._divide(operation, right1, right2, depth - 1, pool))
+
+    def _conquer(self, divided) -> RBNode:
+        if isinstance(divided, RBNode):
+            return divided
+
+        if isinstance(divided, tuple):
+            left = self._conquer(divided[0])
+            right = self._conquer(divided[2])
+            if divided[1] is None:
+                return self._join_without_node(left, right)
+            return self._join(left, divided[1], right)
+
+        # Rebuild the nodes from the payloads returned by the worker, see
+        # <_payloads>
+        rb_node_cls = self.RB_NODE_CLS
+        keyed = self.key_function is not None
+        nodes = []
+        for sort_key, (key, value, count, end) in divided.get():
+            node = rb_node_cls(key, value, end) if self.interval \
+                else rb_node_cls(key, value)
+            if self.multiset:
+                node.count = count
+            if keyed:
+                node.sort_key = sort_key
+            nodes.append(node)
+        return self._link_sorted(nodes)
+
+    def _set_operation(self, operation: str, other: 'RedBlackTree',
+                       processes: int) -> 'RedBlackTree':
+        assert isinstance(other, RedBlackTree)
+        assert other.RB_NODE_CLS is self.RB_NODE_CLS
+        assert processes >= 0
+
+        root1, root2 = self.ND_ROOT, other.ND_ROOT
+        other._clear()
+
+        if processes == 0:
+            root = getattr(self, f'_{operation}')(root1, root2)
+        else:
+            # Divide the work until there is a subproblem for each process,
+            # and then join the results from the bottom up.
+            depth = (processes - 1).bit_length()
+            with Pool(processes) as pool:
+                root = self._conquer(
+                    self._divide(operation, root1, root2, depth, pool))
+
+        self._clear()
+        return self._spawn(root)
+
+    def union(self, other: 'RedBlackTree',
+              processes: int=0) -> 'RedBlackTree':
+        '''
+        Return the tree of the keys in either tree, the node of this tree is
+        kept if both trees have the key. Both trees are consumed.
+
+        Each node of this tree splits <other> by its key, and drops the node
+        of <other> matched by <split>. So if the keys are duplicated, a node of
+        this tree replaces at most one node of <other>, and the result may
+        hold the nodes of a key from both trees. The same rule holds for
+        <intersection> and <difference>, each node matches at most one node
+        of the other tree.
+
+        If <processes> is not 0, the independent subtrees are sent to a pool of
+        processes, it only pays off when both trees are large.
+        '''
+        return self._set_operation('union', other, processes)
+
+    def intersection(self, other: 'RedBlackTree',
+                     processes: int=0) -> 'RedBlackTree':
+        '''
+        Return the tree of the nodes of this tree whose key is also in <other>,
+        see <union> for the arguments.
+        '''
+        return self._set_operation('intersection', other, processes)
+
+    def difference(self, other: 'RedBlackTree',
+                   processes: int=0) -> 'RedBlackTree':
+        '''
+        Return the tree of the nodes of this tree whose key is not in <other>,
+        see <union> for the arguments.
+        '''
+        return self._set_operation('difference', other, processes)
+
+
+def _set_operation_worker(tree_cls: Type[RedBlackTree], init_kwargs: dict,
+                          operation: str, items1: list, items2: list) -> list:
+    # The worker trees are keyed by the sort keys, and their values are the
+    # payloads of the nodes, which come back untouched.
+    tree1 = tree_cls.from_sorted(items1, **init_kwargs)
+    tree2 = tree_cls.from_sorted(items2, **init_kwargs)
+    return [(node.key, node.value)
+            for node in getattr(tree1, operation)(tree2)]
+
+
+def _payloads(tree: RedBlackTree) -> list:
+    # The (sort key, (key, value, count, end)) pairs sent to the worker
+    # processes, one for each node. The set operations only compare the sort
+    # keys, so the rest of the node is carried as the value, and the key
+    # function, which may not be pickled, is not needed by the workers.
+    interval = tree.interval
+    return [(node.sort_key,
+             (node.key, node.value, node.count,
+              node.end if interval else None))
+            for node in tree]
+
+
+class MappedEntry(object):
+    '''
+    The node found by <<MappedRedBlackTree>>.search, it is unpickled from the
+    file, so modifying it does not change the file.
+    '''
+
+    __slots__ = ('key', 'value', 'count', 'end')
+
+    def __init__(self, key, value, count=1, end=None):
+        self.key = key
+        self.value = value
+        self.count = count
+        self.end = end
+
+
+class MappedRedBlackTree(object):
+    '''
+    A read-only tree searched directly on the memory-mapped file written by
+    <<RedBlackTree>>.dump, nothing is loaded when it is opened, and a search
+    only unpickles the keys on its path.
+
+    In pre-order, the left child of a node is the next node, and the index
+    of the right child is kept in the dumped file, so walking down the tree
+    is some offset arithmetic on the mapped pages:
+
+            index   0   1   2   3   4   5
+            key     4   2   1   3   6   5         rights: 0 -> 4, 1 -> 3
+
+    If the tree was built with a key function, pass the same one as <key>, so
+    the keys searched and the keys on the path are normalized the same way.
+
+    The keys and values are unpickled, which may run any code, do not open
+    the files from untrusted sources.
+    '''
+
+    def __init__(self, path: str, key: Optional[Callable[[Any], Any]]=None):
+        self.key_function = key
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise RBTreeException.bad_dump('the file is empty')
+
+        # Check the sizes once, so that a search never reads out of the file
+        size = len(self._mmap)
+        if size < DUMP_HEADER.size:
+            self.close()
+            raise RBTreeException.bad_dump('the header is truncated')
+        magic, flags, self.n, self.length = \
+            DUMP_HEADER.unpack_from(self._mmap, 0)
+        if magic != DUMP_MAGIC:
+            self.close()
+            raise RBTreeException.bad_dump('it is not a dumped tree')
+        if flags & ~(DUMP_MULTISET | DUMP_INTERVAL):
+            self.close()
+            raise RBTreeException.bad_dump(f'unknown flags {flags:#x}')
+
+        self.multiset = bool(flags & DUMP_MULTISET)
+        self.interval = bool(flags & DUMP_INTERVAL)
+        self._colors, self._shapes, self._rights, self._offsets, \
+            self._data = _dump_sections(self.n)
+        if size < self._data or size < self._offset(self.n):
+            self.close()
+            raise RBTreeException.bad_dump('the data is truncated')
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self) -> 'MappedRedBlackTree':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if not self._mmap.closed:
+            self._mmap.close()
+        self._file.close()
+
+    def _offset(self, index: int) -> int:
+        return self._data + DUMP_OFFSET.unpack_from(
+            self._mmap, self._offsets + DUMP_OFFSET.size * index)[0]
+
+    def search(self, key) -> Optional[MappedEntry]:
+        key_function = self.key_function
+        if key_function is not None:
+            key = key_function(key)
+        buffer = self._mmap
+        shapes = self._shapes
+        index = 0 if self.n else None
+        while index is not None:
+            # The extra data following the key is ignored by <loads>
+            node = buffer[self._offset(index):self._offset(index + 1)]
+            node_key = loads(node)
+            sort_key = node_key if key_function is None \
+                else key_function(node_key)
+            shape = buffer[shapes + (index >> 2)] >> (2 * (index & 3))
+
+            if key < sort_key:
+                index = index + 1 if shape & 1 else None
+            elif sort_key < key:
+                index = DUMP_RIGHT.unpack_from(
+                    buffer, self._rights + DUMP_RIGHT.size * index)[0] \
+                    if shape & 2 else None
+            else:
+                unpickler = Unpickler(BytesIO(node))
+                unpickler.load()
+                extra = unpickler.load()
+                return MappedEntry(
+                    node_key, extra[0],
+                    extra[1] if self.multiset else 1,
+                    extra[-1] if self.interval else None)
+        return None
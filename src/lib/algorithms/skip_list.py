@@ -0,0 +1,168 @@
+from .ordered_map import OrderedMapBase, OrderedMapException
+from random import Random
+from typing import Iterator, Optional
+
+
+class SkipListNode(object):
+
+    __slots__ = ('key', 'value', 'forward', 'backward')
+
+    def __init__(self, key, value, level: int):
+        self.key = key
+        self.value = value
+        self.forward: list = [None] * level
+        self.backward: Optional['SkipListNode'] = None
+
+
+class SkipList(OrderedMapBase):
+    r'''
+    A sorted linked list with express lanes. Each node is linked in the lowest
+    <level> lists, where the level is 1 with the probability 1 - p, 2 with
+    p (1 - p) and so on, so a search skips most of the nodes from the top list
+    down to the bottom one:
+
+        level 3   head ----------------------------> [40] ------------> None
+        level 2   head ---------> [20] ------------> [40] ---> [60] --> None
+        level 1   head --> [10] -> [20] -> [30] ---> [40] ---> [60] --> None
+                                  <------ backward links ------
+
+    A modification only relinks the neighbors of one node, without any
+    rebalancing, so it suits the write-heavy workloads. The bottom list is also
+    linked backward for the reverse iterations.
+
+    Pass <seed> to make the levels of the nodes reproducible.
+    '''
+
+    def __init__(self, allow_dup_keys=True, max_level: int=32,
+                 p: float=0.25, seed: Optional[int]=None):
+        assert isinstance(allow_dup_keys, bool)
+        assert max_level > 0 and 0 < p < 1
+        super().__init__()
+
+        self.allow_dup_keys = allow_dup_keys
+        self.max_level = max_level
+        self.p = p
+
+        self.ND_HEAD = SkipListNode(None, None, max_level)
+        self.ND_TAIL: Optional[SkipListNode] = None
+        self.level = 1
+        self.length = 0
+        self._random = Random(seed).random
+
+    def __len__(self):
+        return self.length
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.max_level and self._random() < self.p:
+            level += 1
+        return level
+
+    def _find_previous(self, key) -> list:
+        # The last node whose key is less than <key> in each level
+        previous = [self.ND_HEAD] * self.level
+        node = self.ND_HEAD
+        for level in range(self.level - 1, -1, -1):
+            next_node = node.forward[level]
+            while next_node is not None and next_node.key < key:
+                node = next_node
+                next_node = node.forward[level]
+            previous[level] = node
+        return previous
+
+    def insert(self, key, value=None) -> SkipListNode:
+        previous = self._find_previous(key)
+        next_node = previous[0].forward[0]
+        if not self.allow_dup_keys and next_node is not None \
+                and next_node.key == key:
+            raise OrderedMapException.insert_duplicated_key(key)
+
+        level = self._random_level()
+        if level > self.level:
+            previous.extend([self.ND_HEAD] * (level - self.level))
+            self.level = level
+
+        new_node = SkipListNode(key, value, level)
+        for index in range(level):
+            new_node.forward[index] = previous[index].forward[index]
+            previous[index].forward[index] = new_node
+
+        if previous[0] is not self.ND_HEAD:
+            new_node.backward = previous[0]
+        if next_node is None:
+            self.ND_TAIL = new_node
+        else:
+            next_node.backward = new_node
+
+        self.length += 1
+        return new_node
+
+    def search(self, key) -> Optional[SkipListNode]:
+        node = self.ND_HEAD
+        for level in range(self.level - 1, -1, -1):
+            next_node = node.forward[level]
+            while next_node is not None and next_node.key < key:
+                node = next_node
+                next_node = node.forward[level]
+
+        node = node.forward[0]
+        if node is not None and node.key == key:
+            return node
+        return None
+
+    def delete(self, key) -> bool:
+        previous = self._find_previous(key)
+        node = previous[0].forward[0]
+        if node is None or node.key != key:
+            return False
+
+        for index in range(len(node.forward)):
+            previous[index].forward[index] = node.forward[index]
+
+        next_node = node.forward[0]
+        if next_node is None:
+            self.ND_TAIL = node.backward
+        else:
+            next_node.backward = node.backward
+
+        head = self.ND_HEAD
+        while self.level > 1 and head.forward[self.level - 1] is None:
+            self.level -= 1
+
+        node.backward = None
+        self.length -= 1
+        return True
+
+    def min(self) -> Optional[SkipListNode]:
+        return self.ND_HEAD.forward[0]
+
+    def max(self) -> Optional[SkipListNode]:
+        return self.ND_TAIL
+
+    def range(self, lo=None, hi=None,
+              reverse=False) -> Iterator[SkipListNode]:
+        if not reverse:
+            if lo is None:
+                node = self.ND_HEAD.forward[0]
+            else:
+                node = self._find_previous(lo)[0].forward[0]
+
+            while node is not None:
+                if hi is not None and not node.key < hi:
+                    return
+                yield node
+                node = node.forward[0]
+
+        else:
+            if hi is None:
+                node = self.ND_TAIL
+            else:
+                node = self._find_previous(hi)[0]
+                if node is self.ND_HEAD:
+                    return
+
+            while node is not None:
+                if lo is not None and node.key < lo:
+                    return
+                yield node
+                node = node.backward
@@ -0,0 +1,144 @@
+from .ordered_map import BinaryTreeMapBase, OrderedMapException
+from random import Random
+from typing import Optional
+
+
+LEFT = BinaryTreeMapBase.LEFT
+RIGHT = BinaryTreeMapBase.RIGHT
+
+
+class TreapNode(object):
+
+    __slots__ = ('key', 'value', 'left', 'right', 'priority')
+
+    def __init__(self, key, value, priority: float):
+        self.key = key
+        self.value = value
+        self.left: 'TreapNode' = None
+        self.right: 'TreapNode' = None
+        self.priority = priority
+
+    @classmethod
+    def null_node(cls):
+        '''
+        The null node has the lowest priority, it is shared by all the trees
+        and never modified.
+        '''
+        nd_null = cls.__dict__.get('_ND_NULL')
+        if nd_null is None:
+            nd_null = cls(None, None, -1.0)
+            setattr(cls, '_ND_NULL', nd_null)
+        return nd_null
+
+
+class Treap(BinaryTreeMapBase):
+    r'''
+    A binary search tree by the keys and a heap by the random priorities of
+    the nodes at the same time, so its shape is the same as if the keys were
+    inserted in a random order, whose depth is O(log n) in expectation.
+
+    A new node is hung as a leaf and rotated up until the priority of its
+    parent is higher, and a deleted node is rotated down until it is a leaf.
+    There is no color or height to maintain, and the modifications do about
+    two rotations in expectation, so it suits the write-heavy workloads:
+
+               |                              |
+            [p 0.9]                        [p 0.9]
+           /       \                      /       \
+       [q 0.4]     ...      ==>       [n 0.7]     ...
+       /     \                        /     \
+     ...   [n 0.7]                [q 0.4]   ...
+                                  /
+                                ...
+
+    Pass <seed> to make the shape of the tree reproducible.
+    '''
+
+    def __init__(self, allow_dup_keys=True, seed: Optional[int]=None):
+        assert isinstance(allow_dup_keys, bool)
+        super().__init__()
+
+        self.allow_dup_keys = allow_dup_keys
+        self.ND_ROOT = self.ND_NULL = TreapNode.null_node()
+        self.length = 0
+        self._random = Random(seed).random
+
+    def insert(self, key, value=None) -> TreapNode:
+        nil = self.ND_NULL
+        path = []
+        node = self.ND_ROOT
+        while node is not nil:
+            if key <= node.key:
+                if key == node.key and not self.allow_dup_keys:
+                    raise OrderedMapException.insert_duplicated_key(key)
+                path.append((node, LEFT))
+                node = node.left
+            else:
+                path.append((node, RIGHT))
+                node = node.right
+
+        new_node = TreapNode(key, value, self._random())
+        new_node.left = new_node.right = nil
+        self.length += 1
+
+        depth = len(path)
+        self._link(path, depth, new_node)
+
+        # Rotate up while the priority of the parent is lower
+        priority = new_node.priority
+        while depth > 0:
+            parent, direction = path[depth - 1]
+            if parent.priority >= priority:
+                break
+
+            if direction == LEFT:
+                parent.left = new_node.right
+                new_node.right = parent
+            else:
+                parent.right = new_node.left
+                new_node.left = parent
+
+            depth -= 1
+            self._link(path, depth, new_node)
+
+        return new_node
+
+    def delete(self, key) -> bool:
+        nil = self.ND_NULL
+        path = []
+        node = self.ND_ROOT
+        while True:
+            if node is nil:
+                return False
+
+            if key < node.key:
+                path.append((node, LEFT))
+                node = node.left
+            elif key > node.key:
+                path.append((node, RIGHT))
+                node = node.right
+            else:
+                break
+
+        # Rotate down with the child of the higher priority, the heap order
+        # of the other nodes holds all the way.
+        while node.left is not nil and node.right is not nil:
+            if node.left.priority > node.right.priority:
+                child = node.left
+                node.left = child.right
+                child.right = node
+                direction = RIGHT
+            else:
+                child = node.right
+                node.right = child.left
+                child.left = node
+                direction = LEFT
+
+            self._link(path, len(path), child)
+            path.append((child, direction))
+
+        self._link(path, len(path),
+                   node.left if node.left is not nil else node.right)
+        node.left = node.right = nil
+        self.length -= 1
+        return True
@@ -0,0 +1,168 @@
+from .red_black_tree import RBNode, RedBlackTree
+from collections import OrderedDict
+from sys import getsizeof
+from time import monotonic
+from typing import Any, Callable, Optional
+
+
+class CacheEntry(object):
+
+    __slots__ = ('key', 'value', 'size', 'node')
+
+    def __init__(self, key, value, size: int):
+        self.key = key
+        self.value = value
+        self.size = size
+        # The node of the deadline in the expiry tree, None if it never
+        # expires
+        self.node: Optional[RBNode] = None
+
+
+class TTLCache(object):
+    r'''
+    An in-process cache whose entries expire at their deadlines, and the
+    least recently used ones are evicted when there are more than
+    <max_entries> entries or <max_bytes> bytes measured by <sizeof>.
+
+    The entries are kept in a dict in the order of use, and the deadlines are
+    kept in a <<RedBlackTree>> whose leftmost node is the next one to expire:
+
+        entries (LRU -> MRU)        expiry tree (by deadline)
+        'a' -> entry a                       [t=30 'c']
+        'b' -> entry b  <- no ttl           /          \
+        'c' -> entry c             [t=10 'a']          [t=50 'd']
+        'd' -> entry d
+
+    So <expire_due> only pops the left edge of the tree, which is O(1) to
+    find and O(log n) to delete each due entry, and no scan of the live
+    entries is needed. An expired entry is also dropped when it is read.
+
+    <clock> returns the current time in seconds, and the deadline of an
+    entry is <clock>() + <ttl> when it is set.
+    '''
+
+    def __init__(self, max_entries: Optional[int]=None,
+                 max_bytes: Optional[int]=None,
+                 default_ttl: Optional[float]=None,
+                 clock: Callable[[], float]=monotonic,
+                 sizeof: Callable[[Any], int]=getsizeof):
+        assert max_entries is None or max_entries > 0
+        assert max_bytes is None or max_bytes > 0
+        assert default_ttl is None or default_ttl > 0
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.sizeof = sizeof
+
+        self._entries: 'OrderedDict[Any, CacheEntry]' = OrderedDict()
+        self._deadlines = RedBlackTree()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        # The expired entries are not counted, like <__contains__> and <get>
+        self.expire_due()
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._expired(entry, self.clock())
+
+    @staticmethod
+    def _expired(entry: CacheEntry, now: float) -> bool:
+        return entry.node is not None and entry.node.key <= now
+
+    def _remove(self, entry: CacheEntry):
+        del self._entries[entry.key]
+        self.bytes -= entry.size
+        if entry.node is not None:
+            self._deadlines.delete_node(entry.node)
+            entry.node = None
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        if self._expired(entry, self.clock()):
+            self._remove(entry)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key, value, ttl: Optional[float]=None):
+        '''
+        Set the value of <key>, it expires after <ttl> seconds (or
+        <default_ttl>), and never expires if both are None.
+        '''
+        assert ttl is None or ttl > 0
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._remove(entry)
+
+        entry = CacheEntry(key, value, self.sizeof(value))
+        if ttl is None:
+            ttl = self.default_ttl
+        if ttl is not None:
+            entry.node = self._deadlines.insert(self.clock() + ttl, key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+
+        self._evict()
+
+    def delete(self, key) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        self._remove(entry)
+        return True
+
+    def _evict(self):
+        entries = self._entries
+        while entries and (
+                (self.max_entries is not None and
+                 len(entries) > self.max_entries) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self._remove(next(iter(entries.values())))
+            self.evictions += 1
+
+    def expire_due(self, now: Optional[float]=None) -> int:
+        '''
+        Remove the entries whose deadlines are not later than <now> (the
+        current time by default), return the number of them.
+        '''
+        if now is None:
+            now = self.clock()
+
+        deadlines = self._deadlines
+        entries = self._entries
+        expired = 0
+        while True:
+            node = deadlines.peek_min()
+            if node is None or node.key > now:
+                break
+
+            deadlines.pop_min()
+            entry = entries.pop(node.value)
+            entry.node = None
+            self.bytes -= entry.size
+            expired += 1
+
+        self.expirations += expired
+        return expired
+
+    def clear(self):
+        self._entries.clear()
+        self._deadlines = RedBlackTree()
+        self.bytes = 0
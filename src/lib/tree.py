@@ -1,7 +1,18 @@
 from .exception import ExceptionBase, register_exception
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from enum import Enum
+from functools import partial
+from hashlib import new as new_hash, sha256
+from inspect import signature
 from logging import getLogger
-from typing import Dict, Optional, Type, Union
+from mmap import ACCESS_READ, mmap
+from multiprocessing import Pool, cpu_count
+from os import fstat, path as os_path, scandir
+from threading import local
+from time import perf_counter, time_ns
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type, Union
 
 
 LOG = getLogger(__name__)
@@ -15,9 +26,21 @@ class TreeException(ExceptionBase):
                      f'{circular_nodes}')
         info.circular_nodes = circular_nodes
 
+    @register_exception
+    def migration_failed(info, failures, skipped, timings):
+        info.tell_me(f'{len(failures)} steps of the migration failed, and '
+                     f'{len(skipped)} steps depending on them were skipped: '
+                     f'{failures}')
+        info.failures = failures
+        info.skipped = skipped
+        info.timings = timings
+
 
 class EigenValue(object):
 
+    # Whether the value is derived from the children of the container
+    MERKLE = False
+
     def __init__(self, value):
         self._value = value
 
@@ -26,21 +49,124 @@ class EigenValue(object):
         return self._value
 
 
+class MerkleEigenValue(EigenValue):
+    r'''
+    The eigenvalue of a container derived by hashing the kinds, the names and
+    the eigenvalues of its children, like the Merkle tree, so two complete
+    containers have the same eigenvalue only if the subtrees under them are
+    identical:
+
+              root = H(d node1 H1, d node2 H2)        * dirty after f3 changes
+               /              \
+        node1 = H1         *node2 = H2 = H(s f3 'cccc0200')
+          /    \                   \
+        f1     f2                  *f3
+
+    A change of a child only marks the containers above it dirty, and
+    stops at the first one already dirty. The value is recomputed on the
+    next access, from the dirty containers only, so rehashing after a change
+    of a scalar is O(depth), not O(tree).
+
+    The eigenvalue of a container given by the caller is hashed as it is, and
+    the changes under such a container never reach the containers above it,
+    so a container is <complete> only if all the containers under it have the
+    <<MerkleEigenValue>>, and the eigenvalue of an incomplete container tells
+    nothing about the subtrees under its given containers.
+    '''
+
+    MERKLE = True
+
+    def __init__(self, hash_cls: Callable[[], Any]=sha256):
+        super().__init__(None)
+        self.hash_cls = hash_cls
+        self._node: Optional['ContainerNode'] = None
+        self._complete = True
+
+    def bind(self, node: 'ContainerNode'):
+        assert self._node is None, 'The eigenvalue is shared by containers'
+        self._node = node
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._refresh(self._node)
+        return self._value
+
+    @property
+    def complete(self) -> bool:
+        # Whether every container under the node has the MerkleEigenValue
+        if self._value is None:
+            self._refresh(self._node)
+        return self._complete
+
+    def _digest(self, node: 'ContainerNode') -> str:
+        digest = self.hash_cls()
+        complete = True
+        for name in sorted(node._children):
+            child = node._children[name]
+            digest.update(b'd' if child.is_container else b's')
+            digest.update(f'{name}\0{child.eigenvalue}\0'.encode())
+            if child.is_container:
+                complete = complete and child._eigenvalue.MERKLE and \
+                    child._eigenvalue._complete
+        self._complete = complete
+        return digest.hexdigest()
+
+    @staticmethod
+    def _refresh(node: 'ContainerNode'):
+        # Compute the dirty containers in post-order without recursion, the
+        # clean ones are not entered
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            eigenvalue = node._eigenvalue
+            if expanded:
+                eigenvalue._value = eigenvalue._digest(node)
+                continue
+
+            stack.append((node, True))
+            for child in node._children.values():
+                if child._eigenvalue.MERKLE and child._eigenvalue._value is None:
+                    stack.append((child, False))
+
+
 class _NodeBase(object):
+    r'''
+    The depth and the root of a node are cached, rather than walking to the
+    root on each access. A node refreshes its cache from the nearest cached
+    ancestor, and caches all the nodes on the way, so a cached node always
+    has the cached ancestors:
+
+            root (depth 0)               moving <a> clears the caches of the
+             /                           cached nodes under it, and stops at
+           a (depth 1)      <- moved     the ones not cached, whose subtrees
+            \                            are not cached either
+             b (depth 2)    <- cleared
+
+    So moving a node only touches its own subtree, and each cache cleared was
+    paid by a refresh before, the nodes of the other subtrees and the other
+    trees keep their caches. Building a tree from the top down moves the
+    nodes without children only, which clears nothing else.
+    '''
 
     _name: str
     _parent: Optional['ScalarNode']
     _eigenvalue: EigenValue
 
+    # The cached position of the node, None if it is not cached
+    _depth: Optional[int] = None
+    _root: '_NodeBase'
+
     def __init__(self, name: str, eigenvalue: EigenValue,
                  parent: Optional['ScalarNode']=None):
         assert isinstance(eigenvalue, EigenValue)
         assert parent is None or parent.is_container
+        assert not eigenvalue.MERKLE or isinstance(self, ContainerNode)
 
         self._name = name
         self._eigenvalue = eigenvalue
         if parent is not None:
-            self.parent = parent
+            self.set_parent(parent)
 
     @property
     def parent(self):
@@ -48,13 +174,89 @@ class _NodeBase(object):
 
     @parent.setter
     def parent(self, node):
+        self.set_parent(node)
+
+    def set_parent(self, node: 'ContainerNode', check_cycle: bool=True):
+        '''
+        Move this node under <node>. The walk from <node> to the root checking
+        whether this node is an ancestor of <node> could be skipped with
+        <check_cycle>, when the trees are built in bulk by a trusted source.
+        '''
         assert node.is_container
+        if check_cycle and self._has_children:
+            self._check_cycle(node)
+        elif node is self:
+            raise TreeException.circular_dependency([self.unique_id])
+
         if hasattr(self, '_parent'):
             self._parent._children.pop(self.unique_id)
+            self._parent._changed()
 
         self._parent = node
         node._children[self.unique_id] = self
-        self._get_required_nodes()
+        node._changed()
+        self._moved()
+
+    def _check_cycle(self, node: 'ContainerNode'):
+        # Each ancestor is compared by identity, so it is O(depth)
+        ancestor = node
+        while ancestor is not self:
+            if ancestor.is_root:
+                return
+            ancestor = ancestor._parent
+
+        circular_nodes = [self.unique_id]
+        ancestor = node
+        while ancestor is not self:
+            circular_nodes.append(ancestor.unique_id)
+            ancestor = ancestor._parent
+        raise TreeException.circular_dependency(circular_nodes)
+
+    @property
+    def _has_children(self) -> bool:
+        # Only the container has <_children>
+        return bool(getattr(self, '_children', None))
+
+    def _changed(self):
+        # The children of this container are changed, mark the Merkle
+        # eigenvalues of it and the containers above it dirty
+        node = self
+        while node._eigenvalue.MERKLE and node._eigenvalue._value is not None:
+            node._eigenvalue._value = None
+            if node.is_root:
+                break
+            node = node._parent
+
+    def _moved(self):
+        # Clear the caches of the subtree, the subtree of a node not cached
+        # is not cached
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._depth is None:
+                continue
+            node._depth = None
+            children = getattr(node, '_children', None)
+            if children:
+                stack.extend(children.values())
+
+    def _cache_position(self):
+        if self._depth is not None:
+            return
+
+        nodes = []
+        node = self
+        while node._depth is None and not node.is_root:
+            nodes.append(node)
+            node = node._parent
+        if node._depth is None:
+            node._depth = 0
+            node._root = node
+
+        for node in reversed(nodes):
+            parent = node._parent
+            node._depth = parent._depth + 1
+            node._root = parent._root
 
     @property
     def is_root(self):
@@ -62,12 +264,28 @@ class _NodeBase(object):
 
     @property
     def root(self):
-        return self._get_required_nodes()[-1]
+        self._cache_position()
+        return self._root
+
+    @property
+    def depth(self) -> int:
+        self._cache_position()
+        return self._depth
 
     @property
     def eigenvalue(self):
         return self._eigenvalue.value
 
+    @eigenvalue.setter
+    def eigenvalue(self, eigenvalue: EigenValue):
+        assert isinstance(eigenvalue, EigenValue)
+        assert not eigenvalue.MERKLE or self.is_container
+        if eigenvalue.MERKLE:
+            eigenvalue.bind(self)
+        self._eigenvalue = eigenvalue
+        if not self.is_root:
+            self._parent._changed()
+
     @property
     def unique_id(self):
         return self._name
@@ -84,38 +302,28 @@ class _NodeBase(object):
     def shown_data(self):
         return f'{self._name}: {self._eigenvalue.value}'
 
-    def _get_required_nodes(self):
-        required_nodes = []
-
-        node = self
-        while True:
-            if node in required_nodes:
-                raise TreeException.circular_dependency(
-                    [n.unique_id for n in required_nodes])
-
-            required_nodes.append(node)
-            if node.is_root:
-                break
-            node = node.parent
-
-        return required_nodes
-
     @property
     def path(self):
-        required_nodes = self._get_required_nodes()
+        required_nodes = [self]
+        node = self
+        while not node.is_root:
+            node = node._parent
+            required_nodes.append(node)
         required_nodes.reverse()
         return required_nodes
 
     @property
     def path_level(self):
-        return len(self._get_required_nodes())
+        return self.depth + 1
 
     def remove(self):
         if self.is_root:
             return
 
         self._parent._children.pop(self.unique_id)
+        self._parent._changed()
         del self._parent
+        self._moved()
 
 
 class ScalarNode(_NodeBase):
@@ -127,8 +335,10 @@ class ContainerNode(_NodeBase):
     _children: Dict[str, Union['ScalarNode', 'ContainerNode']]
 
     def __init__(self, name, eigenvalue, parent=None):
-        super().__init__(name, eigenvalue, parent=parent)
         self._children = {}
+        if eigenvalue.MERKLE:
+            eigenvalue.bind(self)
+        super().__init__(name, eigenvalue, parent=parent)
 
         self._rb_containers = ...
         self._rb_scalars = ...
@@ -176,6 +386,60 @@ class ContainerNode(_NodeBase):
         return '\n'.join(result)
 
 
+class MigrateAction(Enum):
+    # The value is the method of <<MigrateScheme>> doing the action
+    CREATE_CONTAINER = 'create_container_node'
+    MOVE_CONTAINER = 'move_container_node'
+    COPY_CONTAINER = 'copy_container_node'
+    REMOVE_CONTAINER = 'remove_container_node'
+    CREATE_SCALAR = 'create_scalar_node'
+    MOVE_SCALAR = 'move_scalar_node'
+    COPY_SCALAR = 'copy_scalar_node'
+    REMOVE_SCALAR = 'remove_scalar_node'
+
+
+def _path_of(node: _NodeBase) -> str:
+    return '/'.join(n.unique_id for n in node.path)
+
+
+class MigrateStep(object):
+    '''
+    One step of the migration, <source> is the node of the tree migrated from
+    (None when creating a node), and <target> is the node of the tree migrated
+    to (None when removing a node).
+    '''
+
+    __slots__ = ('action', 'source', 'target')
+
+    def __init__(self, action: MigrateAction,
+                 source: Optional[_NodeBase]=None,
+                 target: Optional[_NodeBase]=None):
+        self.action = action
+        self.source = source
+        self.target = target
+
+    def __repr__(self):
+        paths = ' -> '.join(_path_of(node) for node in (self.source,
+                                                        self.target)
+                            if node is not None)
+        return f'<{self.action.name} {paths}>'
+
+    def apply(self, scheme: 'MigrateScheme'):
+        callback = getattr(scheme, self.action.value)
+        _CURRENT_STEP.step = self
+        try:
+            if scheme.takes_nodes(self.action):
+                return callback(*[node for node in (self.source, self.target)
+                                  if node is not None])
+            return callback()
+        finally:
+            _CURRENT_STEP.step = None
+
+
+# The step applied by the current thread, see <<MigrateScheme>>.current_step
+_CURRENT_STEP = local()
+
+
 class MigrateScheme(ABC):
     r'''
     When migrating from one tree to another, it will be accompanied by the
@@ -184,41 +448,72 @@ class MigrateScheme(ABC):
     adjustment actions and their dependencies.
     In addition, the actual actions corresponding to node adjustments at the
     data structure level are different, which is another function of this class
+
+    The <source> of an action is the node of the tree migrated from, and the
+    <target> is the node of the tree migrated to, whose path is where the
+    result is placed.
+
+    The callbacks used to take no argument, such a callback is still called
+    without arguments, and it could read the step from <current_step>, which
+    is the step applied by the calling thread.
     '''
 
+    # {(scheme class, action): whether the callback takes the nodes}
+    _TAKES_NODES: Dict[tuple, bool] = {}
+
     def __init__(self):
-        ...
+        self.steps: List[MigrateStep] = []
+
+    def add_step(self, step: MigrateStep):
+        self.steps.append(step)
+
+    @property
+    def current_step(self) -> Optional[MigrateStep]:
+        return getattr(_CURRENT_STEP, 'step', None)
+
+    @classmethod
+    def takes_nodes(cls, action: MigrateAction) -> bool:
+        key = (cls, action)
+        takes_nodes = cls._TAKES_NODES.get(key)
+        if takes_nodes is None:
+            callback = getattr(cls, action.value)
+            # The parameters besides <self>
+            takes_nodes = len(signature(callback).parameters) > 1
+            cls._TAKES_NODES[key] = takes_nodes
+        return takes_nodes
 
     @abstractmethod
-    def create_container_node(self):
+    def create_container_node(self, target: 'ContainerNode'):
         ...
 
     @abstractmethod
-    def move_container_node(self):
+    def move_container_node(self, source: 'ContainerNode',
+                            target: 'ContainerNode'):
         ...
 
     @abstractmethod
-    def copy_container_node(self):
+    def copy_container_node(self, source: 'ContainerNode',
+                            target: 'ContainerNode'):
         ...
 
     @abstractmethod
-    def remove_container_node(self):
+    def remove_container_node(self, source: 'ContainerNode'):
         ...
 
     @abstractmethod
-    def create_scalar_node(self):
+    def create_scalar_node(self, target: ScalarNode):
         ...
 
     @abstractmethod
-    def move_scalar_node(self):
+    def move_scalar_node(self, source: ScalarNode, target: ScalarNode):
         ...
 
     @abstractmethod
-    def copy_scalar_node(self):
+    def copy_scalar_node(self, source: ScalarNode, target: ScalarNode):
         ...
 
     @abstractmethod
-    def remove_scalar_node(self):
+    def remove_scalar_node(self, source: ScalarNode):
         ...
 
     @abstractmethod
@@ -299,12 +594,549 @@ class TreeMigration(object):
         self._tree_from = tree_from
         self._tree_to = tree_to
         self._scheme = migrate_scheme_cls()
+        self._steps: Optional[List[MigrateStep]] = None
 
-    def calculate(self):
-        ...
-
-    def execute(self):
-        ...
-
+    @property
+    def scheme(self) -> MigrateScheme:
+        return self._scheme
+
+    def calculate(self) -> List[MigrateStep]:
+        r'''
+        Figure out the steps of the migration, they are added to the scheme in
+        the order of execution:
+
+            1. Remove the old nodes whose paths are taken by the new nodes of
+               the other kind.
+            2. Create the new containers, the parents first.
+            3. Copy the nodes with the same eigenvalues.
+            4. Move the nodes with the same eigenvalues.
+            5. Create the new and the changed scalars.
+            6. Remove the old nodes which are not needed anymore.
+
+        The nodes are matched by their paths first, a node unchanged in place
+        is kept with all the nodes under it, and a changed container is kept
+        while its children are compared. The other new nodes are looked up by
+        their eigenvalues in a dict of the old nodes, so the identical
+        subtrees and the moved scalars are found in O(n) expected time:
+
+            old tree          path match         eigenvalue match
+            root/node1    ->                 ->  mv root/node5/node6
+            root/node2    ->  keep, compare
+            root/node2/f3 ->  changed        ->  (none) create f3'
+            root/node3    ->                 ->  (unused) rm -rf
+
+        Only the eigenvalues of the scalars and the complete containers, i.e.
+        the ones with the <<MerkleEigenValue>> and without any container of
+        the eigenvalue given by the callers under them, tell the whole
+        content, so the other containers are never kept or moved as a whole,
+        their children are compared or placed one by one instead.
+
+        An old node is moved only if nothing under or above it is moved, and
+        it is not needed in place, otherwise it is copied. All the copies are
+        done before the moves, so they always read the old paths. A scalar
+        replaced in place is never a source, and neither are the nodes under
+        a path taken by the other kind, which are removed first.
+        '''
+        if self._steps is not None:
+            return self._steps
+
+        # The old nodes kept in place, with everything under them
+        pinned: Set[_NodeBase] = set()
+        # The old containers kept in place, whose children are changed, a dict
+        # keeps the order of the steps stable
+        kept: Dict[_NodeBase, None] = {}
+        # The old nodes whose paths are taken by the new nodes of other kinds,
+        # and the old scalars replaced in place
+        conflicts: List[_NodeBase] = []
+        replaced: Set[_NodeBase] = set()
+        # The new nodes which are not at the same paths of the old tree
+        unplaced: List[_NodeBase] = []
+
+        stack: List[Tuple[_NodeBase, Optional[_NodeBase]]] = [
+            (self._tree_to, self._tree_from)]
+        while stack:
+            new, old = stack.pop()
+            if old is not None and old.is_container != new.is_container:
+                conflicts.append(old)
+                old = None
+
+            if old is None:
+                unplaced.append(new)
+            elif old.eigenvalue == new.eigenvalue and \
+                    self._summarized(old) and self._summarized(new):
+                pinned.add(old)
+            elif new.is_container:
+                kept[old] = None
+                for name, child in reversed(new._children.items()):
+                    stack.append((child, old._children.get(name)))
+            else:
+                replaced.add(old)
+                unplaced.append(new)
+
+        # Index the old nodes which could be the sources by their kinds and
+        # eigenvalues. The pinned ones are always there, and the free ones are
+        # not needed in place, which could be moved once.
+        pinned_sources: Dict[tuple, _NodeBase] = {}
+        free_sources: Dict[tuple, List[_NodeBase]] = {}
+        free_tops: List[_NodeBase] = []
+
+        def _index(top: _NodeBase, sources: dict, free: bool):
+            stack = [top]
+            while stack:
+                node = stack.pop()
+                if self._summarized(node):
+                    key = (node.is_container, node.eigenvalue)
+                    if free:
+                        sources.setdefault(key, []).append(node)
+                    else:
+                        sources.setdefault(key, node)
+                if node.is_container:
+                    stack.extend(node._children.values())
+
+        for node in pinned:
+            _index(node, pinned_sources, False)
+        placed = set(kept) | pinned | replaced | set(conflicts)
+        for container in kept:
+            for child in container._children.values():
+                if child in placed:
+                    continue
+                free_tops.append(child)
+                _index(child, free_sources, True)
+
+        moved: Set[_NodeBase] = set()
+        # The free nodes which are moved or under a moved node, and the ones
+        # with some moved nodes under them, which can not be moved. Each node
+        # is added to them once, so finding the movable nodes is O(n) in
+        # total.
+        moved_over: Set[_NodeBase] = set()
+        moved_under: Set[_NodeBase] = set()
+        cursors: Dict[tuple, int] = {}
+
+        def _move(node: _NodeBase):
+            moved.add(node)
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                if node in moved_over:
+                    continue
+                moved_over.add(node)
+                if node.is_container:
+                    stack.extend(node._children.values())
+
+        def _take(key: tuple) -> Optional[_NodeBase]:
+            # A node not movable now never becomes movable again, so each
+            # one is skipped once
+            candidates = free_sources.get(key, ())
+            index = cursors.get(key, 0)
+            while index < len(candidates):
+                node = candidates[index]
+                index += 1
+                if node not in moved_over and node not in moved_under:
+                    cursors[key] = index
+                    _move(node)
+                    parent = node.parent
+                    while parent not in kept and parent not in moved_under:
+                        moved_under.add(parent)
+                        parent = parent.parent
+                    return node
+            cursors[key] = index
+            return None
+
+        creations: List[MigrateStep] = []
+        copies: List[MigrateStep] = []
+        moves: List[MigrateStep] = []
+        scalar_creations: List[MigrateStep] = []
+
+        # The containers are placed before the scalars, and the larger ones
+        # first, so an identical subtree is moved as a whole before the nodes
+        # in it are taken one by one
+        containers = sorted((node for node in unplaced if node.is_container),
+                            key=self._size_of, reverse=True)
+        scalars = [node for node in unplaced if node.is_scalar]
+        index = 0
+        while index < len(containers):
+            new = containers[index]
+            index += 1
+            source, moving = self._source_of(new, _take, pinned_sources,
+                                             free_sources)
+            if source is None:
+                creations.append(MigrateStep(
+                    MigrateAction.CREATE_CONTAINER, target=new))
+                for child in new._children.values():
+                    (containers if child.is_container else
+                     scalars).append(child)
+            elif moving:
+                moves.append(MigrateStep(
+                    MigrateAction.MOVE_CONTAINER, source, new))
+            else:
+                copies.append(MigrateStep(
+                    MigrateAction.COPY_CONTAINER, source, new))
+
+        for new in scalars:
+            source, moving = self._source_of(new, _take, pinned_sources,
+                                             free_sources)
+            if source is None:
+                scalar_creations.append(MigrateStep(
+                    MigrateAction.CREATE_SCALAR, target=new))
+            elif moving:
+                moves.append(MigrateStep(
+                    MigrateAction.MOVE_SCALAR, source, new))
+            else:
+                copies.append(MigrateStep(
+                    MigrateAction.COPY_SCALAR, source, new))
+
+        # The free nodes moved away leave nothing to remove, and the ones
+        # with some nodes moved out of them are removed after the moves
+        cleanups = [self._removal_of(node) for node in free_tops
+                    if node not in moved]
+
+        self._steps = [self._removal_of(node) for node in conflicts] + \
+            creations + copies + moves + scalar_creations + cleanups
+        for step in self._steps:
+            self._scheme.add_step(step)
+        LOG.debug(f'{len(self._steps)} steps to migrate the tree')
+        return self._steps
+
+    @staticmethod
+    def _summarized(node: _NodeBase) -> bool:
+        # Whether the eigenvalue of the node tells its whole content, the
+        # eigenvalues given by the callers and the Merkle eigenvalues above
+        # them may not
+        return node.is_scalar or \
+            (node._eigenvalue.MERKLE and node._eigenvalue.complete)
+
+    @staticmethod
+    def _size_of(node: _NodeBase) -> int:
+        size = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            size += 1
+            if node.is_container:
+                stack.extend(node._children.values())
+        return size
+
+    @staticmethod
+    def _removal_of(node: _NodeBase) -> MigrateStep:
+        return MigrateStep(MigrateAction.REMOVE_CONTAINER if node.is_container
+                           else MigrateAction.REMOVE_SCALAR, source=node)
+
+    @staticmethod
+    def _source_of(new: _NodeBase, take, pinned_sources: dict,
+                   free_sources: dict) -> Tuple[Optional[_NodeBase], bool]:
+        # Move a free node if possible, otherwise copy a pinned one or a free
+        # one from its old path, return the source and whether it is moved
+        if not TreeMigration._summarized(new):
+            return None, False
+        key = (new.is_container, new.eigenvalue)
+        source = take(key)
+        if source is not None:
+            return source, True
+        if key in pinned_sources:
+            return pinned_sources[key], False
+        if key in free_sources:
+            return free_sources[key][0], False
+        return None, False
+
+    @staticmethod
+    def _dependencies(steps: List[MigrateStep]
+                      ) -> Dict[MigrateStep, List[MigrateStep]]:
+        r'''
+        Return the steps depending on each step, which are:
+
+            * the steps placing a node into a created container depend on
+              the creation
+            * the steps placing a node at the path of a conflicted node
+              depend on its removal
+            * the moves and the removals of a node, or of the nodes above or
+              under it, depend on the copies reading the node
+            * the removal of a container depends on the moves out of it
+
+        The old nodes not moved or removed are not changed at all, so the
+        steps reading them depend on nothing.
+        '''
+        def _relative_path(node: _NodeBase) -> tuple:
+            return tuple(n.unique_id for n in node.path[1:])
+
+        dependents: Dict[MigrateStep, List[MigrateStep]] = {
+            step: [] for step in steps}
+        created: Dict[_NodeBase, MigrateStep] = {}
+        # The moves and the removals of the old nodes
+        changed: Dict[_NodeBase, MigrateStep] = {}
+        conflicts: Dict[tuple, MigrateStep] = {}
+        copies: Dict[_NodeBase, List[MigrateStep]] = {}
+
+        # The conflicts are removed before any other steps
+        leading = True
+        for step in steps:
+            if step.target is not None:
+                leading = False
+            elif leading:
+                conflicts[_relative_path(step.source)] = step
+
+            if step.action is MigrateAction.CREATE_CONTAINER:
+                created[step.target] = step
+            elif step.target is None or step.action in (
+                    MigrateAction.MOVE_CONTAINER, MigrateAction.MOVE_SCALAR):
+                changed[step.source] = step
+
+        def _changes_above(node: _NodeBase, include_self: bool):
+            if not include_self:
+                node = node.parent if not node.is_root else None
+            while node is not None:
+                if node in changed:
+                    yield changed[node]
+                node = node.parent if not node.is_root else None
+
+        for step in steps:
+            if step.target is not None:
+                parent = step.target.parent
+                if parent in created:
+                    dependents[created[parent]].append(step)
+                if conflicts:
+                    conflict = conflicts.get(_relative_path(step.target))
+                    if conflict is not None:
+                        dependents[conflict].append(step)
+
+            if step.action in (MigrateAction.COPY_CONTAINER,
+                               MigrateAction.COPY_SCALAR):
+                for change in _changes_above(step.source, True):
+                    dependents[step].append(change)
+                copies.setdefault(step.source, []).append(step)
+            elif step.action in (MigrateAction.MOVE_CONTAINER,
+                                 MigrateAction.MOVE_SCALAR):
+                for change in _changes_above(step.source, False):
+                    dependents[step].append(change)
+
+        # The nodes moved or removed out of a copied container, the copies
+        # are before the moves and the removals in <steps>
+        if copies:
+            for node, change in changed.items():
+                while True:
+                    for copy in copies.get(node, ()):
+                        if copy.source is not change.source:
+                            dependents[copy].append(change)
+                    if node.is_root:
+                        break
+                    node = node.parent
+
+        return dependents
+
+    def _run_step(self, step: MigrateStep) -> float:
+        start = perf_counter()
+        step.apply(self._scheme)
+        return perf_counter() - start
+
+    def execute(self, max_workers: int=1) -> Dict[MigrateStep, float]:
+        r'''
+        Execute the steps with up to <max_workers> threads, and return the
+        seconds taken by each step. The steps are the vertices of a DAG built
+        by <_dependencies>, and a step is started once all the steps it
+        depends on are done, e.g.:
+
+            rm node3/x ──> mkdir node3 ──> mv node1/f1 node3/f1 ──> rm node1
+                                              cp node1/f2 node2/f2 ───┘
+
+        So the independent steps overlap their I/O, and the callbacks of the
+        scheme must be thread-safe if <max_workers> > 1.
+
+        If some steps fail, the steps depending on them are skipped, the
+        other ones still run, and then TreeException.migration_failed is
+        raised with all of them.
+        '''
+        assert max_workers > 0
+        steps = self.calculate()
+        dependents = self._dependencies(steps)
+        waiting = {step: 0 for step in steps}
+        for step in steps:
+            for dependent in dependents[step]:
+                waiting[dependent] += 1
+
+        timings: Dict[MigrateStep, float] = {}
+        failures: Dict[MigrateStep, BaseException] = {}
+        ready = deque(step for step in steps if not waiting[step])
+        with ThreadPoolExecutor(max_workers) as executor:
+            running = {}
+            while ready or running:
+                while ready and len(running) < max_workers:
+                    step = ready.popleft()
+                    running[executor.submit(self._run_step, step)] = step
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        timings[step] = future.result()
+                    except Exception as e:
+                        LOG.error(f'Failed to execute the step {step}: {e}')
+                        failures[step] = e
+                        continue
+
+                    LOG.debug(f'{step} took {timings[step]:.6f}s')
+                    for dependent in dependents[step]:
+                        waiting[dependent] -= 1
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+
+        if failures:
+            skipped = [step for step in steps
+                       if step not in timings and step not in failures]
+            raise TreeException.migration_failed(failures, skipped, timings)
+        return timings
+
+
+def _scan_directory(path: str) -> Tuple[list, list]:
+    # Run by the threads, the stat of a file is a system call on POSIX
+    directories = []
+    files = []
+    try:
+        with scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append((entry.name, entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.name, entry.path, stat.st_mtime_ns,
+                                  stat.st_size))
+    except OSError as e:
+        LOG.warning(f'Failed to scan the directory {path}: {e}')
+    return directories, files
+
+
+def _hash_file(path: str, hash_name: str, chunk_size: int,
+               mmap_threshold: int) -> Optional[str]:
+    # Run by the worker processes, return None if the file is gone
+    digest = new_hash(hash_name)
+    try:
+        with open(path, 'rb') as file:
+            # An empty file can not be mapped
+            size = fstat(file.fileno()).st_size
+            if size and size >= mmap_threshold:
+                with mmap(file.fileno(), 0, access=ACCESS_READ) as mapped:
+                    digest.update(mapped)
+            else:
+                buffer = bytearray(chunk_size)
+                view = memoryview(buffer)
+                while True:
+                    size = file.readinto(buffer)
+                    if not size:
+                        break
+                    digest.update(view[:size])
+    except OSError as e:
+        LOG.warning(f'Failed to hash the file {path}: {e}')
+        return None
+    return digest.hexdigest()
+
+
+class FileTreeScanner(object):
+    r'''
+    Build the tree of a directory, the directories are the containers with
+    the <<MerkleEigenValue>>, and the regular files are the scalars whose
+    eigenvalues are the hashes of their contents. The symbolic links and the
+    other special files are skipped.
+
+        scan threads (os.scandir)        main thread          hash processes
+        dir -> [subdirs], [files] ──>  create the nodes  ──>  hash the files
+                  ^                        │                  not in the cache
+                  └──── submit subdirs ────┘
+
+    The directories are scanned by up to <max_threads> threads, and the files
+    are hashed by <processes> processes (the number of CPUs by default, 0 to
+    hash them in the calling thread), the files not smaller than
+    <mmap_threshold> are mapped rather than read by chunks.
+
+    The (mtime, size, hash) of each file is kept in <cache> by its path, so a
+    rescan by the same scanner only hashes the new and the changed files. A
+    file modified within <RACY_NS> before the scan may be modified again in
+    the same tick of the mtime, so it is not cached. The cache is a plain dict
+    which could be pickled between the runs.
+    '''
 
-__all__ = ('TreeMigration', 'ContainerNode', 'ScalarNode')
+    RACY_NS = 2 * 10 ** 9
+
+    def __init__(self, max_threads: int=8, processes: Optional[int]=None,
+                 hash_name: str='sha256', chunk_size: int=1 << 20,
+                 mmap_threshold: int=1 << 24,
+                 cache: Optional[Dict[str, Tuple[int, int, str]]]=None):
+        assert max_threads > 0
+        assert processes is None or processes >= 0
+        assert chunk_size > 0
+
+        self.max_threads = max_threads
+        self.processes = cpu_count() if processes is None else processes
+        self.hash_file = partial(_hash_file, hash_name=hash_name,
+                                 chunk_size=chunk_size,
+                                 mmap_threshold=mmap_threshold)
+        self.cache: Dict[str, Tuple[int, int, str]] = \
+            {} if cache is None else cache
+
+        # The numbers of the files hashed and reused from the cache by the
+        # last scan
+        self.hashed = 0
+        self.reused = 0
+
+    def scan(self, path: str) -> ContainerNode:
+        path = os_path.abspath(path)
+        scan_started = time_ns()
+        root = ContainerNode(os_path.basename(path) or path,
+                             MerkleEigenValue())
+        cache, self.cache = self.cache, {}
+        self.hashed = self.reused = 0
+        # The (container, name, path, mtime, size) of the files to hash
+        pending = []
+
+        with ThreadPoolExecutor(self.max_threads) as executor:
+            running = {executor.submit(_scan_directory, path): root}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    container = running.pop(future)
+                    directories, files = future.result()
+                    for name, directory in directories:
+                        # The containers are created before their children,
+                        # so nothing is checked or invalidated
+                        child = ContainerNode(name, MerkleEigenValue(),
+                                              parent=container)
+                        running[executor.submit(
+                            _scan_directory, directory)] = child
+
+                    for name, file_path, mtime, size in files:
+                        cached = cache.get(file_path)
+                        if cached is not None and cached[:2] == (mtime, size):
+                            ScalarNode(name, EigenValue(cached[2]),
+                                       parent=container)
+                            self.cache[file_path] = cached
+                            self.reused += 1
+                        else:
+                            pending.append((container, name, file_path,
+                                            mtime, size))
+
+        for (container, name, file_path, mtime, size), digest in zip(
+                pending, self._hash_files([item[2] for item in pending])):
+            if digest is None:
+                continue
+            ScalarNode(name, EigenValue(digest), parent=container)
+            if mtime < scan_started - self.RACY_NS:
+                self.cache[file_path] = (mtime, size, digest)
+            self.hashed += 1
+
+        LOG.debug(f'Scanned {path}: {self.hashed} files hashed, '
+                  f'{self.reused} files reused')
+        return root
+
+    def _hash_files(self, paths: List[str]) -> List[Optional[str]]:
+        if not paths:
+            return []
+        if self.processes == 0:
+            return [self.hash_file(path) for path in paths]
+
+        # Some chunks for each process, so a process with the large files
+        # does not hold the others
+        chunksize = max(1, len(paths) // (self.processes * 4))
+        with Pool(self.processes) as pool:
+            return pool.map(self.hash_file, paths, chunksize)
+
+
+__all__ = ('TreeMigration', 'ContainerNode', 'ScalarNode', 'EigenValue',
+           'MerkleEigenValue', 'MigrateScheme', 'MigrateStep',
+           'MigrateAction', 'FileTreeScanner')
@@ -139,3 +139,28 @@ TREE_TO = [
         'parent': 'node4'
     }
 ]
+
+
+# The eigenvalues of the containers are given, which may not tell their
+# contents, so node1 is not moved as a whole
+MIGRATE_STEPS = [
+    '<CREATE_CONTAINER root/node5>',
+    '<CREATE_CONTAINER root/node4>',
+    '<CREATE_CONTAINER root/node5/node6>',
+    '<MOVE_SCALAR root/node3/f4 -> root/node4/f4>',
+    '<MOVE_SCALAR root/node1/f1 -> root/node5/node6/f1>',
+    '<MOVE_SCALAR root/node1/f2 -> root/node5/node6/f2>',
+    '<CREATE_SCALAR root/node2/f3>',
+    '<CREATE_SCALAR root/node4/f5>',
+    '<REMOVE_CONTAINER root/node1>',
+    '<REMOVE_CONTAINER root/node3>',
+]
+MERKLE_MIGRATE_STEPS = [
+    '<CREATE_CONTAINER root/node5>',
+    '<CREATE_CONTAINER root/node4>',
+    '<MOVE_CONTAINER root/node1 -> root/node5/node6>',
+    '<MOVE_SCALAR root/node3/f4 -> root/node4/f4>',
+    '<CREATE_SCALAR root/node2/f3>',
+    '<CREATE_SCALAR root/node4/f5>',
+    '<REMOVE_CONTAINER root/node3>',
+]
@@ -162,6 +162,16 @@ INSERTION_STEPS = '''
 #   - (*)       Red node
 
 
+INSERTION_KEYS = [1000, 500, 1500, 250, 1750, 1250, 125, 65, 2000, 95, 2500,
+                  350, 750, 400, 380, 390]
+
+PRE_ORDER_KEYS = [1000, 380, 250, 95, 65, 125, 350, 500, 400, 390, 750, 1500,
+                  1250, 2000, 1750, 2500]
+
+POST_ORDER_KEYS = [65, 125, 95, 350, 250, 390, 400, 750, 500, 380, 1250, 1750,
+                   2500, 2000, 1500, 1000]
+
+
 INSERT_DUPLICATE_KEY_STEPS = INSERTION_STEPS + '''
 
 - + 1250:
@@ -10,6 +10,57 @@ from yaml import safe_load as load_yaml
 LOG = getLogger(__name__)
 
 
+def validate_red_black_tree(tree: RedBlackTree) -> int:
+    '''
+    Check the properties of red-black tree and the links between the nodes,
+    return the number of keys (with their copies) in the tree.
+    '''
+    nil = tree.ND_NULL
+    assert nil.color == Color.BLACK
+
+    def _validate(node: RBNode, parent: RBNode, lower, upper):
+        if node is nil:
+            return 1, 0
+
+        assert node.parent is parent
+        if parent is not None:
+            assert node is (parent.left if node.from_direction == Direction.LEFT
+                            else parent.right)
+        assert lower is None or lower <= node.sort_key
+        assert upper is None or node.sort_key <= upper
+        if tree.multiset:
+            assert node.count >= 1
+            assert node.sort_key != lower and node.sort_key != upper
+
+        if node.color == Color.RED:
+            assert node.left.color == node.right.color == Color.BLACK
+
+        black_height_left, size_left = _validate(node.left, node, lower,
+                                                 node.sort_key)
+        black_height_right, size_right = _validate(node.right, node,
+                                                   node.sort_key, upper)
+        assert black_height_left == black_height_right
+        size = size_left + size_right + node.count
+        if tree.order_statistic:
+            assert node.size == size
+        if tree.interval:
+            assert node.max_end == max(
+                end for end in (node.end, node.left.max_end,
+                                node.right.max_end) if end is not None)
+
+        return black_height_left + int(node.color == Color.BLACK), size
+
+    assert tree.ND_ROOT.color == Color.BLACK
+    if tree.ND_ROOT is nil:
+        assert tree.ND_MIN is tree.ND_MAX is None
+    else:
+        assert tree.ND_MIN is tree._leftmost(tree.ND_ROOT)
+        assert tree.ND_MAX is tree._rightmost(tree.ND_ROOT)
+    size = _validate(tree.ND_ROOT, None, None, None)[1]
+    assert size == len(tree)
+    return size
+
+
 class StepRecorder(RBTreeStepRecorderBase):
 
     def __init__(self):
@@ -0,0 +1,107 @@
+from imgrass_horizon.lib.algorithms.array_red_black_tree import (
+    ArrayRedBlackTree
+)
+from imgrass_horizon.lib.algorithms.red_black_tree import (
+    BLACK, RED, RBTreeException
+)
+from logging import getLogger
+from pytest import raises
+from random import Random
+
+
+LOG = getLogger(__name__)
+
+
+def validate_array_red_black_tree(tree: ArrayRedBlackTree) -> int:
+    nil = tree.NIL
+    keys, colors = tree._keys, tree._colors
+
+    def _validate(node, parent):
+        if node == nil:
+            return 1, 0
+
+        assert tree._parents[node] == parent
+        left, right = tree._lefts[node], tree._rights[node]
+        if colors[node] == RED:
+            assert colors[left] == colors[right] == BLACK
+        assert left == nil or keys[left] <= keys[node]
+        assert right == nil or keys[node] <= keys[right]
+
+        black_height_left, size_left = _validate(left, node)
+        black_height_right, size_right = _validate(right, node)
+        assert black_height_left == black_height_right
+
+        return black_height_left + int(colors[node] == BLACK), \
+               size_left + size_right + 1
+
+    assert colors[tree._root] == BLACK
+    return _validate(tree._root, nil)[1]
+
+
+class TestArrayRedBlackTree(object):
+
+    def test_insert_search_delete(self):
+        random = Random(0)
+        keys = random.sample(range(10000), 2000)
+
+        algorithm_imp = ArrayRedBlackTree(allow_dup_keys=False)
+        for key in keys:
+            assert algorithm_imp.insert(key, str(key)).key == key
+        assert validate_array_red_black_tree(algorithm_imp) == len(keys)
+
+        with raises(RBTreeException):
+            algorithm_imp.insert(keys[0])
+
+        random.shuffle(keys)
+        for index, key in enumerate(keys[:1000]):
+            assert algorithm_imp.delete(key)
+            assert not algorithm_imp.delete(key)
+            if index % 100 == 0:
+                assert validate_array_red_black_tree(algorithm_imp) == \
+                       len(keys) - index - 1
+
+        for key in keys[1000:]:
+            assert algorithm_imp.search(key).value == str(key)
+        assert algorithm_imp.search(keys[0]) is None
+
+    def test_reuse_free_slots(self):
+        algorithm_imp = ArrayRedBlackTree(key_typecode='d', with_values=False)
+        for key in range(100):
+            algorithm_imp.insert(key / 2)
+        slots = len(algorithm_imp._keys)
+
+        for key in range(0, 100, 2):
+            assert algorithm_imp.delete(key / 2)
+        for key in range(50):
+            algorithm_imp.insert(key + 0.25)
+
+        assert len(algorithm_imp._keys) == slots
+        assert validate_array_red_black_tree(algorithm_imp) == \
+               len(algorithm_imp) == 100
+
+        # A key out of the range of the typecode keeps the free slot
+        algorithm_imp = ArrayRedBlackTree(key_typecode='b')
+        algorithm_imp.insert(1)
+        algorithm_imp.insert(2)
+        assert algorithm_imp.delete(1)
+        with raises(OverflowError):
+            algorithm_imp.insert(300)
+        algorithm_imp.insert(3)
+        assert len(algorithm_imp._keys) == 3
+        assert validate_array_red_black_tree(algorithm_imp) == 2
+
+    def test_views_survive_deletions(self):
+        algorithm_imp = ArrayRedBlackTree()
+        views = {key: algorithm_imp.insert(key, str(key)) for key in range(10)}
+
+        for key in (1, 3, 5, 7):
+            assert algorithm_imp.delete(key)
+            del views[key]
+        algorithm_imp.insert(100, 'new')
+        assert validate_array_red_black_tree(algorithm_imp) == 7
+
+        for key, view in views.items():
+            assert (view.key, view.value) == (key, str(key))
+
+        with raises(AssertionError):
+            ArrayRedBlackTree(key_typecode='f')
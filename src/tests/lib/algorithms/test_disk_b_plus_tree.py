@@ -0,0 +1,103 @@
+from imgrass_horizon.lib.algorithms.disk_b_plus_tree import (
+    DiskBPlusTree, DiskBPlusTreeException
+)
+from bisect import bisect_left, insort
+from logging import getLogger
+from os import path as os_path
+from pytest import raises
+from random import Random
+from tempfile import TemporaryDirectory
+
+
+LOG = getLogger(__name__)
+
+
+class TestDiskBPlusTree(object):
+
+    def test_operations(self):
+        random = Random(0)
+        with TemporaryDirectory() as directory:
+            path = os_path.join(directory, 'index.db')
+            # Small pages and cache to exercise the splits and evictions
+            algorithm_imp = DiskBPlusTree(path, page_size=256, cache_pages=16)
+            expected = []
+            for step in range(4000):
+                key = random.randint(0, 500)
+                if random.random() < 0.6:
+                    entry = algorithm_imp.insert(key, f'value-{key}')
+                    assert entry.key == key
+                    insort(expected, key)
+                else:
+                    index = bisect_left(expected, key)
+                    found = index < len(expected) and expected[index] == key
+                    assert algorithm_imp.delete(key) == found
+                    if found:
+                        del expected[index]
+
+                if step % 1000 == 999:
+                    # Reopen the file, the pages are loaded on demand
+                    algorithm_imp.close()
+                    algorithm_imp = DiskBPlusTree(path, cache_pages=16)
+
+            assert len(algorithm_imp) == len(expected)
+            assert [entry.key for entry in algorithm_imp] == expected
+            assert [entry.key for entry in reversed(algorithm_imp)] == \
+                   expected[::-1]
+            assert algorithm_imp.min().key == expected[0]
+            assert algorithm_imp.max().key == expected[-1]
+
+            for _ in range(200):
+                key = random.randint(-5, 505)
+                entry = algorithm_imp.search(key)
+                assert (entry is not None) == (key in expected)
+                assert entry is None or entry.value == f'value-{key}'
+
+                lo, hi = sorted(random.randint(-5, 505) for _ in range(2))
+                in_range = [key for key in expected if lo <= key < hi]
+                assert [entry.key for entry in
+                        algorithm_imp.range(lo, hi)] == in_range
+                assert [entry.key for entry in
+                        algorithm_imp.range(lo, hi, True)] == in_range[::-1]
+
+            # The empty pages are released and reused
+            for key in expected:
+                assert algorithm_imp.delete(key)
+            assert len(algorithm_imp) == 0
+            assert algorithm_imp.min() is None
+            page_count = algorithm_imp.page_count
+            for key in range(100):
+                algorithm_imp.insert(key, f'value-{key}')
+            assert algorithm_imp.page_count == page_count
+            assert [entry.key for entry in algorithm_imp] == list(range(100))
+            algorithm_imp.close()
+
+    def test_exceptions(self):
+        with TemporaryDirectory() as directory:
+            path = os_path.join(directory, 'index.db')
+            with DiskBPlusTree(path, allow_dup_keys=False,
+                               page_size=256) as algorithm_imp:
+                algorithm_imp.insert(1, 'a')
+                with raises(DiskBPlusTreeException):
+                    algorithm_imp.insert(1, 'b')
+                with raises(DiskBPlusTreeException):
+                    algorithm_imp.insert(2, 'x' * 256)
+
+            # The settings are read from the existing file
+            with DiskBPlusTree(path) as algorithm_imp:
+                assert not algorithm_imp.allow_dup_keys
+                assert algorithm_imp.page_size == 256
+                assert algorithm_imp.search(1).value == 'a'
+
+            bad_path = os_path.join(directory, 'bad.db')
+            with open(bad_path, 'wb') as bad_file:
+                bad_file.write(b'\0' * 4096)
+            with raises(DiskBPlusTreeException):
+                DiskBPlusTree(bad_path)
+
+            # A short file is not truncated as a new one
+            with open(bad_path, 'wb') as bad_file:
+                bad_file.write(b'user data')
+            with raises(DiskBPlusTreeException):
+                DiskBPlusTree(bad_path)
+            with open(bad_path, 'rb') as bad_file:
+                assert bad_file.read() == b'user data'
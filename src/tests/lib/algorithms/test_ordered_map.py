@@ -0,0 +1,172 @@
+from imgrass_horizon.lib.algorithms.avl_tree import AVLTree
+from imgrass_horizon.lib.algorithms.b_tree import BTree
+from imgrass_horizon.lib.algorithms.ordered_map import (
+    OrderedMapBase, OrderedMapException
+)
+from imgrass_horizon.lib.algorithms.ordered_map_selector import (
+    DEFAULT_CANDIDATES, OperationTrace, select_ordered_map
+)
+from imgrass_horizon.lib.algorithms.red_black_tree import RedBlackTree
+from imgrass_horizon.lib.algorithms.skip_list import SkipList
+from imgrass_horizon.lib.algorithms.treap import Treap
+from bisect import bisect_left, insort
+from functools import partial
+from logging import getLogger
+from pytest import raises
+from random import Random
+
+
+LOG = getLogger(__name__)
+
+
+def validate_avl_tree(tree: AVLTree):
+
+    def _validate(node):
+        if node is tree.ND_NULL:
+            return 0
+        height_left = _validate(node.left)
+        height_right = _validate(node.right)
+        assert abs(height_left - height_right) <= 1
+        assert node.height == max(height_left, height_right) + 1
+        return node.height
+
+    _validate(tree.ND_ROOT)
+
+
+def validate_treap(tree: Treap):
+
+    def _validate(node):
+        for child in (node.left, node.right):
+            if child is not tree.ND_NULL:
+                assert child.priority <= node.priority
+                _validate(child)
+
+    if tree.ND_ROOT is not tree.ND_NULL:
+        _validate(tree.ND_ROOT)
+
+
+def validate_skip_list(skip_list: SkipList):
+    keys = [node.key for node in skip_list]
+    for level in range(skip_list.level):
+        level_keys = []
+        node = skip_list.ND_HEAD.forward[level]
+        while node is not None:
+            level_keys.append(node.key)
+            node = node.forward[level]
+        assert level_keys == sorted(level_keys)
+        assert set(level_keys) <= set(keys)
+
+    assert [node.key for node in reversed(skip_list)] == keys[::-1]
+
+
+def validate_b_tree(tree: BTree):
+    t = tree.min_degree
+    leaf_depths = set()
+
+    def _validate(node, depth, is_root):
+        assert node.keys == [entry.key for entry in node.entries]
+        assert node.keys == sorted(node.keys)
+        assert len(node.keys) <= 2 * t - 1
+        assert is_root or len(node.keys) >= t - 1
+        if not node.children:
+            leaf_depths.add(depth)
+            return
+        assert len(node.children) == len(node.keys) + 1
+        for child in node.children:
+            _validate(child, depth + 1, False)
+
+    _validate(tree.ND_ROOT, 0, True)
+    assert len(leaf_depths) == 1
+
+
+def check_ordered_map(ordered_map: OrderedMapBase, validate, seed: int):
+    # Compare <ordered_map> with a sorted list under random modifications
+    random = Random(seed)
+    expected = []
+    for step in range(3000):
+        key = random.randint(0, 300)
+        if random.random() < 0.55:
+            entry = ordered_map.insert(key, -key)
+            assert entry.key == key and entry.value == -key
+            insort(expected, key)
+        else:
+            index = bisect_left(expected, key)
+            found = index < len(expected) and expected[index] == key
+            assert ordered_map.delete(key) == found
+            if found:
+                del expected[index]
+
+        if step % 300 == 0:
+            validate(ordered_map)
+
+    validate(ordered_map)
+    assert len(ordered_map) == len(expected)
+    assert [entry.key for entry in ordered_map] == expected
+    assert [entry.key for entry in reversed(ordered_map)] == expected[::-1]
+    assert ordered_map.min().key == expected[0]
+    assert ordered_map.max().key == expected[-1]
+
+    for _ in range(200):
+        key = random.randint(-10, 310)
+        entry = ordered_map.search(key)
+        assert (entry is not None) == (key in expected)
+        assert entry is None or entry.value == -key
+
+        lo, hi = sorted(random.randint(-10, 310) for _ in range(2))
+        lo = None if random.random() < 0.1 else lo
+        hi = None if random.random() < 0.1 else hi
+        in_range = [key for key in expected
+                    if (lo is None or lo <= key) and (hi is None or key < hi)]
+        assert [entry.key for entry in ordered_map.range(lo, hi)] == in_range
+        assert [entry.key for entry in ordered_map.range(lo, hi, True)] == \
+               in_range[::-1]
+
+    for key in expected[:]:
+        assert ordered_map.delete(key)
+    assert len(ordered_map) == 0
+    assert ordered_map.min() is None and ordered_map.max() is None
+    assert list(ordered_map) == []
+
+
+class TestOrderedMap(object):
+
+    def test_implementations(self):
+        implementations = [
+            (AVLTree(), validate_avl_tree),
+            (Treap(seed=0), validate_treap),
+            (SkipList(seed=0), validate_skip_list),
+            (BTree(min_degree=2), validate_b_tree),
+            (BTree(min_degree=3), validate_b_tree),
+        ]
+        for seed, (ordered_map, validate) in enumerate(implementations):
+            LOG.info(f'check {type(ordered_map).__name__}')
+            check_ordered_map(ordered_map, validate, seed)
+
+    def test_no_dup_keys(self):
+        for candidate in DEFAULT_CANDIDATES:
+            ordered_map = candidate(allow_dup_keys=False)
+            for key in range(100):
+                ordered_map.insert(key, key)
+            for key in (0, 50, 99):
+                with raises(OrderedMapException):
+                    ordered_map.insert(key, key)
+            assert len(ordered_map) == 100
+            assert [entry.key for entry in ordered_map] == list(range(100))
+
+    def test_select_ordered_map(self):
+        random = Random(0)
+        trace = OperationTrace(RedBlackTree())
+        for _ in range(500):
+            key = random.randint(0, 100)
+            trace.insert(key, key)
+            trace.search(random.randint(0, 100))
+        assert trace.delete(trace.min().key)
+        in_range = [node.key for node in trace.ordered_map.range(10, 20)]
+        assert [node.key for node in trace.range(10, 20)] == in_range
+        assert len(trace.operations) == 1002
+
+        candidates = DEFAULT_CANDIDATES + (partial(BTree, min_degree=64),)
+        best, timings = select_ordered_map(trace.operations, candidates,
+                                           repeat=1)
+        assert set(timings) == set(candidates)
+        assert timings[best] == min(timings.values())
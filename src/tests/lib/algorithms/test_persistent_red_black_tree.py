@@ -0,0 +1,93 @@
+from imgrass_horizon.lib.algorithms.persistent_red_black_tree import (
+    PersistentRedBlackTree, RBTreeSnapshot
+)
+from imgrass_horizon.lib.algorithms.red_black_tree import (
+    BLACK, RED, RBTreeException
+)
+from logging import getLogger
+from pytest import raises
+from random import Random
+
+
+LOG = getLogger(__name__)
+
+
+def validate_snapshot(snapshot: RBTreeSnapshot) -> int:
+
+    def _validate(node, lower, upper):
+        if node is None:
+            return 1, 0
+
+        assert lower is None or lower < node.key
+        assert upper is None or node.key < upper
+        if node.color == RED:
+            assert node.left is None or node.left.color == BLACK
+            assert node.right is None or node.right.color == BLACK
+
+        black_height_left, size_left = _validate(node.left, lower, node.key)
+        black_height_right, size_right = _validate(node.right, node.key,
+                                                   upper)
+        assert black_height_left == black_height_right
+
+        return black_height_left + int(node.color == BLACK), \
+               size_left + size_right + 1
+
+    assert snapshot.ND_ROOT is None or snapshot.ND_ROOT.color == BLACK
+    size = _validate(snapshot.ND_ROOT, None, None)[1]
+    assert size == len(snapshot)
+    return size
+
+
+class TestPersistentRedBlackTree(object):
+
+    def test_snapshots(self):
+        random = Random(0)
+        algorithm_imp = PersistentRedBlackTree()
+        expected = {}
+        versions = []
+        for _ in range(3000):
+            key = random.randint(0, 500)
+            if random.random() < 0.6:
+                algorithm_imp.insert(key, -key)
+                expected[key] = -key
+            else:
+                assert algorithm_imp.delete(key) == \
+                       (expected.pop(key, None) is not None)
+            versions.append((algorithm_imp.snapshot(), sorted(expected)))
+
+        # The old versions are not changed by the following modifications
+        for snapshot, keys in versions[::100]:
+            assert validate_snapshot(snapshot) == len(keys)
+            assert [node.key for node in snapshot] == keys
+        assert [node.value for node in algorithm_imp] == \
+               [-key for key in sorted(expected)]
+
+        key = sorted(expected)[len(expected) // 2]
+        assert algorithm_imp.search(key).value == -key
+        assert [node.key for node in algorithm_imp.range(key, key + 50)] == \
+               [k for k in sorted(expected) if key <= k < key + 50]
+        assert [node.key for node in algorithm_imp.range(hi=key,
+                                                         reverse=True)] == \
+               [k for k in sorted(expected, reverse=True) if k < key]
+
+    def test_path_copying(self):
+        algorithm_imp = PersistentRedBlackTree.from_sorted(
+            (key, str(key)) for key in range(0, 2000, 2))
+        snapshot = algorithm_imp.snapshot()
+        assert validate_snapshot(snapshot) == 1000
+
+        algorithm_imp.insert(1001, 'new')
+        algorithm_imp.insert(0, 'zero')
+        assert snapshot.search(1001) is None
+        assert snapshot.search(0).value == '0'
+        assert algorithm_imp.search(0).value == 'zero'
+        assert validate_snapshot(algorithm_imp.snapshot()) == 1001
+
+        old_nodes = {id(node) for node in snapshot}
+        new_nodes = [node for node in algorithm_imp
+                     if id(node) not in old_nodes]
+        assert len(new_nodes) < 50
+
+        with raises(RBTreeException) as exc_info:
+            PersistentRedBlackTree.from_sorted([(1, None), (1, None)])
+        assert exc_info.value.info.dup_key == 1
@@ -1,10 +1,17 @@
-from .algorithm import AlgorithmStepFollower, StepRecorder
+from .algorithm import (
+    AlgorithmStepFollower, StepRecorder, validate_red_black_tree
+)
 from __data__ import fake_red_black_tree as fake_tree
 from imgrass_horizon.lib.algorithms.red_black_tree import (
-    RBTreeException, RedBlackTree
+    MappedRedBlackTree, RBNode, RBTreeException, RedBlackTree, StatsRecorder,
+    pack_key
 )
+from io import BytesIO
 from logging import getLogger
+from os import path as os_path
 from pytest import raises
+from random import Random
+from tempfile import TemporaryDirectory
 
 
 LOG = getLogger(__name__)
@@ -39,7 +46,534 @@ class TestRedBlackTree(object):
         assert exc_info.value.info.dup_key == dup_key
 
     def test_delete(self):
-        ...
+        random = Random(0)
+        keys = random.sample(range(10000), 2000)
+
+        algorithm_imp = RedBlackTree(allow_dup_keys=False)
+        nodes = {key: algorithm_imp.insert(key, str(key)) for key in keys}
+        assert validate_red_black_tree(algorithm_imp) == len(keys)
+
+        random.shuffle(keys)
+        for index, key in enumerate(keys):
+            assert algorithm_imp.delete(key)
+            assert not algorithm_imp.delete(key)
+            assert algorithm_imp.search(key) is None
+            nodes.pop(key)
+            if index % 100 == 0:
+                assert validate_red_black_tree(algorithm_imp) == len(nodes)
+                # The nodes are moved rather than copied while deleting
+                for node in nodes.values():
+                    assert algorithm_imp.search(node.key) is node
+                    assert node.value == str(node.key)
+
+        assert algorithm_imp.ND_ROOT is algorithm_imp.ND_NULL
+
+    def test_compact_node(self):
+        assert not hasattr(RBNode(1, None), '__dict__')
+        assert RedBlackTree().ND_NULL is RedBlackTree().ND_NULL
+
+        class CustomNode(RBNode):
+
+            def __init__(self, key, value):
+                super().__init__(key, value)
+                self.extra = f'<{key}>'
+
+        algorithm_imp = RedBlackTree(rb_node_cls=CustomNode)
+        for key in range(100):
+            algorithm_imp.insert(key, None)
+
+        assert validate_red_black_tree(algorithm_imp) == 100
+        assert algorithm_imp.search(50).extra == '<50>'
+
+    def test_from_sorted(self):
+        for length in (0, 1, 2, 3, 4, 7, 8, 1000, 1023, 1024):
+            algorithm_imp = RedBlackTree.from_sorted(
+                (key, str(key)) for key in range(length))
+            assert validate_red_black_tree(algorithm_imp) == length
+
+            for key in range(length):
+                assert algorithm_imp.search(key).value == str(key)
+
+            algorithm_imp.insert(length // 2, None)
+            algorithm_imp.delete(0)
+            assert validate_red_black_tree(algorithm_imp) == length
+
+        with raises(RBTreeException) as exc_info:
+            RedBlackTree.from_sorted([(1, None), (3, None), (2, None)])
+        assert exc_info.value.info.key == 2
+
+        with raises(RBTreeException) as exc_info:
+            RedBlackTree.from_sorted([(1, None), (1, None)],
+                                     allow_dup_keys=False)
+        assert exc_info.value.info.dup_key == 1
+
+    def test_from_unsorted(self):
+        keys = Random(0).sample(range(10000), 2000)
+        algorithm_imp = RedBlackTree.from_unsorted(
+            (key, None) for key in keys)
+        assert validate_red_black_tree(algorithm_imp) == len(keys)
+
+    def test_order_statistic(self):
+        random = Random(0)
+        keys = random.sample(range(10000), 2000)
+
+        algorithm_imp = RedBlackTree(order_statistic=True)
+        for key in keys:
+            algorithm_imp.insert(key, None)
+        for key in keys[:1000]:
+            algorithm_imp.delete(key)
+        assert validate_red_black_tree(algorithm_imp) == 1000
+
+        keys = sorted(keys[1000:])
+        for index in (0, 1, 500, 999, -1):
+            assert algorithm_imp.select(index).key == keys[index]
+            assert algorithm_imp.rank(keys[index]) == index % 1000
+        assert algorithm_imp.rank(-1) == 0
+        assert algorithm_imp.rank(10000) == 1000
+        assert algorithm_imp.count_range(keys[100], keys[200]) == 100
+        assert algorithm_imp.count_range(keys[100] + 1) == 899
+        assert algorithm_imp.count_range(keys[200], keys[100]) == 0
+
+        with raises(RBTreeException) as exc_info:
+            algorithm_imp.select(1000)
+        assert exc_info.value.info.index == 1000
+
+        bulk_loaded = RedBlackTree.from_sorted(((key, None) for key in keys),
+                                               order_statistic=True)
+        assert validate_red_black_tree(bulk_loaded) == 1000
+        assert bulk_loaded.select(321).key == keys[321]
+
+        with raises(RBTreeException) as exc_info:
+            RedBlackTree().rank(1)
+        assert exc_info.value.info.feature == 'rank'
+
+    def test_split_and_join(self):
+        keys = Random(0).sample(range(10000), 2000)
+        for key in (-1, keys[0], keys[0] + 1, 10000):
+            algorithm_imp = RedBlackTree.from_unsorted(
+                ((key, None) for key in keys), allow_dup_keys=False)
+            left, nd_matched, right = algorithm_imp.split(key)
+            assert len(algorithm_imp) == 0
+
+            assert [node.key for node in left] == \
+                   sorted(k for k in keys if k < key)
+            assert [node.key for node in right] == \
+                   sorted(k for k in keys if k > key)
+            assert (nd_matched is not None) == (key in keys)
+            validate_red_black_tree(left)
+            validate_red_black_tree(right)
+
+            if nd_matched is None:
+                joined = RedBlackTree.join(left, key, right)
+                assert validate_red_black_tree(joined) == len(keys) + 1
+                assert joined.search(key) is not None
+                assert len(left) == len(right) == 0
+
+        left = RedBlackTree.from_sorted([(1, None), (5, None)])
+        right = RedBlackTree.from_sorted([(7, None)])
+        with raises(RBTreeException) as exc_info:
+            RedBlackTree.join(left, 4, right)
+        assert exc_info.value.info.key == 4
+
+        # The black heights are passed down, only the root is walked
+        algorithm_imp = RedBlackTree.from_unsorted(
+            (key, None) for key in keys)
+        walks = []
+        black_height = algorithm_imp._black_height
+        algorithm_imp._black_height = \
+            lambda root: walks.append(root) or black_height(root)
+        left, _, right = algorithm_imp.split(keys[1])
+        assert len(walks) == 1
+        validate_red_black_tree(left)
+        validate_red_black_tree(right)
+
+        # The duplicated keys may be left in either side, in order
+        algorithm_imp = RedBlackTree.from_sorted(
+            (key // 10, index) for index, key in enumerate(range(300)))
+        left, nd_matched, right = algorithm_imp.split(15)
+        values = [node.value for node in left] + [nd_matched.value] + \
+                 [node.value for node in right]
+        assert values == list(range(300))
+        assert all(node.key <= 15 for node in left)
+        assert all(node.key >= 15 for node in right)
+
+    def test_set_operations(self):
+        random = Random(0)
+        keys1 = set(random.sample(range(3000), 1000))
+        keys2 = set(random.sample(range(3000), 1000))
+
+        for processes in (0, 2):
+            for operation, expected_keys in (('union', keys1 | keys2),
+                                             ('intersection', keys1 & keys2),
+                                             ('difference', keys1 - keys2)):
+                tree1, tree2 = (
+                    RedBlackTree.from_unsorted(((key, index) for key in keys),
+                                               order_statistic=True)
+                    for index, keys in enumerate((keys1, keys2)))
+
+                result = getattr(tree1, operation)(tree2, processes=processes)
+                assert validate_red_black_tree(result) == len(expected_keys)
+                assert [node.key for node in result] == sorted(expected_keys)
+                assert all(node.value == int(node.key not in keys1)
+                           for node in result)
+                assert len(tree1) == len(tree2) == 0
+
+            # The workers keep the ends and the counts of the nodes
+            tree1, tree2 = RedBlackTree(interval=True), \
+                RedBlackTree(interval=True)
+            for tree, keys in ((tree1, keys1), (tree2, keys2)):
+                for key in keys:
+                    tree.insert(key, None, key + 100)
+            result = tree1.union(tree2, processes=processes)
+            validate_red_black_tree(result)
+            assert all(node.end == node.key + 100 for node in result)
+
+            tree1, tree2 = (
+                RedBlackTree.from_sorted(((key, None) for key in sorted(keys)
+                                          for _ in range(count)),
+                                         multiset=True)
+                for count, keys in ((2, keys1), (3, keys2)))
+            result = tree1.intersection(tree2, processes=processes)
+            assert validate_red_black_tree(result) == \
+                   2 * len(keys1 & keys2)
+
+    def test_batch_operations(self):
+        random = Random(0)
+        keys = random.sample(range(10000), 3000)
+
+        algorithm_imp = RedBlackTree(allow_dup_keys=False)
+        nodes = algorithm_imp.insert_many([(key, -key) for key in keys[:1000]])
+        assert [node.key for node in nodes] == keys[:1000]
+        nodes = algorithm_imp.insert_many([(key, -key) for key in keys[1000:]])
+        assert [node.value for node in nodes] == [-key for key in keys[1000:]]
+        assert validate_red_black_tree(algorithm_imp) == 3000
+
+        queries = [random.randint(-10, 10010) for _ in range(2000)]
+        assert algorithm_imp.search_many(queries) == \
+               [algorithm_imp.search(key) for key in queries]
+        assert algorithm_imp.search_many([]) == []
+
+        with raises(RBTreeException) as exc_info:
+            algorithm_imp.insert_many([(-1, None), (keys[5], None)])
+        assert exc_info.value.info.dup_key == keys[5]
+
+    def test_finger(self):
+        random = Random(0)
+        keys = [index * 2 + random.randint(0, 1) for index in range(3000)]
+
+        algorithm_imp = RedBlackTree(allow_dup_keys=False, finger=True)
+        for key in keys:
+            algorithm_imp.insert(key, -key)
+        assert algorithm_imp.ND_FINGER.key == keys[-1]
+        assert validate_red_black_tree(algorithm_imp) == 3000
+
+        with raises(RBTreeException):
+            algorithm_imp.insert(keys[10], None)
+
+        for key in range(-5, 6010):
+            node = algorithm_imp.search(key)
+            assert (node is not None and node.value == -key) == (key in keys)
+        assert algorithm_imp.search(3000.5) is None
+        assert algorithm_imp.search(keys[1500]).key == keys[1500]
+
+        random.shuffle(keys)
+        for index, key in enumerate(keys):
+            assert algorithm_imp.delete(key)
+            assert not algorithm_imp.delete(key)
+            if index % 300 == 0:
+                assert validate_red_black_tree(algorithm_imp) == 2999 - index
+        assert algorithm_imp.ND_FINGER is None
+
+        algorithm_imp = RedBlackTree.from_sorted([(key, None) for key in
+                                                  range(100)], finger=True)
+        algorithm_imp.insert(50.5, None)
+        assert algorithm_imp.search(50).key == 50
+        assert validate_red_black_tree(algorithm_imp) == 101
+
+    def test_multiset(self):
+        random = Random(0)
+        keys = [int(random.paretovariate(1)) for _ in range(5000)]
+        counter = {key: keys.count(key) for key in set(keys)}
+
+        algorithm_imp = RedBlackTree(multiset=True, order_statistic=True)
+        first_nodes = {}
+        for key in keys:
+            node = algorithm_imp.insert(key, str(key))
+            assert first_nodes.setdefault(key, node) is node
+        assert validate_red_black_tree(algorithm_imp) == len(keys)
+        assert sum(1 for _ in algorithm_imp) == len(counter)
+
+        hot_key = max(counter, key=counter.get)
+        assert algorithm_imp.count(hot_key) == counter[hot_key]
+        assert algorithm_imp.count(-1) == 0
+        assert algorithm_imp.rank(hot_key + 1) == \
+               sum(count for key, count in counter.items() if key <= hot_key)
+        assert algorithm_imp.select(counter[1] - 1).key == 1
+        assert algorithm_imp.select(counter[1]).key == 2
+
+        assert algorithm_imp.remove_one(hot_key)
+        assert algorithm_imp.count(hot_key) == counter[hot_key] - 1
+        assert algorithm_imp.remove_all(hot_key) == counter[hot_key] - 1
+        assert not algorithm_imp.remove_one(hot_key)
+        assert algorithm_imp.remove_all(hot_key) == 0
+        assert validate_red_black_tree(algorithm_imp) == \
+               len(keys) - counter[hot_key]
+
+        bulk_loaded = RedBlackTree.from_sorted([(key, None) for key in
+                                                sorted(keys)], multiset=True)
+        assert validate_red_black_tree(bulk_loaded) == len(keys)
+        bulk_loaded.insert_many([(key, None) for key in keys[:100]])
+        assert bulk_loaded.count(keys[0]) == counter[keys[0]] + \
+               keys[:100].count(keys[0])
+        assert validate_red_black_tree(bulk_loaded) == len(keys) + 100
+
+        # The trees allowing duplicated keys count their nodes
+        algorithm_imp = RedBlackTree()
+        for key in [3, 1, 3, 2, 3]:
+            algorithm_imp.insert(key, None)
+        assert algorithm_imp.count(3) == 3
+        assert algorithm_imp.remove_one(3)
+        assert algorithm_imp.remove_all(3) == 2
+        assert validate_red_black_tree(algorithm_imp) == 2
+
+    def test_interval(self):
+        random = Random(0)
+        intervals = []
+        for _ in range(2000):
+            start = random.randint(0, 100000)
+            intervals.append((start, start + random.randint(0, 500)))
+
+        algorithm_imp = RedBlackTree(interval=True)
+        nodes = [algorithm_imp.insert(start, index, end)
+                 for index, (start, end) in enumerate(intervals)]
+        for node in nodes[:500]:
+            algorithm_imp.delete_node(node)
+        assert validate_red_black_tree(algorithm_imp) == 1500
+
+        for a, b in [(0, 100000), (5000, 5000), (40000, 42000), (-10, -1),
+                     (100001, 200000)]:
+            expected = sorted(
+                (start, index) for index, (start, end) in enumerate(intervals)
+                if index >= 500 and start <= b and a <= end)
+            assert sorted((node.key, node.value) for node in
+                          algorithm_imp.overlapping(a, b)) == expected
+            assert [node.key for node in algorithm_imp.overlapping(a, b)] == \
+                   [start for start, _ in expected]
+
+        algorithm_imp.insert(7, 'point')
+        assert [node.value for node in algorithm_imp.overlapping(7, 7)] == \
+               ['point']
+
+        with raises(RBTreeException) as exc_info:
+            next(RedBlackTree().overlapping(1, 2))
+        assert exc_info.value.info.feature == 'overlapping'
+
+        with raises(ValueError):
+            algorithm_imp.insert(10, 'reversed', 5)
+        assert all(node.value != 'reversed' for node in algorithm_imp)
+
+    def test_priority_queue(self):
+        random = Random(0)
+        keys = [random.randint(0, 1000) for _ in range(3000)]
+
+        algorithm_imp = RedBlackTree(finger=True)
+        assert algorithm_imp.peek_min() is algorithm_imp.pop_max() is None
+        for key in keys[:2000]:
+            algorithm_imp.insert(key, None)
+        assert validate_red_black_tree(algorithm_imp) == 2000
+
+        popped = []
+        for key in keys[2000:]:
+            algorithm_imp.insert(key, None)
+            assert algorithm_imp.peek_min().key == algorithm_imp.min().key
+            popped.append(algorithm_imp.pop_min().key)
+            popped.append(algorithm_imp.pop_max().key)
+            assert algorithm_imp.peek_max().key <= popped[-1]
+        assert validate_red_black_tree(algorithm_imp) == 1000
+
+        remaining = [node.key for node in algorithm_imp]
+        assert sorted(popped + remaining) == sorted(keys)
+
+        node = algorithm_imp.search(remaining[500])
+        algorithm_imp.delete_node(node)
+        assert node.parent is None and len(algorithm_imp) == 999
+        while algorithm_imp.pop_max() is not None:
+            pass
+        assert validate_red_black_tree(algorithm_imp) == 0
+
+        algorithm_imp = RedBlackTree.from_sorted(
+            [(key, None) for key in sorted(keys)], multiset=True)
+        assert algorithm_imp.pop_min().key == min(keys)
+        assert algorithm_imp.count(min(keys)) == keys.count(min(keys)) - 1
+        left, _, right = algorithm_imp.split(500)
+        assert left.peek_max().key < 500 < right.peek_min().key
+
+    def test_hash_index(self):
+        random = Random(0)
+        for kwargs in [{}, {'multiset': True}, {'finger': True}]:
+            algorithm_imp = RedBlackTree(hash_index=True, **kwargs)
+            for _ in range(3000):
+                key = random.randint(0, 300)
+                if random.random() < 0.6:
+                    algorithm_imp.insert(key, key)
+                else:
+                    algorithm_imp.delete(key)
+            assert validate_red_black_tree(algorithm_imp) == \
+                   len(algorithm_imp)
+
+            # Each key maps to one of its nodes in the tree
+            keys = {node.key for node in algorithm_imp}
+            assert set(algorithm_imp.hash_index) == keys
+            for key in range(-1, 302):
+                node = algorithm_imp.search(key)
+                assert (node is not None) == (key in keys)
+                assert node is None or node.key == key
+            assert algorithm_imp.search_many([5, 400]) == \
+                   [algorithm_imp.search(5), None]
+
+            # The trees replaced as a whole rebuild their indexes
+            left, _, right = algorithm_imp.split(150)
+            for tree in (left, right):
+                assert set(tree.hash_index) == {node.key for node in tree}
+            joined = RedBlackTree.join(left, 150.5, right)
+            assert joined.search(150.5).key == 150.5
+            assert set(joined.hash_index) == {node.key for node in joined}
+
+    def test_key_function(self):
+        random = Random(0)
+        keys = [(random.choice(['', 'a', 'a\0', 'ab', 'b']),
+                 random.randint(-2 ** 40, 2 ** 40), random.uniform(-9, 9))
+                for _ in range(300)]
+        # The packed keys are ordered as the keys
+        assert sorted(keys, key=pack_key) == sorted(keys)
+
+        algorithm_imp = RedBlackTree(order_statistic=True, hash_index=True,
+                                     key=pack_key)
+        for key in keys:
+            algorithm_imp.insert(key, key)
+        validate_red_black_tree(algorithm_imp)
+        # The nodes are compared by the packed keys, but return the originals
+        assert [node.key for node in algorithm_imp] == sorted(keys)
+        assert all(node.sort_key == pack_key(node.key)
+                   for node in algorithm_imp)
+
+        keys.sort()
+        lo, hi = keys[50], keys[100]
+        assert algorithm_imp.search(lo).key == lo
+        assert algorithm_imp.search(('c', 0, 0.0)) is None
+        assert [node.key for node in algorithm_imp.search_many([lo, hi])] \
+               == [lo, hi]
+        assert [node.key for node in algorithm_imp.range(lo, hi)] == \
+               keys[50:100]
+        assert algorithm_imp.count_range(lo) == 250
+        assert algorithm_imp.rank(hi) == 100
+        assert algorithm_imp.floor(('b', 2 ** 41, 0.0)).key == keys[-1]
+        assert algorithm_imp.ceiling(('', 0, 0.0)).key == \
+               min(key for key in keys if key >= ('', 0, 0.0))
+        assert (algorithm_imp.min().key, algorithm_imp.max().key) == \
+               (keys[0], keys[-1])
+
+        buffer = BytesIO()
+        algorithm_imp.dump(buffer)
+        buffer.seek(0)
+        loaded = RedBlackTree.load(buffer, key=pack_key)
+        validate_red_black_tree(loaded)
+        assert [node.key for node in loaded] == keys
+        assert loaded.search(hi).key == hi
+        with TemporaryDirectory() as directory:
+            path = os_path.join(directory, 'tree.dump')
+            with open(path, 'wb') as dump_file:
+                dump_file.write(buffer.getvalue())
+            with MappedRedBlackTree(path, key=pack_key) as mapped:
+                assert mapped.search(hi).key == hi
+                assert mapped.search(('c', 0, 0.0)) is None
+
+        left, _, right = algorithm_imp.split(hi)
+        assert [node.key for node in right] == keys[101:]
+        algorithm_imp = RedBlackTree.join(left, hi, right, hi)
+        assert algorithm_imp.search(hi).key == hi
+        assert algorithm_imp.delete(lo) and not algorithm_imp.search(lo)
+        assert len(algorithm_imp) == 299
+        assert algorithm_imp.pop_min().key == keys[0]
+        assert algorithm_imp.pop_max().key == keys[-1]
+
+        algorithm_imp = RedBlackTree.from_unsorted(
+            [(key, key) for key in keys[::-1]], key=pack_key)
+        assert [node.key for node in algorithm_imp] == keys
+        other = RedBlackTree(key=pack_key)
+        other.insert_many([(key, None) for key in keys[::2]])
+        for processes in (0, 2):
+            copied = RedBlackTree.from_sorted(
+                [(key, key) for key in keys[1::2]], key=pack_key)
+            union = copied.union(RedBlackTree.from_sorted(
+                [(node.key, None) for node in other], key=pack_key),
+                processes=processes)
+            validate_red_black_tree(union)
+            assert [node.key for node in union] == keys
+
+        with raises(OverflowError):
+            pack_key(2 ** 64)
+        with raises(TypeError):
+            RedBlackTree(interval=True, key=pack_key)
+        with raises(TypeError):
+            RedBlackTree(step_recorder=StepRecorder(), key=pack_key)
+
+    def test_dump_and_load(self):
+        random = Random(0)
+        for kwargs in [{}, {'order_statistic': True}, {'multiset': True},
+                       {'interval': True}]:
+            algorithm_imp = RedBlackTree(**kwargs)
+            for _ in range(1000):
+                key = random.randint(0, 500)
+                algorithm_imp.insert(key, f'value-{key}')
+            for _ in range(300):
+                algorithm_imp.delete(random.randint(0, 500))
+
+            dumped = BytesIO()
+            algorithm_imp.dump(dumped)
+            dumped.seek(0)
+            loaded = RedBlackTree.load(dumped, **kwargs)
+            assert validate_red_black_tree(loaded) == len(algorithm_imp)
+            # The shape and the colors are restored as they were
+            assert [(node.key, node.value, node.color, node.count)
+                    for node in loaded.pre_order_traversal()] == \
+                   [(node.key, node.value, node.color, node.count)
+                    for node in algorithm_imp.pre_order_traversal()]
+
+            with TemporaryDirectory() as directory:
+                path = os_path.join(directory, 'tree.dump')
+                with open(path, 'wb') as dump_file:
+                    dump_file.write(dumped.getvalue())
+                with MappedRedBlackTree(path) as mapped:
+                    assert len(mapped) == len(algorithm_imp)
+                    for key in range(-1, 502):
+                        node = algorithm_imp.search(key)
+                        entry = mapped.search(key)
+                        assert (node is None) == (entry is None)
+                        assert node is None or \
+                               (entry.value, entry.count) == \
+                               (node.value, node.count)
+
+                # A truncated file is refused rather than read out of range
+                data = dumped.getvalue()
+                for size in (10, 200, len(data) - 1):
+                    with open(path, 'wb') as dump_file:
+                        dump_file.write(data[:size])
+                    with raises(RBTreeException) as exc_info:
+                        MappedRedBlackTree(path)
+                    assert exc_info.value.function == 'bad_dump'
+                    with raises(RBTreeException) as exc_info:
+                        RedBlackTree.load(BytesIO(data[:size]), **kwargs)
+                    assert exc_info.value.function == 'bad_dump'
+
+        dumped = BytesIO()
+        RedBlackTree(multiset=True).dump(dumped)
+        dumped.seek(0)
+        with raises(RBTreeException) as exc_info:
+            RedBlackTree.load(dumped)
+        assert exc_info.value.function == 'bad_dump'
+        with raises(RBTreeException):
+            RedBlackTree.load(BytesIO(b'not a dumped tree'))
 
     def test_search_matched(self):
         step_recorder = StepRecorder()
@@ -55,12 +589,204 @@ class TestRedBlackTree(object):
                                          algorithm_imp, step_recorder)
         follower.run()
 
+    def test_close_step_recorder(self):
+        step_recorder = StepRecorder()
+        algorithm_imp = RedBlackTree(step_recorder=step_recorder)
+        algorithm_imp.open_step_recorder()
+        assert algorithm_imp.enable_step_recorder
+        assert algorithm_imp.search.__name__ == '_search_traced'
+
+        algorithm_imp.close_step_recorder()
+        assert not algorithm_imp.enable_step_recorder
+        assert algorithm_imp.search.__name__ == 'search'
+        assert algorithm_imp.insert(400, None).key == 400
+        assert step_recorder.is_empty
+
+    def test_stats_recorder(self):
+        random = Random(0)
+        stats = StatsRecorder()
+        algorithm_imp = RedBlackTree(step_recorder=stats)
+        algorithm_imp.open_step_recorder()
+
+        # Count the real rotations to check the ones derived from the cases
+        rotations = []
+        for name in ('_rotate_left', '_rotate_right'):
+            def _rotate(node, rotate=getattr(algorithm_imp, name)):
+                rotations.append(node)
+                rotate(node)
+            setattr(algorithm_imp, name, _rotate)
+
+        keys = random.sample(range(10000), 2000)
+        for key in keys:
+            algorithm_imp.insert(key, None)
+        assert sum(stats.rotations.values()) == len(rotations)
+        for key in keys[:1000]:
+            assert algorithm_imp.search(key) is not None
+            assert algorithm_imp.delete(key)
+        assert not algorithm_imp.delete(-1)
+        assert validate_red_black_tree(algorithm_imp) == 1000
+        assert sum(stats.rotations.values()) == len(rotations)
+
+        assert stats.operations == {'insert': 2000, 'search': 1000,
+                                    'delete': 1001}
+        for operation, count in stats.operations.items():
+            assert sum(stats.depths[operation].values()) == count
+            # A black height of a tree of n nodes is at most 2 log(n + 1)
+            assert max(stats.depths[operation]) <= 22
+        assert {case for _, case in stats.fixups} <= {
+            'red-uncle', 'black-uncle-outer', 'black-uncle-inner',
+            'red-child', 'red-sibling', 'black-nephews', 'red-nephew-outer',
+            'red-nephew-inner'}
+        summary = stats.summary()
+        assert summary['search']['comparisons'] == \
+               stats.comparisons['search'] > 1000
+        assert summary['insert']['recolors'] > 0
+
+        # Nothing is counted after the recorder is closed
+        algorithm_imp.close_step_recorder()
+        algorithm_imp.insert(-1, None)
+        assert stats.operations['insert'] == 2000
+        stats.reset()
+        assert not stats.operations and not stats.rotations
+
+    def test_stats_recorder_with_finger(self):
+        class _ClimbRecorder(StatsRecorder):
+            def reset(self):
+                super().reset()
+                self.climbs = 0
+
+            def climb_node(self, key):
+                self.climbs += 1
+
+        # The sequential keys are reached from the finger, not from the root
+        stats = _ClimbRecorder()
+        algorithm_imp = RedBlackTree(step_recorder=stats, finger=True)
+        algorithm_imp.open_step_recorder()
+        for key in range(1000):
+            algorithm_imp.insert(key, None)
+        for key in range(1000):
+            assert algorithm_imp.search(key).key == key
+        for key in range(0, 1000, 2):
+            assert algorithm_imp.delete(key)
+        assert not algorithm_imp.delete(-1)
+        assert validate_red_black_tree(algorithm_imp) == 500
+
+        summary = stats.summary()
+        assert summary['insert']['max_depth'] == 1
+        assert summary['insert']['comparisons'] == 2 * 1000 - 2
+        assert summary['search']['mean_depth'] < 3
+        assert summary['delete']['mean_depth'] < 4
+        assert stats.climbs > 0
+        # The finger stays on the last node visited by the missed deletion,
+        # like the plain one
+        assert algorithm_imp.ND_FINGER.key == 1
+
+        # No node is compared with the hash index
+        stats = StatsRecorder()
+        algorithm_imp = RedBlackTree(step_recorder=stats, hash_index=True)
+        algorithm_imp.open_step_recorder()
+        for key in range(100):
+            algorithm_imp.insert(key, None)
+        assert algorithm_imp.search(50).key == 50
+        assert algorithm_imp.search(500) is None
+        assert algorithm_imp.delete(50)
+        assert stats.depths['search'] == {0: 2}
+        assert stats.depths['delete'] == {0: 1}
+        assert stats.comparisons['search'] == stats.comparisons['delete'] == 0
+
+    def test_traced_methods_match_plain_ones(self):
+        for kwargs in [{}, {'allow_dup_keys': False}, {'finger': True},
+                       {'hash_index': True}, {'multiset': True},
+                       {'order_statistic': True, 'finger': True,
+                        'hash_index': True}]:
+            random = Random(0)
+            plain = RedBlackTree(**kwargs)
+            traced = RedBlackTree(step_recorder=StatsRecorder(), **kwargs)
+            traced.open_step_recorder()
+
+            for _ in range(3000):
+                key = random.randint(0, 300)
+                operation = random.choice(['insert', 'search', 'delete'])
+                args = (key, key) if operation == 'insert' else (key, )
+                results = []
+                for tree in (plain, traced):
+                    try:
+                        node = getattr(tree, operation)(*args)
+                    except RBTreeException:
+                        node = 'duplicated'
+                    results.append(getattr(node, 'key', node))
+                assert results[0] == results[1]
+
+                if kwargs.get('finger'):
+                    assert getattr(plain.ND_FINGER, 'key', None) == \
+                           getattr(traced.ND_FINGER, 'key', None)
+
+            # Even the shapes are the same
+            assert validate_red_black_tree(traced) == len(plain)
+            assert [(node.key, node.count, node.color)
+                    for node in traced.pre_order_traversal()] == \
+                   [(node.key, node.count, node.color)
+                    for node in plain.pre_order_traversal()]
+            if traced.hash_index is not None:
+                assert all(traced.hash_index[node.key].key == node.key
+                           for node in traced)
+                assert len(traced.hash_index) == len(plain.hash_index)
+            assert traced.step_recorder.operations['insert'] > 0
 
     def test_pre_order_traversal(self):
-        ...
+        algorithm_imp = RedBlackTree()
+        assert list(algorithm_imp.pre_order_traversal()) == []
+
+        for key in fake_tree.INSERTION_KEYS:
+            algorithm_imp.insert(key, None)
+
+        assert [node.key for node in algorithm_imp.pre_order_traversal()] \
+               == fake_tree.PRE_ORDER_KEYS
 
     def test_in_order_traversal(self):
-        ...
+        algorithm_imp = RedBlackTree()
+        assert list(algorithm_imp.in_order_traversal()) == []
+
+        for key in fake_tree.INSERTION_KEYS:
+            algorithm_imp.insert(key, None)
+
+        keys = sorted(fake_tree.INSERTION_KEYS)
+        assert [node.key for node in algorithm_imp.in_order_traversal()] \
+               == [node.key for node in algorithm_imp] == keys
+        assert [node.key for node in reversed(algorithm_imp)] == keys[::-1]
 
     def test_post_order_traversal(self):
-        ...
+        algorithm_imp = RedBlackTree()
+        assert list(algorithm_imp.post_order_traversal()) == []
+
+        for key in fake_tree.INSERTION_KEYS:
+            algorithm_imp.insert(key, None)
+
+        assert [node.key for node in algorithm_imp.post_order_traversal()] \
+               == fake_tree.POST_ORDER_KEYS
+
+    def test_range(self):
+        algorithm_imp = RedBlackTree()
+        assert algorithm_imp.min() is algorithm_imp.max() is None
+
+        for key in fake_tree.INSERTION_KEYS:
+            algorithm_imp.insert(key, None)
+
+        def _keys(nodes):
+            return [node.key for node in nodes]
+
+        assert algorithm_imp.min().key == 65
+        assert algorithm_imp.max().key == 2500
+        assert _keys(algorithm_imp.range(350, 750)) == [350, 380, 390, 400,
+                                                        500]
+        assert _keys(algorithm_imp.range(351, 751, reverse=True)) == \
+               [750, 500, 400, 390, 380]
+        assert _keys(algorithm_imp.range(hi=125)) == [65, 95]
+        assert _keys(algorithm_imp.range(lo=2000)) == [2000, 2500]
+        assert _keys(algorithm_imp.range(3000)) == []
+
+        assert algorithm_imp.floor(400).key == 400
+        assert algorithm_imp.floor(399).key == 390
+        assert algorithm_imp.floor(64) is None
+        assert algorithm_imp.ceiling(401).key == 500
+        assert algorithm_imp.ceiling(2501) is None
@@ -0,0 +1,90 @@
+from .algorithm import validate_red_black_tree
+from imgrass_horizon.lib.algorithms.ttl_cache import TTLCache
+from logging import getLogger
+from random import Random
+
+
+LOG = getLogger(__name__)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(object):
+
+    def test_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(default_ttl=10, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=5)
+        cache.set('c', 3, ttl=20)
+
+        clock.now = 5
+        assert 'b' not in cache
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert (cache.hits, cache.misses, cache.expirations) == (1, 1, 1)
+
+        # Setting a key again moves its deadline
+        cache.set('a', 4)
+        clock.now = 12
+        assert cache.expire_due() == 0
+        assert len(cache) == 2
+        clock.now = 15
+        assert len(cache) == 1 and cache.expirations == 2
+        clock.now = 20
+        assert cache.expire_due() == 1
+        assert len(cache) == 0 and cache.bytes == 0
+        assert cache.expirations == 3
+
+    def test_evict(self):
+        cache = TTLCache(max_entries=3)
+        for key in 'abc':
+            cache.set(key, key)
+        assert cache.get('a') == 'a'
+        cache.set('d', 'd')
+        # The least recently used one is evicted
+        assert 'b' not in cache and 'a' in cache
+        assert cache.evictions == 1
+
+        cache = TTLCache(max_bytes=100, sizeof=len)
+        cache.set('a', 'x' * 60)
+        cache.set('b', 'x' * 30)
+        cache.set('c', 'x' * 30)
+        assert 'a' not in cache and cache.bytes == 60
+        assert cache.delete('b') and not cache.delete('b')
+        assert cache.bytes == 30
+
+    def test_random_operations(self):
+        random = Random(0)
+        clock = FakeClock()
+        cache = TTLCache(max_entries=50, clock=clock)
+        expected = {}
+        for _ in range(5000):
+            clock.now += random.random()
+            key = random.randint(0, 100)
+            if random.random() < 0.5:
+                ttl = random.choice([None, 1, 5, 20])
+                cache.set(key, key, ttl)
+                expected[key] = None if ttl is None else clock.now + ttl
+            elif random.random() < 0.2:
+                cache.expire_due()
+            else:
+                cache.get(key)
+
+            # The deadlines in the tree are the ones of the live entries
+            for key in [key for key, deadline in expected.items()
+                        if key not in cache._entries]:
+                del expected[key]
+            assert len(cache._deadlines) == sum(
+                deadline is not None for deadline in expected.values())
+            assert len(cache) <= 50
+
+        validate_red_black_tree(cache._deadlines)
+        assert cache.hits + cache.misses > 0
@@ -1,16 +1,25 @@
 import __data__.fake_tree as fake_tree
 from imgrass_horizon.lib.tree import (
-    ContainerNode, EigenValue, ScalarNode, TreeException, TreeMigration
+    ContainerNode, EigenValue, FileTreeScanner, MerkleEigenValue,
+    MigrateScheme, ScalarNode, TreeException, TreeMigration
 )
+from functools import wraps
+from hashlib import sha256
 from logging import getLogger
+from os import makedirs, path as os_path, utime
 from pytest import raises as pytest_raise
-from typing import List
+from random import Random, random
+from tempfile import TemporaryDirectory
+from threading import RLock
+from time import sleep
+from typing import List, Optional
 
 
 LOG = getLogger(__name__)
 
 
-def generate_tree(root_name: str, tree_desc: List) -> ContainerNode:
+def generate_tree(root_name: str, tree_desc: List,
+                  merkle: bool=False) -> ContainerNode:
 
     containers = {}
 
@@ -24,7 +33,8 @@ def generate_tree(root_name: str, tree_desc: List) -> ContainerNode:
                 'was found, please check the <container_name> definition.')
 
         containers[node_desc['container_name']] = ContainerNode(
-            node_desc['name'], EigenValue(node_desc['eigenvalue']))
+            node_desc['name'], MerkleEigenValue() if merkle else
+            EigenValue(node_desc['eigenvalue']))
 
     for node_desc in tree_desc:
         if 'container_name' in node_desc:
@@ -43,6 +53,132 @@ def generate_tree(root_name: str, tree_desc: List) -> ContainerNode:
     return root_node
 
 
+def generate_random_tree(random: Random, depth: int=0) -> dict:
+    # {name: eigenvalue of a scalar, or a dict of a container}
+    tree = {}
+    for index in range(random.randint(0, 5 if depth < 4 else 0)):
+        if random.random() < 0.3:
+            tree[f'd{index}'] = generate_random_tree(random, depth + 1)
+        else:
+            tree[f'f{index}'] = f'F{random.randint(0, 15)}'
+    return tree
+
+
+def mutate_random_tree(random: Random, tree: dict) -> dict:
+    mutated = {}
+    for name, child in tree.items():
+        dice = random.random()
+        if dice < 0.1:
+            continue
+        if dice < 0.2:
+            name = f'{name}-moved'
+        if dice > 0.95:
+            # Another kind of node takes the path
+            child = f'F{random.randint(0, 15)}' if isinstance(child, dict) \
+                else generate_random_tree(random, 3)
+        elif isinstance(child, dict):
+            child = mutate_random_tree(random, child) \
+                if random.random() < 0.5 else dict(child)
+        elif dice < 0.3:
+            child = f'F{random.randint(0, 15)}'
+        mutated[name] = child
+    if random.random() < 0.2:
+        mutated['new'] = generate_random_tree(random, 3)
+    return mutated
+
+
+def build_tree(name: str, tree: dict,
+               parent: Optional[ContainerNode]=None,
+               random: Optional[Random]=None) -> ContainerNode:
+    # Some of the containers get the same eigenvalue given by the caller when
+    # the random is given
+    given = parent is not None and random is not None and \
+        random.random() < 0.3
+    container = ContainerNode(
+        name, EigenValue('D') if given else MerkleEigenValue(), parent=parent)
+    for child_name, child in tree.items():
+        if isinstance(child, dict):
+            build_tree(child_name, child, container, random)
+        else:
+            ScalarNode(child_name, EigenValue(child), parent=container)
+    return container
+
+
+def locked(method):
+    # Shuffle the steps run by the threads, then apply each one atomically
+    @wraps(method)
+    def _locked(self, *args):
+        sleep(random() / 5000)
+        with self.lock:
+            return method(self, *args)
+    return _locked
+
+
+class FileSystemScheme(MigrateScheme):
+    # Apply the steps to a dict of {path: (is_container, eigenvalue)}
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+        self.lock = RLock()
+
+    @staticmethod
+    def _path(node) -> tuple:
+        return tuple(n.unique_id for n in node.path[1:])
+
+    def load(self, root: ContainerNode):
+        stack = list(root._children.values())
+        while stack:
+            node = stack.pop()
+            self.files[self._path(node)] = (node.is_container, node.eigenvalue)
+            if node.is_container:
+                stack.extend(node._children.values())
+
+    def _subtree(self, path: tuple) -> dict:
+        assert path in self.files
+        return {p: v for p, v in self.files.items() if p[:len(path)] == path}
+
+    def _place(self, path: tuple, files: dict, source: tuple):
+        assert path[:-1] == () or self.files[path[:-1]][0]
+        assert path not in self.files or not self.files[path][0]
+        for p, v in files.items():
+            self.files[path + p[len(source):]] = v
+
+    @locked
+    def create_container_node(self, target):
+        self._place(self._path(target), {(): (True, target.eigenvalue)}, ())
+
+    @locked
+    def create_scalar_node(self, target):
+        self._place(self._path(target), {(): (False, target.eigenvalue)}, ())
+
+    @locked
+    def move_container_node(self, source, target):
+        files = self._subtree(self._path(source))
+        self.remove_container_node(source)
+        self._place(self._path(target), files, self._path(source))
+
+    @locked
+    def copy_container_node(self, source, target):
+        files = self._subtree(self._path(source))
+        self._place(self._path(target), files, self._path(source))
+
+    @locked
+    def remove_container_node(self, source):
+        for path in self._subtree(self._path(source)):
+            del self.files[path]
+
+    move_scalar_node = move_container_node
+    copy_scalar_node = copy_container_node
+    remove_scalar_node = remove_container_node
+
+    def generate_container_eigenvalue(self):
+        ...
+
+    def generate_scalar_eigenvalue(self):
+        ...
+
+
 class TestTree(object):
 
     def test_display_with_tree_mode(self):
@@ -77,6 +213,135 @@ class TestTree(object):
             nd_b.parent = nd_a
 
         assert exc_info.value.info.circular_nodes == ['b', 'a']
+        # The tree is not changed by the failed move
+        assert nd_b.is_root and nd_a.parent is nd_b
+
+        nd_c = ContainerNode('c', EigenValue('2'), parent=nd_a)
+        with pytest_raise(TreeException) as exc_info:
+            nd_b.parent = nd_c
+        assert exc_info.value.info.circular_nodes == ['b', 'c', 'a']
+        with pytest_raise(TreeException):
+            nd_c.parent = nd_c
+
+    def test_cached_position(self):
+        nd_root = ContainerNode('/', EigenValue('D0'))
+        nd_dir1 = ContainerNode('dir1', EigenValue('D1'), parent=nd_root)
+        nd_dir2 = ContainerNode('dir2', EigenValue('D2'), parent=nd_dir1)
+        nd_file = ScalarNode('file', EigenValue('F0'), parent=nd_dir2)
+        assert (nd_file.depth, nd_file.path_level) == (3, 4)
+        assert nd_file.root is nd_root and nd_root.depth == 0
+
+        # Moving a subtree refreshes the positions of the nodes in it
+        nd_other = ContainerNode('other', EigenValue('D3'))
+        nd_dir2.parent = nd_other
+        assert nd_file.depth == 2 and nd_file.root is nd_other
+        assert nd_dir1.depth == 1 and nd_dir1.root is nd_root
+        assert [n.unique_id for n in nd_file.path] == ['other', 'dir2', 'file']
+
+        # Moving a subtree keeps the caches out of it
+        assert nd_dir1.depth == 1 and nd_other.depth == 0
+        ScalarNode('moved', EigenValue('F1'), parent=nd_dir2).parent = \
+            nd_other
+        assert nd_dir1._depth == 1 and nd_file._depth == 2
+
+        nd_file.set_parent(nd_dir1, check_cycle=False)
+        assert nd_file.depth == 2 and nd_file.root is nd_root
+        nd_dir2.remove()
+        assert nd_dir2.is_root and nd_dir2.depth == 0
+        assert nd_file.depth == 2
+
+    def test_merkle_eigenvalue(self):
+        nd_root = ContainerNode('/', MerkleEigenValue())
+        nd_dir1 = ContainerNode('dir1', MerkleEigenValue(), parent=nd_root)
+        nd_dir2 = ContainerNode('dir2', MerkleEigenValue(), parent=nd_root)
+        nd_file1 = ScalarNode('file1', EigenValue('F1'), parent=nd_dir1)
+        ScalarNode('file1', EigenValue('F1'), parent=nd_dir2)
+        nd_empty = ContainerNode('empty', MerkleEigenValue(), parent=nd_dir2)
+
+        # The identical subtrees have the same eigenvalue
+        nd_empty.remove()
+        assert nd_dir1.eigenvalue == nd_dir2.eigenvalue
+        root_eigenvalue = nd_root.eigenvalue
+
+        # Only the containers above the changed scalar are dirty
+        nd_file1.eigenvalue = EigenValue('F2')
+        assert nd_dir1._eigenvalue._value is None
+        assert nd_root._eigenvalue._value is None
+        assert nd_dir2._eigenvalue._value is not None
+        assert nd_dir1.eigenvalue != nd_dir2.eigenvalue
+        assert nd_root.eigenvalue != root_eigenvalue
+
+        nd_file1.eigenvalue = EigenValue('F1')
+        assert nd_root.eigenvalue == root_eigenvalue
+        nd_empty.parent = nd_dir2
+        assert nd_root.eigenvalue != root_eigenvalue
+        # An empty container differs from a scalar of the same name
+        nd_empty.remove()
+        ScalarNode('empty', EigenValue(nd_empty.eigenvalue), parent=nd_dir2)
+        assert nd_root.eigenvalue != root_eigenvalue
+
+        # A given container hides the changes under it from the containers
+        # above, which are incomplete then
+        assert nd_root._eigenvalue.complete
+        nd_given = ContainerNode('given', EigenValue('D'), parent=nd_dir1)
+        nd_file3 = ScalarNode('file3', EigenValue('F3'), parent=nd_given)
+        root_eigenvalue = nd_root.eigenvalue
+        nd_file3.eigenvalue = EigenValue('F4')
+        assert nd_root.eigenvalue == root_eigenvalue
+        assert not nd_root._eigenvalue.complete
+        assert not nd_dir1._eigenvalue.complete
+        assert nd_dir2._eigenvalue.complete
+        nd_given.remove()
+        assert nd_root._eigenvalue.complete
+
+
+class TestFileTreeScanner(object):
+
+    @staticmethod
+    def _write(directory: str, name: str, data: bytes):
+        file_path = os_path.join(directory, name)
+        makedirs(os_path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as file:
+            file.write(data)
+        # Older than the scan, so the file could be cached
+        utime(file_path, (1, 1))
+
+    def test_scan(self):
+        with TemporaryDirectory() as directory:
+            for name in ('a/f1', 'a/f2', 'b/f1', 'b/f2'):
+                self._write(directory, name, name[-2:].encode() * 1000)
+            self._write(directory, 'c/d/large', b'x' * 100000)
+            makedirs(os_path.join(directory, 'c/empty'))
+
+            scanner = FileTreeScanner(max_threads=4, processes=0,
+                                      chunk_size=4096, mmap_threshold=65536)
+            root = scanner.scan(directory)
+            assert scanner.hashed == 5 and scanner.reused == 0
+            nd_a = root._children['a']
+            assert nd_a._children['f1'].eigenvalue == \
+                   sha256(b'f1' * 1000).hexdigest()
+            assert root._children['c']._children['d']._children[
+                'large'].eigenvalue == sha256(b'x' * 100000).hexdigest()
+            assert root._children['c']._children['empty'].is_container
+            assert nd_a.eigenvalue == root._children['b'].eigenvalue
+
+            # The empty file is not mapped even if it reaches the threshold
+            self._write(directory, 'c/empty-file', b'')
+            root = FileTreeScanner(processes=0, mmap_threshold=0).scan(
+                directory)
+            assert root._children['c']._children['empty-file'].eigenvalue == \
+                   sha256(b'').hexdigest()
+            assert root._children['c']._children['d']._children[
+                'large'].eigenvalue == sha256(b'x' * 100000).hexdigest()
+
+            # Only the changed file is hashed again
+            self._write(directory, 'b/f2', b'changed')
+            scanner.processes = 2
+            root = scanner.scan(directory)
+            assert scanner.hashed == 2 and scanner.reused == 4
+            assert nd_a.eigenvalue != root._children['b'].eigenvalue
+            assert root._children['b']._children['f2'].eigenvalue == \
+                   sha256(b'changed').hexdigest()
 
 
 class TestTreeMigration(object):
@@ -87,3 +352,99 @@ class TestTreeMigration(object):
 
         assert tree_from.output_tree_mode() == fake_tree.TREE_FROM_DISPLAY
         assert tree_to.output_tree_mode() == fake_tree.TREE_TO_DISPLAY
+
+        migration = TreeMigration(tree_from, tree_to, FileSystemScheme)
+        assert [repr(step) for step in migration.calculate()] == \
+               fake_tree.MIGRATE_STEPS
+        assert migration.scheme.steps == migration.calculate()
+
+        migration.scheme.load(tree_from)
+        migration.execute()
+        expected = FileSystemScheme()
+        expected.load(tree_to)
+        assert migration.scheme.files.keys() == expected.files.keys()
+
+        # The Merkle eigenvalues tell that node1 is the same as node6
+        migration = TreeMigration(
+            generate_tree('root', fake_tree.TREE_FROM, merkle=True),
+            generate_tree('root', fake_tree.TREE_TO, merkle=True),
+            FileSystemScheme)
+        assert [repr(step) for step in migration.calculate()] == \
+               fake_tree.MERKLE_MIGRATE_STEPS
+
+    def test_given_container_eigenvalue(self):
+        # The same eigenvalue given to the changed containers does not keep
+        # the changed children
+        tree_from = ContainerNode('root', EigenValue('R'))
+        nd_dir = ContainerNode('dir', EigenValue('D'), parent=tree_from)
+        ScalarNode('file', EigenValue('F1'), parent=nd_dir)
+        tree_to = ContainerNode('root', EigenValue('R'))
+        nd_dir = ContainerNode('dir', EigenValue('D'), parent=tree_to)
+        ScalarNode('file', EigenValue('F2'), parent=nd_dir)
+
+        class LegacyScheme(FileSystemScheme):
+            # The callbacks of the old signatures read the current step
+            def create_scalar_node(self):
+                self.created.append(self.current_step.target)
+
+        migration = TreeMigration(tree_from, tree_to, LegacyScheme)
+        migration.scheme.created = []
+        assert [repr(step) for step in migration.calculate()] == \
+               ['<CREATE_SCALAR root/dir/file>']
+        migration.execute()
+        assert migration.scheme.created == [nd_dir._children['file']]
+        assert migration.scheme.current_step is None
+
+    def test_migrate_failed(self):
+
+        class FailedScheme(FileSystemScheme):
+
+            def create_container_node(self, target):
+                if target.unique_id == 'node4':
+                    raise OSError('No space left on device')
+                super().create_container_node(target)
+
+        tree_from = generate_tree('root', fake_tree.TREE_FROM, merkle=True)
+        tree_to = generate_tree('root', fake_tree.TREE_TO, merkle=True)
+        migration = TreeMigration(tree_from, tree_to, FailedScheme)
+        migration.scheme.load(tree_from)
+        with pytest_raise(TreeException) as exc_info:
+            migration.execute(max_workers=2)
+
+        # The steps placing the nodes into node4 are skipped, and the removal
+        # of node3 waits for the move out of it
+        info = exc_info.value.info
+        assert [repr(step) for step in info.failures] == \
+               ['<CREATE_CONTAINER root/node4>']
+        assert [repr(step) for step in info.skipped] == [
+            '<MOVE_SCALAR root/node3/f4 -> root/node4/f4>',
+            '<CREATE_SCALAR root/node4/f5>',
+            '<REMOVE_CONTAINER root/node3>'
+        ]
+        assert len(info.timings) == 3
+        assert ('node5', 'node6', 'f1') in migration.scheme.files
+
+    def test_migrate_random_tree(self):
+        random = Random(0)
+        for index in range(400):
+            # The latter half mixes the given container eigenvalues in
+            mixed = random if index >= 200 else None
+            tree = generate_random_tree(random)
+            tree_from = build_tree('root', tree, random=mixed)
+            tree_to = build_tree('root', mutate_random_tree(random, tree),
+                                 random=mixed)
+
+            migration = TreeMigration(tree_from, tree_to, FileSystemScheme)
+            migration.scheme.load(tree_from)
+            timings = migration.execute(max_workers=4)
+            assert timings.keys() == set(migration.calculate())
+            expected = FileSystemScheme()
+            expected.load(tree_to)
+
+            # The eigenvalues of the containers kept in place are not changed
+            # by the scheme
+            def _scalars(files):
+                return {path: value if not value[0] else True
+                        for path, value in files.items()}
+            assert _scalars(migration.scheme.files) == \
+                   _scalars(expected.files)